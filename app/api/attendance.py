@@ -1,23 +1,37 @@
-from flask import Blueprint, request, jsonify
+from contextlib import nullcontext
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from datetime import datetime
 from app.models.models import Employee, AttendanceRecord, Break, Alert, db
 from app.utils.helpers import (
     get_current_attendance_record, create_attendance_record,
     record_time_out, start_break, end_break, get_active_break,
-    create_alert, check_consecutive_anomalies
+    create_alert, record_anomalies_batched, batched_anomaly_scoring,
+    unit_of_work, run_after_commit
 )
 from app.utils.anomaly_detector import AnomalyDetector
+from app.utils.anomaly_pipeline import anomaly_pipeline
+from app.utils.rfid_cache import rfid_cache
+from app.utils.swipe_window import SwipeWindow
+from app.utils.attendance_state import attendance_state, DayState, NO_RECORD
+from app.utils.anomaly_counter import anomaly_counter
+from app.utils.swipe_journal import swipe_journal
+from app.utils.idempotency import idempotency_store
+from app.utils.model_store import model_store
+from app.utils.training_jobs import training_jobs
+from app.utils.online_baselines import online_baselines
+from app.utils.batch_scorer import batch_scorer
+from app.utils.ttl_cache import dashboard_cache
+from app.utils.alert_listing import AlertListing
 from config.config import Config
 
 attendance_bp = Blueprint('attendance', __name__)
-anomaly_detector = AnomalyDetector()
+anomaly_detector = AnomalyDetector(baselines=online_baselines, scorer=batch_scorer)
 
-# Keep track of recent swipes to detect multiple swipes
-recent_swipes = []
+# Keep track of recent swipes per employee to detect multiple swipes
+swipe_window = SwipeWindow()
 
 @attendance_bp.route('/swipe', methods=['POST'])
 def swipe_card():
-    global recent_swipes
     data = request.get_json()
     
     if not data or 'rfid_tag' not in data:
@@ -27,100 +41,309 @@ def swipe_card():
     current_time = datetime.now()
     
     # Find the employee by RFID tag
-    employee = Employee.query.filter_by(rfid_tag=rfid_tag).first()
+    employee = rfid_cache.get(rfid_tag)
     if not employee:
         return jsonify({'error': 'Employee not found'}), 404
     
-    # Check for multiple swipes
-    recent_swipes.append({
-        'employee_id': employee.id,
-        'timestamp': current_time
-    })
+    # Readers retry on timeout; a repeated key gets the original response
+    key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if key:
+        key = (rfid_tag, str(key))
+        entry, is_owner = idempotency_store.begin(key)
+        if not is_owner:
+            return _replayed_response(entry)
+    
+    try:
+        results = process_swipes([{
+            'rfid_tag': rfid_tag,
+            'timestamp': current_time.isoformat(),
+            'action': data.get('action')
+        }])
+    except Exception:
+        if key:
+            idempotency_store.abandon(key, entry)
+        raise
+    
+    if results is None:
+        result, status_code = _deferred_result(current_time), 202
+    else:
+        result, status_code = results[0]
+    
+    if key:
+        idempotency_store.complete(entry, (result, status_code))
+    return jsonify(result), status_code
+
+@attendance_bp.route('/swipe/batch', methods=['POST'])
+def swipe_card_batch():
+    data = request.get_json()
+    
+    # Accept either a bare array of events or {"events": [...]}
+    events = data.get('events') if isinstance(data, dict) else data
+    if not isinstance(events, list) or not events:
+        return jsonify({'error': 'A non-empty list of events is required'}), 400
+    
+    if len(events) > Config.SWIPE_BATCH_MAX_EVENTS:
+        return jsonify({'error': f'Batch exceeds {Config.SWIPE_BATCH_MAX_EVENTS} events'}), 413
+    
+    # Validate first so only well-formed swipes are journaled and applied
+    results = [None] * len(events)
+    valid_indexes = []
+    valid_events = []
+    owned = {}        # idempotency key -> (entry, index of the event that owns it)
+    repeats = {}      # index -> index of an earlier event in this batch with the same key
+    for index, event in enumerate(events):
+        swipe_event, error = _validate_batch_event(event)
+        if error:
+            results[index] = error
+            continue
+        
+        key = event.get('idempotency_key')
+        if key:
+            key = (swipe_event['rfid_tag'], str(key))
+            if key in owned:
+                repeats[index] = owned[key][1]
+                continue
+            entry, is_owner = idempotency_store.begin(key)
+            if not is_owner:
+                results[index] = _wait_for_original(entry)
+                continue
+            owned[key] = (entry, index)
+        
+        valid_indexes.append(index)
+        valid_events.append(swipe_event)
+    
+    status = 200
+    if valid_events:
+        try:
+            # All valid events in the batch are applied in a single transaction
+            applied = process_swipes(valid_events)
+        except Exception as e:
+            for key, (entry, _) in owned.items():
+                idempotency_store.abandon(key, entry)
+            return jsonify({'error': f'Batch rejected, no events were applied: {str(e)}'}), 500
+        
+        if applied is None:
+            status = 202
+            applied = [(_deferred_result(parse_swipe_timestamp(event['timestamp'])), 202)
+                       for event in valid_events]
+        for index, result in zip(valid_indexes, applied):
+            results[index] = result
+        for key, (entry, index) in owned.items():
+            idempotency_store.complete(entry, results[index])
+    
+    for index, original in repeats.items():
+        results[index] = results[original]
+    
+    response = []
+    errors = 0
+    for index, (result, status_code) in enumerate(results):
+        if status_code >= 400:
+            errors += 1
+        # Copy: stored idempotent responses are shared with later retries
+        result = dict(result, index=index, status_code=status_code)
+        response.append(result)
+    
+    return jsonify({
+        'processed': len(events),
+        'errors': errors,
+        'results': response
+    }), status
+
+def _wait_for_original(entry):
+    # Returns the (body, status) of the request that owns the key
+    response = idempotency_store.wait(entry)
+    if response is None:
+        return {'error': 'A swipe with this idempotency key is still being processed'}, 409
+    return response
+
+def _replayed_response(entry):
+    result, status_code = _wait_for_original(entry)
+    return jsonify(result), status_code, {'Idempotent-Replayed': 'true'}
+
+def _validate_batch_event(event):
+    if not isinstance(event, dict) or 'rfid_tag' not in event:
+        return None, ({'error': 'RFID tag is required'}, 400)
+    
+    try:
+        current_time = parse_swipe_timestamp(event.get('timestamp'))
+    except ValueError:
+        return None, ({'error': f"Invalid timestamp: {event.get('timestamp')}"}, 400)
+    
+    if not rfid_cache.get(event['rfid_tag']):
+        return None, ({'error': 'Employee not found'}, 404)
+    
+    return {
+        'rfid_tag': event['rfid_tag'],
+        'timestamp': current_time.isoformat(),
+        'action': event.get('action')
+    }, None
+
+def parse_swipe_timestamp(value):
+    # Readers send ISO 8601 strings or epoch seconds; missing means "now"
+    if value is None:
+        return datetime.now()
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        # Stored times are naive local times
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+def process_swipes(events):
+    """Apply validated swipe events in order, in one transaction.
+    
+    With the swipe journal enabled the events are made durable in the
+    journal first. Returns a list of (response body, status code) pairs, or
+    None when the database couldn't take the writes and the journaled
+    swipes will be applied later. Journaled swipes that were deferred while
+    others went through get a 202 "recorded" result of their own.
+    """
+    if not swipe_journal.enabled:
+        # A single swipe is left to the batch scorer, which batches
+        # check-outs across concurrent requests
+        scoring = batched_anomaly_scoring() if len(events) > 1 else nullcontext()
+        with unit_of_work(), scoring:
+            return [apply_swipe_event(event) for event in events]
     
-    # Keep only recent swipes
-    recent_swipes = [s for s in recent_swipes 
-                    if (current_time - s['timestamp']).total_seconds() / 60 <= Config.TIME_WINDOW_FOR_MULTIPLE_SWIPES]
+    seqs = swipe_journal.record(events)
+    applied = swipe_journal.apply(seqs)
+    if applied is None:
+        return None
     
-    # Check for multiple swipes anomaly
+    results = []
+    for seq, event in zip(seqs, events):
+        # None means the entry wasn't applied yet; the retry thread will
+        result = applied.get(seq) or (_deferred_result(parse_swipe_timestamp(event['timestamp'])), 202)
+        results.append(result)
+    return results
+
+def apply_swipe_event(event):
+    """Apply one swipe event (as stored in the journal) inside a unit of work"""
+    employee = rfid_cache.get(event['rfid_tag'])
+    if not employee:
+        return {'error': 'Employee not found'}, 404
+    
+    return apply_swipe(employee, parse_swipe_timestamp(event['timestamp']), event.get('action'), event.get('seq'))
+
+def _deferred_result(current_time):
+    return {
+        'message': 'Swipe recorded and will be applied shortly',
+        'time': current_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'status': 'recorded'
+    }
+
+def apply_swipe(employee, current_time, action=None, swipe_id=None):
+    """Apply one swipe to the check-in/break/check-out state machine.
+    
+    Returns a (response body, status code) pair. Changes are only staged;
+    call this inside unit_of_work() so the swipe is committed once.
+    swipe_id is the journal sequence number of a journaled swipe.
+    """
+    # Check for multiple swipes
+    swipe_window.record(employee.id, current_time, swipe_id)
     multiple_swipes_alert = anomaly_detector.detect_multiple_swipes(
-        employee.id, current_time, recent_swipes
+        employee.id, current_time, swipe_window
     )
     
     if multiple_swipes_alert:
         create_alert(employee.id, multiple_swipes_alert)
     
-    # Get or create today's attendance record
+    # Look up the employee's state for the swipe's day
     current_date = current_time.date()
-    record = get_current_attendance_record(employee.id, current_date)
+    state = attendance_state.get(employee.id, current_date)
+    if state is None:
+        state = load_day_state(employee.id, current_date)
     
     # New actions based on current state
-    if not record:
+    if state.record_id is None:
         # First check-in of the day
         record = create_attendance_record(employee.id, current_time)
-        return jsonify({
+        db.session.flush()  # assigns record.id for the state cache
+        attendance_state.stage(employee.id, current_date, DayState(record.id, None, None, None))
+        return {
             'message': f'Check-in recorded for {employee.name}',
             'time': current_time.strftime('%Y-%m-%d %H:%M:%S'),
             'status': 'checked_in'
-        }), 201
+        }, 201
     
-    if not record.time_out:
+    if not state.time_out:
         # Employee already checked in
-        active_break = get_active_break(record)
-        
-        if active_break:
+        if state.open_break_id:
             # End an active break
-            end_break(active_break, current_time)
-            return jsonify({
+            duration = end_break(state.open_break_id, state.record_id, state.open_break_start, current_time)
+            if duration is None:
+                return _stale_state_response(employee)
+            attendance_state.stage(employee.id, current_date, DayState(state.record_id, None, None, None))
+            return {
                 'message': f'Break ended for {employee.name}',
                 'time': current_time.strftime('%Y-%m-%d %H:%M:%S'),
                 'status': 'break_ended',
-                'break_duration': f'{active_break.duration:.2f} minutes'
-            }), 200
+                'break_duration': f'{duration:.2f} minutes'
+            }, 200
         else:
             # Either checking out or starting a break
-            if data.get('action') == 'break':
+            if action == 'break':
                 # Start a break
-                break_record = start_break(record, current_time)
-                return jsonify({
+                break_record = start_break(state.record_id, current_time)
+                db.session.flush()  # assigns break_record.id for the state cache
+                attendance_state.stage(employee.id, current_date,
+                                       DayState(state.record_id, None, break_record.id, current_time))
+                return {
                     'message': f'Break started for {employee.name}',
                     'time': current_time.strftime('%Y-%m-%d %H:%M:%S'),
                     'status': 'break_started'
-                }), 200
+                }, 200
             else:
                 # Check out
+                record = db.session.get(AttendanceRecord, state.record_id)
+                if record is None:
+                    return _stale_state_response(employee)
                 record_time_out(record, current_time)
+                attendance_state.stage(employee.id, current_date, DayState(record.id, current_time, None, None))
                 
-                # Detect anomalies and create alerts
-                anomalies = anomaly_detector.detect_anomalies(record)
-                if anomalies:
-                    record.is_anomaly = True
-                    db.session.commit()
-                    
-                    for anomaly in anomalies:
-                        create_alert(employee.id, anomaly)
-                    
-                    # Check for consecutive anomalies
-                    if check_consecutive_anomalies(employee.id):
-                        consecutive_alert = {
-                            'type': Config.ALERT_TYPES['CONSECUTIVE_ANOMALIES'],
-                            'severity': Config.SEVERITY_LEVELS['CRITICAL'],
-                            'description': f'Employee has shown {Config.CONSECUTIVE_ANOMALIES_THRESHOLD} or more anomalies in the past week.'
-                        }
-                        create_alert(employee.id, consecutive_alert)
+                # Detect anomalies and create alerts. With the background
+                # pipeline running this happens after the time-out is committed.
+                if anomaly_pipeline.running:
+                    record_id = record.id
+                    run_after_commit(lambda: anomaly_pipeline.submit(record_id))
+                else:
+                    record_anomalies_batched(anomaly_detector, record)
                 
-                return jsonify({
+                return {
                     'message': f'Check-out recorded for {employee.name}',
                     'time': current_time.strftime('%Y-%m-%d %H:%M:%S'),
                     'status': 'checked_out',
                     'total_hours': f'{record.total_hours:.2f} hours'
-                }), 200
+                }, 200
     else:
         # Employee already checked out
-        return jsonify({
+        return {
             'message': f'{employee.name} already checked out today',
-            'time': record.time_out.strftime('%Y-%m-%d %H:%M:%S'),
+            'time': state.time_out.strftime('%Y-%m-%d %H:%M:%S'),
             'status': 'already_checked_out'
-        }), 400
+        }, 400
+
+def load_day_state(employee_id, current_date):
+    # Cache miss: read the day's state from the database and cache it
+    record = get_current_attendance_record(employee_id, current_date)
+    if not record:
+        state = NO_RECORD
+    else:
+        active_break = None if record.time_out else get_active_break(record)
+        state = DayState(
+            record.id, record.time_out,
+            active_break.id if active_break else None,
+            active_break.start_time if active_break else None
+        )
+    attendance_state.stage(employee_id, current_date, state)
+    return state
+
+def _stale_state_response(employee):
+    # The cached record or break was removed by another process
+    attendance_state.invalidate(employee.id)
+    return {'error': f'Attendance state for {employee.name} changed, please swipe again'}, 409
 
 @attendance_bp.route('/attendance/<employee_id>', methods=['GET'])
 def get_employee_attendance(employee_id):
@@ -161,27 +384,98 @@ def get_alerts():
     employee_id = request.args.get('employee_id')
     severity = request.args.get('severity')
     
-    query = Alert.query
+    conditions = []
     
     if employee_id:
         employee = Employee.query.filter_by(employee_id=employee_id).first()
         if employee:
-            query = query.filter_by(employee_id=employee.id)
+            conditions.append(Alert.employee_id == employee.id)
     
     if severity:
-        query = query.filter_by(severity=severity)
+        conditions.append(Alert.severity == severity)
     
-    alerts = query.order_by(Alert.timestamp.desc()).all()
+    return alert_listing_response(conditions, ALERT_SERIALIZE_FIELDS)
+
+# Fields of Alert.serialize(), the default for /alerts
+ALERT_SERIALIZE_FIELDS = ['id', 'employee_id', 'timestamp', 'alert_type', 'severity', 'description', 'is_resolved']
+
+def alert_listing_response(conditions, default_fields):
+    """One page of alerts, or a streamed export with ?export=ndjson|json.
     
+    Shared by the attendance and dashboard alert listings.
+    """
+    try:
+        listing = AlertListing.from_args(request.args, conditions, default_fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    export = request.args.get('export')
+    if export == 'ndjson':
+        return Response(stream_with_context(listing.stream_ndjson()), mimetype='application/x-ndjson')
+    if export == 'json':
+        return Response(stream_with_context(listing.stream_json()), mimetype='application/json')
+    if export:
+        return jsonify({'error': 'export must be ndjson or json'}), 400
+    
+    alerts, next_cursor = listing.page()
     return jsonify({
-        'alerts': [alert.serialize() for alert in alerts]
+        'alerts': alerts,
+        'next_cursor': next_cursor
     }), 200
 
 @attendance_bp.route('/train-model', methods=['POST'])
 def train_anomaly_model():
-    records = AttendanceRecord.query.all()
+    # Training runs in the background; poll the status endpoint for the result
+    job, created = training_jobs.submit()
     
-    if anomaly_detector.train_model(records):
-        return jsonify({'message': 'Anomaly detection model trained successfully'}), 200
-    else:
-        return jsonify({'error': 'Not enough data to train the model'}), 400 
\ No newline at end of file
+    result = job.serialize()
+    result['message'] = 'Training started' if created else 'Training already in progress'
+    result['status_url'] = f'/api/attendance/train-model/{job.id}'
+    return jsonify(result), 202
+
+@attendance_bp.route('/train-model/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    job = training_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Training job not found'}), 404
+    
+    return jsonify(job.serialize()), 200
+
+@attendance_bp.route('/baselines/rebuild', methods=['POST'])
+def rebuild_baselines():
+    # One pass over history, e.g. after importing records or changing the EWMA settings
+    records = online_baselines.rebuild()
+    online_baselines.flush()
+    return jsonify({
+        'message': 'Online baselines rebuilt',
+        'records': records,
+        'employees': online_baselines.stats()['employees']
+    }), 200
+
+@attendance_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        'database': current_app.config.get('DATABASE_SETTINGS_REPORT'),
+        'rfid_cache': rfid_cache.stats(),
+        'attendance_state': attendance_state.stats(),
+        'anomaly_pipeline': anomaly_pipeline.stats(),
+        'swipe_journal': swipe_journal.stats(),
+        'idempotency': idempotency_store.stats(),
+        'anomaly_model': model_store.stats(),
+        'online_baselines': online_baselines.stats(),
+        'anomaly_counter': anomaly_counter.stats(),
+        'anomaly_rules': anomaly_detector.rules.stats(),
+        'batch_scorer': batch_scorer.stats(),
+        'dashboard_cache': dashboard_cache.stats(),
+        'swipe_window': {'tracked_swipes': len(swipe_window)}
+    }), 200
+
+@attendance_bp.route('/state/reload', methods=['POST'])
+def reload_attendance_state():
+    # For tools that change today's records directly in the database
+    employees = attendance_state.load()
+    anomaly_counter.backfill()
+    return jsonify({
+        'message': 'Attendance state reloaded',
+        'employees': employees
+    }), 200
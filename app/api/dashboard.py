@@ -1,226 +1,388 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, current_app
 from datetime import datetime, timedelta
-from app.models.models import Employee, AttendanceRecord, Break, Alert, db
-from sqlalchemy import func, desc
+from app.models.models import (
+    Employee, AttendanceRecord, Break, Alert, DailyEmployeeSummary, DailyDepartmentSummary, db
+)
+from app.utils.ttl_cache import dashboard_cache
+from app.utils.cursors import encode_cursor, decode_cursor
+from app.utils.rollups import ALERT_COLUMNS
+from app.api.attendance import alert_listing_response
+from sqlalchemy import and_, cast, func, desc, literal, null, or_, select, union_all
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Labels shown on the dashboard for each alert severity
+_SEVERITIES = {'Low': 'low', 'Medium': 'medium', 'High': 'high', 'Critical': 'critical'}
+
 @dashboard_bp.route('/stats', methods=['GET'])
 def get_dashboard_stats():
-    # Get current date
-    today = datetime.now().date()
-    
-    # Get total employees count
-    total_employees = Employee.query.count()
-    
-    # Get present today count (employees who have checked in today)
-    present_today = AttendanceRecord.query.filter_by(date=today).count()
-    
-    # Get employees currently on break
-    on_break_count = db.session.query(AttendanceRecord, Break).join(
-        Break, AttendanceRecord.id == Break.attendance_record_id
-    ).filter(
-        AttendanceRecord.date == today,
-        Break.end_time == None
-    ).count()
+    # Every open dashboard polls this; one computation serves them all
+    stats = dashboard_cache.get('stats', compute_dashboard_stats, ttl=current_app.config.get('DASHBOARD_STATS_TTL', 5))
+    return jsonify(stats), 200
+
+def compute_dashboard_stats():
+    """Dashboard counters in two queries: the counts, then the 7-day trend.
     
-    # Get alerts today count
-    alerts_today = Alert.query.filter(
-        func.date(Alert.timestamp) == today
-    ).count()
+    Attendance and alert counts come from the daily summary tables; only
+    open breaks are read from the live tables.
+    """
+    today = datetime.now().date()
+    summary = DailyDepartmentSummary
+    alerts_total = None
+    for column in ALERT_COLUMNS.values():
+        column = getattr(summary, column)
+        alerts_total = column if alerts_total is None else alerts_total + column
+    
+    severity_counts = [
+        select(func.coalesce(func.sum(getattr(summary, ALERT_COLUMNS[severity])), 0)).scalar_subquery()
+        for severity in _SEVERITIES.values()
+    ]
+    counts = db.session.execute(select(
+        # Total employees
+        select(func.count()).select_from(Employee).scalar_subquery(),
+        # Employees who have checked in today
+        select(func.coalesce(func.sum(summary.employees_present), 0)).where(summary.date == today).scalar_subquery(),
+        # Open breaks today
+        select(func.count()).select_from(AttendanceRecord).join(
+            Break, AttendanceRecord.id == Break.attendance_record_id
+        ).where(
+            AttendanceRecord.date == today,
+            Break.end_time.is_(None)
+        ).scalar_subquery(),
+        # Alerts raised today
+        select(func.coalesce(func.sum(alerts_total), 0)).where(
+            summary.date == today
+        ).scalar_subquery(),
+        *severity_counts
+    )).one()
     
-    # Get attendance trend for the past 7 days
-    attendance_trend = get_attendance_trend(7)
+    return {
+        'total_employees': counts[0],
+        'present_today': counts[1],
+        'on_break': counts[2],
+        'alerts_today': counts[3],
+        'attendance_trend': get_attendance_trend(7),
+        'alert_types': dict(zip(_SEVERITIES, counts[4:]))
+    }
+
+@dashboard_bp.route('/summary', methods=['GET'])
+def get_summary():
+    """Attendance and alert totals between start and end (inclusive,
+    YYYY-MM-DD) per department, or per employee with by=employee"""
+    from flask import request
     
-    # Get alert types distribution
-    alert_types = get_alert_types_distribution()
+    by = request.args.get('by', 'department')
+    try:
+        end_date = _parse_date(request.args.get('end')) or datetime.now().date()
+        start_date = _parse_date(request.args.get('start')) or end_date - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates in YYYY-MM-DD format'}), 400
+    
+    if by not in ('department', 'employee'):
+        return jsonify({'error': 'by must be department or employee'}), 400
+    if start_date > end_date:
+        return jsonify({'error': 'start must not be after end'}), 400
+    
+    if by == 'department':
+        summary = DailyDepartmentSummary
+        groups = [summary.department]
+        totals = [summary.employees_present, summary.late_count, summary.early_count, summary.anomalous_count]
+    else:
+        summary = DailyEmployeeSummary
+        groups = [Employee.employee_id, Employee.name, summary.department]
+        totals = [summary.present, summary.late, summary.early, summary.anomalous]
+    totals += [summary.hours_worked, summary.break_minutes]
+    totals += [getattr(summary, column) for column in ALERT_COLUMNS.values()]
+    
+    stmt = select(*groups, *(func.sum(total) for total in totals)).where(
+        summary.date >= start_date,
+        summary.date <= end_date
+    ).group_by(*groups).order_by(*groups)
+    if by == 'employee':
+        stmt = stmt.join(Employee, Employee.id == summary.employee_id)
+    
+    rows = []
+    for row in db.session.execute(stmt):
+        group, values = row[:len(groups)], row[len(groups):]
+        if by == 'department':
+            entry = {'department': group[0]}
+        else:
+            entry = {'employee_id': group[0], 'name': group[1], 'department': group[2]}
+        entry.update({
+            'days_present': values[0],
+            'late': values[1],
+            'early': values[2],
+            'anomalous': values[3],
+            'hours_worked': round(values[4], 2),
+            'break_minutes': round(values[5], 2),
+            'alerts': dict(zip(ALERT_COLUMNS, values[6:]))
+        })
+        rows.append(entry)
     
     return jsonify({
-        'total_employees': total_employees,
-        'present_today': present_today,
-        'on_break': on_break_count,
-        'alerts_today': alerts_today,
-        'attendance_trend': attendance_trend,
-        'alert_types': alert_types
+        'start': start_date.strftime('%Y-%m-%d'),
+        'end': end_date.strftime('%Y-%m-%d'),
+        'by': by,
+        'rows': rows
     }), 200
 
 @dashboard_bp.route('/activities', methods=['GET'])
 def get_recent_activities():
-    # Get recent check-ins, check-outs, breaks, and alerts with more detail
+    """Check-ins, check-outs, breaks and alerts, newest first.
+
+    Pass next_cursor back as cursor to load older events, or latest_cursor
+    as since to poll for events newer than the last response. A since poll
+    returns the oldest limit events after the cursor, so has_more means the
+    next poll should follow right away. hours limits the first page only.
+    """
     from flask import request
     
-    # Get limit parameter (default to 10)
-    limit = request.args.get('limit', 10, type=int)
-    
-    # Get hours parameter (default to 24 - show last 24 hours)
+    limit = min(request.args.get('limit', 10, type=int), current_app.config.get('ACTIVITY_FEED_MAX_LIMIT', 100))
     hours = request.args.get('hours', 24, type=int)
-    
-    # Calculate the time threshold
-    time_threshold = datetime.now() - timedelta(hours=hours)
-    today = datetime.now().date()
-    activities = []
-    
-    # Recent check-ins with more details
-    recent_checkins = AttendanceRecord.query.filter(
-        AttendanceRecord.time_in >= time_threshold
-    ).order_by(AttendanceRecord.time_in.desc()).limit(limit).all()
-    
-    for record in recent_checkins:
-        employee = Employee.query.get(record.employee_id)
-        if employee:
-            time_str = record.time_in.strftime('%Y-%m-%d %H:%M:%S')
-            activities.append({
-                'id': f"checkin_{record.id}",
-                'time': time_str,
-                'timestamp': record.time_in.timestamp(),
-                'type': 'check-in',
-                'employee_id': employee.employee_id,
-                'employee_name': employee.name,
-                'department': employee.department,
-                'description': f'{employee.name} checked in',
-                'details': {
-                    'time': record.time_in.strftime('%H:%M:%S'),
-                    'date': record.date.strftime('%Y-%m-%d')
-                }
-            })
-    
-    # Recent check-outs with more details
-    recent_checkouts = AttendanceRecord.query.filter(
-        AttendanceRecord.time_out >= time_threshold
-    ).order_by(AttendanceRecord.time_out.desc()).limit(limit).all()
-    
-    for record in recent_checkouts:
-        employee = Employee.query.get(record.employee_id)
-        if employee and record.time_out:
-            time_str = record.time_out.strftime('%Y-%m-%d %H:%M:%S')
-            hours_worked = record.total_hours if record.total_hours else 0
-            activities.append({
-                'id': f"checkout_{record.id}",
-                'time': time_str,
-                'timestamp': record.time_out.timestamp(),
-                'type': 'check-out',
-                'employee_id': employee.employee_id,
-                'employee_name': employee.name,
-                'department': employee.department,
-                'description': f'{employee.name} checked out',
-                'details': {
-                    'time': record.time_out.strftime('%H:%M:%S'),
-                    'date': record.date.strftime('%Y-%m-%d'),
-                    'hours_worked': f"{hours_worked:.2f} hours"
-                }
-            })
-    
-    # Recent breaks
-    recent_breaks = Break.query.join(
-        AttendanceRecord, Break.attendance_record_id == AttendanceRecord.id
-    ).filter(
-        Break.start_time >= time_threshold
-    ).order_by(Break.start_time.desc()).limit(limit).all()
-    
-    for break_record in recent_breaks:
-        attendance = AttendanceRecord.query.get(break_record.attendance_record_id)
-        employee = Employee.query.get(attendance.employee_id) if attendance else None
-        
-        if employee and break_record.start_time:
-            time_str = break_record.start_time.strftime('%Y-%m-%d %H:%M:%S')
-            
-            # Break status
-            if break_record.end_time:
-                status = "ended"
-                duration = break_record.duration or 0
-                detail = f"Duration: {duration:.0f} minutes"
-            else:
-                status = "started"
-                detail = "Currently on break"
-                
-            activities.append({
-                'id': f"break_{break_record.id}",
-                'time': time_str,
-                'timestamp': break_record.start_time.timestamp(),
-                'type': 'break',
-                'employee_id': employee.employee_id,
-                'employee_name': employee.name,
-                'department': employee.department,
-                'description': f'{employee.name} {status} break',
-                'details': {
-                    'time': break_record.start_time.strftime('%H:%M:%S'),
-                    'date': attendance.date.strftime('%Y-%m-%d'),
-                    'status': status,
-                    'detail': detail
-                }
-            })
-    
-    # Recent alerts with more details
-    recent_alerts = Alert.query.filter(
-        Alert.timestamp >= time_threshold
-    ).order_by(Alert.timestamp.desc()).limit(limit).all()
-    
-    for alert in recent_alerts:
-        employee = Employee.query.get(alert.employee_id)
-        if employee:
-            time_str = alert.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-            activities.append({
-                'id': f"alert_{alert.id}",
-                'time': time_str,
-                'timestamp': alert.timestamp.timestamp(),
-                'type': 'alert',
-                'employee_id': employee.employee_id,
-                'employee_name': employee.name,
-                'department': employee.department,
-                'description': f'Alert: {alert.alert_type} for {employee.name}',
-                'details': {
-                    'time': alert.timestamp.strftime('%H:%M:%S'),
-                    'date': alert.timestamp.strftime('%Y-%m-%d'),
-                    'severity': alert.severity,
-                    'alert_type': alert.alert_type,
-                    'description': alert.description,
-                    'resolved': 'Yes' if alert.is_resolved else 'No'
-                }
-            })
-    
-    # Sort activities by time, most recent first
-    activities.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    # Limit to requested number
-    activities = activities[:limit]
+    try:
+        before = decode_cursor(request.args.get('cursor'), str, int)
+        after = decode_cursor(request.args.get('since'), str, int)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    # The time window only applies to the first page
+    start_time = None if before or after else datetime.now() - timedelta(hours=hours)
+    rows = db.session.execute(_activity_query(limit, start_time, before, after)).all()
+    has_more = len(rows) == limit
+    if after:
+        # Fetched oldest first from the cursor; shown newest first like any page
+        rows.reverse()
+    activities = [_serialize_activity(row) for row in rows]
     
     return jsonify({
         'activities': activities,
+        'next_cursor': encode_cursor(*rows[-1][:3]) if has_more and not after else None,
+        'latest_cursor': encode_cursor(*rows[0][:3]) if rows else request.args.get('since'),
+        'has_more': has_more,
         'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }), 200
 
-def get_attendance_trend(days):
-    end_date = datetime.now().date()
-    start_date = end_date - timedelta(days=days-1)
-    
-    dates = []
-    present_counts = []
-    
-    current_date = start_date
-    while current_date <= end_date:
-        dates.append(current_date.strftime('%Y-%m-%d'))
-        count = AttendanceRecord.query.filter_by(date=current_date).count()
-        present_counts.append(count)
-        current_date += timedelta(days=1)
-    
-    return {
-        'dates': dates,
-        'present': present_counts
+def _activity_query(limit, start_time=None, before=None, after=None):
+    """One UNION ALL over the four event sources, ordered by (ts, kind, id).
+
+    Each source is filtered and limited on its own timestamp first, so only
+    limit rows per source reach the union, and employees are joined in
+    rather than loaded per row. Newest first, except with an after cursor:
+    then the events right after it come first, so a burst larger than limit
+    is read in order instead of losing its oldest part.
+    """
+    none = lambda type_: cast(null(), type_)
+    sources = [
+        ('check-in', AttendanceRecord.time_in, AttendanceRecord.id, [
+            AttendanceRecord.date, none(db.Float), none(db.DateTime), none(db.Float),
+            none(db.String), none(db.String), none(db.Text), none(db.Boolean)
+        ], [(Employee, Employee.id == AttendanceRecord.employee_id)]),
+        ('check-out', AttendanceRecord.time_out, AttendanceRecord.id, [
+            AttendanceRecord.date, AttendanceRecord.total_hours, none(db.DateTime), none(db.Float),
+            none(db.String), none(db.String), none(db.Text), none(db.Boolean)
+        ], [(Employee, Employee.id == AttendanceRecord.employee_id)]),
+        ('break', Break.start_time, Break.id, [
+            AttendanceRecord.date, none(db.Float), Break.end_time, Break.duration,
+            none(db.String), none(db.String), none(db.Text), none(db.Boolean)
+        ], [(AttendanceRecord, AttendanceRecord.id == Break.attendance_record_id),
+            (Employee, Employee.id == AttendanceRecord.employee_id)]),
+        ('alert', Alert.timestamp, Alert.id, [
+            none(db.Date), none(db.Float), none(db.DateTime), none(db.Float),
+            Alert.severity, Alert.alert_type, Alert.description, Alert.is_resolved
+        ], [(Employee, Employee.id == Alert.employee_id)])
+    ]
+    
+    parts = []
+    for kind, ts, row_id, columns, joins in sources:
+        stmt = select(
+            ts.label('ts'), literal(kind).label('kind'), row_id.label('row_id'),
+            Employee.employee_id, Employee.name, Employee.department,
+            *(column.label(name) for column, name in zip(columns, _ACTIVITY_COLUMNS))
+        ).select_from(ts.class_)
+        for target, onclause in joins:
+            stmt = stmt.join(target, onclause)
+        stmt = stmt.where(ts.isnot(None))
+        if start_time is not None:
+            stmt = stmt.where(ts >= start_time)
+        if before is not None:
+            stmt = stmt.where(_keyset(ts, kind, row_id, before, older=True))
+        if after is not None:
+            stmt = stmt.where(_keyset(ts, kind, row_id, after, older=False))
+        order = (ts.asc(), row_id.asc()) if after is not None else (ts.desc(), row_id.desc())
+        parts.append(select(stmt.order_by(*order).limit(limit).subquery()))
+    
+    feed = union_all(*parts).subquery()
+    order = (feed.c.ts, feed.c.kind, feed.c.row_id)
+    if after is None:
+        order = tuple(column.desc() for column in order)
+    return select(feed).order_by(*order).limit(limit)
+
+def _keyset(ts, kind, row_id, cursor, older):
+    # (ts, kind, id) strictly before (older) or after the cursor. kind is
+    # fixed per source, so it's compared here rather than in SQL.
+    cursor_ts, cursor_kind, cursor_id = cursor
+    if kind == cursor_kind:
+        if older:
+            return or_(ts < cursor_ts, and_(ts == cursor_ts, row_id < cursor_id))
+        return or_(ts > cursor_ts, and_(ts == cursor_ts, row_id > cursor_id))
+    if (kind < cursor_kind) == older:
+        return ts <= cursor_ts if older else ts >= cursor_ts
+    return ts < cursor_ts if older else ts > cursor_ts
+
+def _serialize_activity(row):
+    ts = row.ts
+    activity = {
+        'id': f"{_ACTIVITY_IDS[row.kind]}_{row.row_id}",
+        'time': ts.strftime('%Y-%m-%d %H:%M:%S'),
+        'timestamp': ts.timestamp(),
+        'type': row.kind,
+        'employee_id': row.employee_id,
+        'employee_name': row.name,
+        'department': row.department
     }
+    
+    if row.kind == 'check-in':
+        activity['description'] = f'{row.name} checked in'
+        activity['details'] = {
+            'time': ts.strftime('%H:%M:%S'),
+            'date': row.date.strftime('%Y-%m-%d')
+        }
+    elif row.kind == 'check-out':
+        hours_worked = row.total_hours if row.total_hours else 0
+        activity['description'] = f'{row.name} checked out'
+        activity['details'] = {
+            'time': ts.strftime('%H:%M:%S'),
+            'date': row.date.strftime('%Y-%m-%d'),
+            'hours_worked': f"{hours_worked:.2f} hours"
+        }
+    elif row.kind == 'break':
+        if row.end_time:
+            status = "ended"
+            detail = f"Duration: {row.duration or 0:.0f} minutes"
+        else:
+            status = "started"
+            detail = "Currently on break"
+        activity['description'] = f'{row.name} {status} break'
+        activity['details'] = {
+            'time': ts.strftime('%H:%M:%S'),
+            'date': row.date.strftime('%Y-%m-%d'),
+            'status': status,
+            'detail': detail
+        }
+    else:
+        activity['description'] = f'Alert: {row.alert_type} for {row.name}'
+        activity['details'] = {
+            'time': ts.strftime('%H:%M:%S'),
+            'date': ts.strftime('%Y-%m-%d'),
+            'severity': row.severity,
+            'alert_type': row.alert_type,
+            'description': row.alert_description,
+            'resolved': 'Yes' if row.is_resolved else 'No'
+        }
+    return activity
+
+# Source-specific columns of the activity feed, NULL where a source has none
+_ACTIVITY_COLUMNS = ['date', 'total_hours', 'end_time', 'duration',
+                     'severity', 'alert_type', 'alert_description', 'is_resolved']
+
+# Prefix of each activity's id, by type
+_ACTIVITY_IDS = {'check-in': 'checkin', 'check-out': 'checkout', 'break': 'break', 'alert': 'alert'}
 
-def get_alert_types_distribution():
-    # Count alerts for each severity level
-    low_count = Alert.query.filter_by(severity='low').count()
-    medium_count = Alert.query.filter_by(severity='medium').count()
-    high_count = Alert.query.filter_by(severity='high').count()
-    critical_count = Alert.query.filter_by(severity='critical').count()
+@dashboard_bp.route('/trend', methods=['GET'])
+def get_trend():
+    """Attendance counts between start and end (inclusive, YYYY-MM-DD) in
+    day, week or month buckets, optionally split by department"""
+    from flask import request
     
-    return {
-        'Low': low_count,
-        'Medium': medium_count,
-        'High': high_count,
-        'Critical': critical_count
+    bucket = request.args.get('bucket', 'day')
+    by = request.args.get('by')
+    try:
+        end_date = _parse_date(request.args.get('end')) or datetime.now().date()
+        start_date = _parse_date(request.args.get('start')) or end_date - timedelta(days=6)
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates in YYYY-MM-DD format'}), 400
+    
+    if bucket not in _BUCKETS:
+        return jsonify({'error': f"bucket must be one of: {', '.join(_BUCKETS)}"}), 400
+    if by not in (None, 'department'):
+        return jsonify({'error': 'by must be department'}), 400
+    if start_date > end_date:
+        return jsonify({'error': 'start must not be after end'}), 400
+    max_days = current_app.config.get('TREND_MAX_DAYS', 1096)
+    if (end_date - start_date).days >= max_days:
+        return jsonify({'error': f'Date range is limited to {max_days} days'}), 400
+    
+    trend = attendance_trend(start_date, end_date, bucket, by_department=by == 'department')
+    trend.update({
+        'start': start_date.strftime('%Y-%m-%d'),
+        'end': end_date.strftime('%Y-%m-%d'),
+        'bucket': bucket
+    })
+    return jsonify(trend), 200
+
+def get_attendance_trend(days):
+    end_date = datetime.now().date()
+    return attendance_trend(end_date - timedelta(days=days-1), end_date)
+
+def attendance_trend(start_date, end_date, bucket='day', by_department=False):
+    """Attendance records per bucket from start_date to end_date.
+
+    One grouped read of the daily department summaries whatever the range;
+    dates are folded into week or month buckets here and empty buckets are
+    zero. Weeks start on Monday and are labelled by that date, months as
+    YYYY-MM.
+    """
+    summary = DailyDepartmentSummary
+    columns = [summary.date]
+    if by_department:
+        columns.append(summary.department)
+    stmt = select(summary.date, func.sum(summary.employees_present), *columns[1:]).where(
+        summary.date >= start_date,
+        summary.date <= end_date
+    )
+    rows = db.session.execute(stmt.group_by(*columns)).all()
+    
+    bucket_of = _BUCKETS[bucket]
+    labels = []
+    date = bucket_of(start_date)
+    while date <= end_date:
+        labels.append(date)
+        date = _next_bucket(date, bucket)
+    index = {label: i for i, label in enumerate(labels)}
+    
+    present = [0] * len(labels)
+    departments = {}
+    for row in rows:
+        i = index[bucket_of(row[0])]
+        present[i] += row[1]
+        if by_department:
+            departments.setdefault(row[2], [0] * len(labels))[i] += row[1]
+    
+    label_format = '%Y-%m' if bucket == 'month' else '%Y-%m-%d'
+    trend = {
+        'dates': [label.strftime(label_format) for label in labels],
+        'present': present
     }
+    if by_department:
+        trend['departments'] = dict(sorted(departments.items()))
+    return trend
+
+# Maps a date to the first day of its bucket
+_BUCKETS = {
+    'day': lambda date: date,
+    'week': lambda date: date - timedelta(days=date.weekday()),
+    'month': lambda date: date.replace(day=1)
+}
+
+def _next_bucket(date, bucket):
+    if bucket == 'day':
+        return date + timedelta(days=1)
+    if bucket == 'week':
+        return date + timedelta(days=7)
+    return (date.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
 
 @dashboard_bp.route('/alerts', methods=['GET'])
 def get_alerts():
@@ -232,50 +394,33 @@ def get_alerts():
     severity = request.args.get('severity')
     time_filter = request.args.get('time_filter', 'all')
     
-    # Base query
-    query = Alert.query
+    conditions = []
     
     # Apply filters
     if employee_id:
-        query = query.filter_by(employee_id=employee_id)
+        conditions.append(Alert.employee_id == employee_id)
         
     if severity:
-        query = query.filter_by(severity=severity)
+        conditions.append(Alert.severity == severity)
     
     # Apply time filter
     if time_filter != 'all':
         now = datetime.now()
         if time_filter == 'today':
             start_date = datetime.combine(now.date(), datetime.min.time())
-            query = query.filter(Alert.timestamp >= start_date)
+            conditions.append(Alert.timestamp >= start_date)
         elif time_filter == 'week':
             start_date = now - timedelta(days=7)
-            query = query.filter(Alert.timestamp >= start_date)
+            conditions.append(Alert.timestamp >= start_date)
         elif time_filter == 'month':
             start_date = now - timedelta(days=30)
-            query = query.filter(Alert.timestamp >= start_date)
-    
-    # Execute query and get results
-    alerts = query.order_by(Alert.timestamp.desc()).all()
-    
-    # Format results
-    result = []
-    for alert in alerts:
-        employee = Employee.query.get(alert.employee_id)
-        result.append({
-            'id': alert.id,
-            'employee_id': alert.employee_id,
-            'employee_name': employee.name if employee else 'Unknown',
-            'timestamp': alert.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'alert_type': alert.alert_type,
-            'description': alert.description,
-            'severity': alert.severity,
-            'resolved': alert.is_resolved
-        })
+            conditions.append(Alert.timestamp >= start_date)
     
-    return jsonify({
-        'alerts': result
-    }), 200
+    # Employee names are joined in, not looked up per alert
+    return alert_listing_response(conditions, _DASHBOARD_ALERT_FIELDS)
+
+_DASHBOARD_ALERT_FIELDS = ['id', 'employee_id', 'employee_name', 'timestamp', 'alert_type',
+                           'description', 'severity', 'resolved']
 
 @dashboard_bp.route('/create-alert', methods=['POST'])
 def create_test_alert():
@@ -1,5 +1,8 @@
 from flask import Blueprint, request, jsonify
 from app.models.models import Employee, db
+from app.utils.rfid_cache import rfid_cache
+from app.utils.attendance_state import attendance_state
+from app.utils.anomaly_counter import anomaly_counter
 
 employees_bp = Blueprint('employees', __name__)
 
@@ -46,6 +49,7 @@ def add_employee():
     
     db.session.add(employee)
     db.session.commit()
+    rfid_cache.put(employee)
     
     return jsonify({
         'message': 'Employee added successfully',
@@ -66,12 +70,18 @@ def update_employee(employee_id):
             return jsonify({'error': 'RFID tag already exists'}), 400
     
     # Update fields
+    old_rfid_tag = employee.rfid_tag
     for field in ['rfid_tag', 'name', 'department', 'position']:
         if field in data:
             setattr(employee, field, data[field])
     
     db.session.commit()
     
+    # Keep the RFID cache in sync, including tag reassignment
+    if employee.rfid_tag != old_rfid_tag:
+        rfid_cache.discard(old_rfid_tag)
+    rfid_cache.put(employee)
+    
     return jsonify({
         'message': 'Employee updated successfully',
         'employee': employee.serialize()
@@ -83,8 +93,12 @@ def delete_employee(employee_id):
     if not employee:
         return jsonify({'error': 'Employee not found'}), 404
     
+    rfid_tag = employee.rfid_tag
     db.session.delete(employee)
     db.session.commit()
+    rfid_cache.discard(rfid_tag)
+    attendance_state.invalidate(employee.id)
+    anomaly_counter.discard(employee.id)
     
     return jsonify({
         'message': 'Employee deleted successfully'
@@ -0,0 +1,94 @@
+"""Versioned schema migrations.
+
+db.create_all() only creates missing tables; it never touches tables that
+already exist, so indexes and columns added to the models later would be
+skipped on existing databases. Each migration here brings an older database
+up to date. The applied version is kept in the schema_version table.
+
+Migrations must be idempotent: on a fresh database create_all() has already
+built the current schema and every migration still runs once.
+"""
+import logging
+from sqlalchemy import Column, Integer, MetaData, Table, func, inspect, select
+from app.models.models import (
+    AttendanceRecord, Break, Alert, DailyDepartmentSummary, DailyEmployeeSummary, db
+)
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_version = Table(
+    'schema_version', _metadata,
+    Column('version', Integer, nullable=False)
+)
+
+def _create_indexes(conn, model):
+    for index in model.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+def _add_hot_path_indexes(conn):
+    # The unique index would fail half way through on duplicate rows
+    duplicates = conn.execute(
+        select(func.count()).select_from(
+            select(AttendanceRecord.employee_id, AttendanceRecord.date)
+            .group_by(AttendanceRecord.employee_id, AttendanceRecord.date)
+            .having(func.count() > 1)
+            .subquery()
+        )
+    ).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f'Cannot add unique (employee_id, date) index: {duplicates} employee/day '
+            'pairs have more than one attendance record. Merge them and restart.'
+        )
+
+    for model in (AttendanceRecord, Break, Alert):
+        _create_indexes(conn, model)
+
+def _add_activity_feed_indexes(conn):
+    for model in (AttendanceRecord, Break):
+        _create_indexes(conn, model)
+
+def _build_rollups(conn):
+    # The tables only hold derived data: start them afresh from history
+    from app.utils.rollups import rebuild_rollups
+    for model in (DailyDepartmentSummary, DailyEmployeeSummary):
+        model.__table__.drop(conn, checkfirst=True)
+        model.__table__.create(conn)
+    rebuild_rollups(conn)
+
+# (version, description, function) in the order they must be applied
+MIGRATIONS = [
+    (1, 'Add indexes for attendance, break and alert query shapes', _add_hot_path_indexes),
+    (2, 'Add timestamp indexes for the activity feed', _add_activity_feed_indexes),
+    (3, 'Build the daily summary tables', _build_rollups),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def get_schema_version(conn):
+    if not inspect(conn).has_table('schema_version'):
+        return 0
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+def upgrade_schema(engine=None):
+    """Apply pending migrations; returns the versions that were applied"""
+    engine = engine or db.engine
+    applied = []
+
+    with engine.begin() as conn:
+        _metadata.create_all(conn)
+        current = get_schema_version(conn)
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info('Applying schema migration %s: %s', version, description)
+        # Each migration commits together with its version bump
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_version.delete())
+            conn.execute(schema_version.insert().values(version=version))
+        applied.append(version)
+
+    return applied
@@ -25,6 +25,15 @@ class Employee(db.Model):
         }
 
 class AttendanceRecord(db.Model):
+    __table_args__ = (
+        # One record per employee per day; also serves (employee_id, date) lookups
+        db.Index('uq_attendance_record_employee_date', 'employee_id', 'date', unique=True),
+        db.Index('ix_attendance_record_date', 'date'),
+        # Activity feed: newest check-ins and check-outs
+        db.Index('ix_attendance_record_time_in', 'time_in'),
+        db.Index('ix_attendance_record_time_out', 'time_out'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow().date)
@@ -47,6 +56,11 @@ class AttendanceRecord(db.Model):
         }
 
 class Break(db.Model):
+    __table_args__ = (
+        db.Index('ix_break_record_end_time', 'attendance_record_id', 'end_time'),
+        db.Index('ix_break_start_time', 'start_time'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     attendance_record_id = db.Column(db.Integer, db.ForeignKey('attendance_record.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
@@ -62,6 +76,12 @@ class Break(db.Model):
         }
 
 class Alert(db.Model):
+    __table_args__ = (
+        db.Index('ix_alert_timestamp', 'timestamp'),
+        db.Index('ix_alert_severity', 'severity'),
+        db.Index('ix_alert_employee_timestamp', 'employee_id', 'timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -79,4 +99,52 @@ class Alert(db.Model):
             'severity': self.severity,
             'description': self.description,
             'is_resolved': self.is_resolved
-        } 
\ No newline at end of file
+        }
+
+# Daily rollups, kept in step with attendance records, breaks and alerts by
+# app/utils/rollups.py in the same transaction
+
+class DailyEmployeeSummary(db.Model):
+    __table_args__ = (
+        db.Index('ix_daily_employee_summary_date', 'date'),
+    )
+    
+    employee_id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    department = db.Column(db.String(50), nullable=False)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    checked_out = db.Column(db.Integer, nullable=False, default=0)
+    hours_worked = db.Column(db.Float, nullable=False, default=0)
+    break_minutes = db.Column(db.Float, nullable=False, default=0)
+    break_count = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    early = db.Column(db.Integer, nullable=False, default=0)
+    anomalous = db.Column(db.Integer, nullable=False, default=0)
+    alerts_low = db.Column(db.Integer, nullable=False, default=0)
+    alerts_medium = db.Column(db.Integer, nullable=False, default=0)
+    alerts_high = db.Column(db.Integer, nullable=False, default=0)
+    alerts_critical = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyDepartmentSummary(db.Model):
+    __table_args__ = (
+        db.Index('ix_daily_department_summary_date', 'date'),
+    )
+    
+    department = db.Column(db.String(50), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    employees_present = db.Column(db.Integer, nullable=False, default=0)
+    hours_worked = db.Column(db.Float, nullable=False, default=0)
+    break_minutes = db.Column(db.Float, nullable=False, default=0)
+    late_count = db.Column(db.Integer, nullable=False, default=0)
+    early_count = db.Column(db.Integer, nullable=False, default=0)
+    anomalous_count = db.Column(db.Integer, nullable=False, default=0)
+    alerts_low = db.Column(db.Integer, nullable=False, default=0)
+    alerts_medium = db.Column(db.Integer, nullable=False, default=0)
+    alerts_high = db.Column(db.Integer, nullable=False, default=0)
+    alerts_critical = db.Column(db.Integer, nullable=False, default=0)
+
+class JournalCheckpoint(db.Model):
+    # Highest swipe journal sequence number applied to the database. Updated
+    # in the same transaction as the swipes so replay is exactly-once.
+    journal = db.Column(db.String(100), primary_key=True)
+    applied_seq = db.Column(db.Integer, nullable=False, default=0)
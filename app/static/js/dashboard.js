@@ -537,41 +537,13 @@ function loadAlerts(employeeId = null) {
                 
                 // Create table body
                 const tableBody = document.createElement('tbody');
-                
-                data.alerts.forEach(alert => {
-                    const alertRow = document.createElement('tr');
-                    alertRow.className = `alert-row ${alert.severity}`;
-                    
-                    // Format date for better readability
-                    const alertDate = new Date(alert.timestamp);
-                    const formattedDate = alertDate.toLocaleString();
-                    
-                    // Status badge
-                    const statusBadge = alert.is_resolved ? 
-                        '<span class="status-badge resolved">Resolved</span>' : 
-                        '<span class="status-badge active">Active</span>';
-                    
-                    // Action buttons
-                    const actionButtons = alert.is_resolved ?
-                        '<button class="btn-view" onclick="viewAlertDetails(' + alert.id + ')">View</button>' :
-                        '<button class="btn-view" onclick="viewAlertDetails(' + alert.id + ')">View</button>' +
-                        '<button class="btn-resolve" onclick="resolveAlert(' + alert.id + ')">Resolve</button>';
-                    
-                    alertRow.innerHTML = `
-                        <td>${formattedDate}</td>
-                        <td>${alert.employee_name}</td>
-                        <td>${alert.alert_type}</td>
-                        <td>${alert.description}</td>
-                        <td><span class="alert-severity ${alert.severity}">${alert.severity.toUpperCase()}</span></td>
-                        <td>${statusBadge}</td>
-                        <td class="action-buttons">${actionButtons}</td>
-                    `;
-                    
-                    tableBody.appendChild(alertRow);
-                });
+                appendAlertRows(tableBody, data.alerts);
                 
                 alertsTable.appendChild(tableBody);
                 alertsContainer.appendChild(alertsTable);
+                
+                // Alerts come a page at a time; older ones load on request
+                addLoadMoreAlerts(alertsContainer, tableBody, url, data.next_cursor);
             } else {
                 // If no alerts found, show message with option to generate alerts
                 const noAlertsDiv = document.createElement('div');
@@ -606,6 +578,75 @@ function loadAlerts(employeeId = null) {
         });
 }
 
+// Function to add alert rows to the alerts table
+function appendAlertRows(tableBody, alerts) {
+    alerts.forEach(alert => {
+        const alertRow = document.createElement('tr');
+        alertRow.className = `alert-row ${alert.severity}`;
+        
+        // Format date for better readability
+        const alertDate = new Date(alert.timestamp);
+        const formattedDate = alertDate.toLocaleString();
+        
+        // Status badge
+        const statusBadge = alert.is_resolved ? 
+            '<span class="status-badge resolved">Resolved</span>' : 
+            '<span class="status-badge active">Active</span>';
+        
+        // Action buttons
+        const actionButtons = alert.is_resolved ?
+            '<button class="btn-view" onclick="viewAlertDetails(' + alert.id + ')">View</button>' :
+            '<button class="btn-view" onclick="viewAlertDetails(' + alert.id + ')">View</button>' +
+            '<button class="btn-resolve" onclick="resolveAlert(' + alert.id + ')">Resolve</button>';
+        
+        alertRow.innerHTML = `
+            <td>${formattedDate}</td>
+            <td>${alert.employee_name}</td>
+            <td>${alert.alert_type}</td>
+            <td>${alert.description}</td>
+            <td><span class="alert-severity ${alert.severity}">${alert.severity.toUpperCase()}</span></td>
+            <td>${statusBadge}</td>
+            <td class="action-buttons">${actionButtons}</td>
+        `;
+        
+        tableBody.appendChild(alertRow);
+    });
+}
+
+// Function to add a button loading the page of alerts after cursor
+function addLoadMoreAlerts(alertsContainer, tableBody, url, cursor) {
+    if (!cursor) {
+        return;
+    }
+    
+    const loadMoreButton = document.createElement('button');
+    loadMoreButton.className = 'btn load-more-alerts';
+    loadMoreButton.textContent = 'Load more alerts';
+    loadMoreButton.addEventListener('click', function() {
+        loadMoreButton.disabled = true;
+        loadMoreButton.textContent = 'Loading...';
+        
+        fetch(`${url}&cursor=${encodeURIComponent(cursor)}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Network response was not ok');
+                }
+                return response.json();
+            })
+            .then(data => {
+                loadMoreButton.remove();
+                appendAlertRows(tableBody, data.alerts || []);
+                addLoadMoreAlerts(alertsContainer, tableBody, url, data.next_cursor);
+            })
+            .catch(error => {
+                console.error('Error loading more alerts:', error);
+                loadMoreButton.disabled = false;
+                loadMoreButton.textContent = 'Load more alerts';
+            });
+    });
+    alertsContainer.appendChild(loadMoreButton);
+}
+
 // Function to generate sample alerts for testing
 function generateSampleAlerts() {
     // Show loading state
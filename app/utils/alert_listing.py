@@ -0,0 +1,106 @@
+import json
+from sqlalchemy import and_, func, or_, select
+from app.models.models import Alert, Employee, db
+from app.utils.cursors import encode_cursor, decode_cursor
+from config.config import Config
+
+# Selectable alert fields; the employee ones join the employee table
+ALERT_FIELDS = {
+    'id': Alert.id,
+    'employee_id': Alert.employee_id,
+    'employee_code': Employee.employee_id,
+    'employee_name': func.coalesce(Employee.name, 'Unknown'),
+    'department': Employee.department,
+    'timestamp': Alert.timestamp,
+    'alert_type': Alert.alert_type,
+    'severity': Alert.severity,
+    'description': Alert.description,
+    'is_resolved': Alert.is_resolved,
+    'resolved': Alert.is_resolved
+}
+_EMPLOYEE_FIELDS = {'employee_code', 'employee_name', 'department'}
+
+class AlertListing:
+    """Alerts matching some conditions, newest first, one page at a time or
+    streamed whole.
+
+    Pages are keyset-paginated on (timestamp, id), so a page costs the same
+    however deep it is. Exports read the table in chunks and yield encoded
+    output as they go, so server memory doesn't grow with the result.
+    """
+
+    def __init__(self, conditions, fields, limit=None, cursor=None):
+        self.conditions = list(conditions)
+        self.fields = fields
+        self.limit = limit
+        self.cursor = cursor
+
+    @classmethod
+    def from_args(cls, args, conditions, default_fields):
+        """Parse fields, limit and cursor request arguments; ValueError if invalid"""
+        fields = default_fields
+        if args.get('fields'):
+            fields = [name.strip() for name in args['fields'].split(',') if name.strip()]
+            unknown = [name for name in fields if name not in ALERT_FIELDS]
+            if unknown or not fields:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(ALERT_FIELDS)}")
+
+        limit = args.get('limit', Config.ALERT_PAGE_SIZE, type=int)
+        if limit is None or limit < 1:
+            raise ValueError('limit must be a positive integer')
+        limit = min(limit, Config.ALERT_MAX_PAGE_SIZE)
+
+        return cls(conditions, fields, limit, decode_cursor(args.get('cursor'), int))
+
+    def page(self):
+        """(alerts, next_cursor); next_cursor is None on the last page"""
+        rows = db.session.execute(self._query().limit(self.limit)).all()
+        next_cursor = None
+        if len(rows) == self.limit:
+            next_cursor = encode_cursor(rows[-1].sort_timestamp, rows[-1].sort_id)
+        return [self._serialize(row) for row in rows], next_cursor
+
+    def stream_ndjson(self):
+        for rows in self._chunks():
+            yield ''.join(json.dumps(self._serialize(row)) + '\n' for row in rows)
+
+    def stream_json(self):
+        # Same shape as a page: {"alerts": [...]}
+        yield '{"alerts": ['
+        first = True
+        for rows in self._chunks():
+            chunk = ', '.join(json.dumps(self._serialize(row)) for row in rows)
+            yield chunk if first else ', ' + chunk
+            first = False
+        yield ']}'
+
+    def _chunks(self):
+        result = db.session.execute(self._query().execution_options(yield_per=Config.ALERT_EXPORT_CHUNK_SIZE))
+        try:
+            yield from result.partitions()
+        finally:
+            result.close()
+
+    def _query(self):
+        stmt = select(
+            Alert.timestamp.label('sort_timestamp'), Alert.id.label('sort_id'),
+            *(ALERT_FIELDS[name].label(name) for name in self.fields)
+        ).select_from(Alert)
+        if _EMPLOYEE_FIELDS.intersection(self.fields):
+            stmt = stmt.outerjoin(Employee, Employee.id == Alert.employee_id)
+        if self.cursor is not None:
+            timestamp, alert_id = self.cursor
+            stmt = stmt.where(or_(
+                Alert.timestamp < timestamp,
+                and_(Alert.timestamp == timestamp, Alert.id < alert_id)
+            ))
+        return stmt.where(*self.conditions).order_by(Alert.timestamp.desc(), Alert.id.desc())
+
+    def _serialize(self, row):
+        alert = {}
+        for name in self.fields:
+            value = getattr(row, name)
+            if name == 'timestamp':
+                value = value.strftime('%Y-%m-%d %H:%M:%S')
+            alert[name] = value
+        return alert
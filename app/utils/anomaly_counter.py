@@ -0,0 +1,162 @@
+import bisect
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app.models.models import AttendanceRecord, db
+from config.config import Config
+
+class _EmployeeCounter:
+    __slots__ = ('dates', 'last_date', 'last_anomalous', 'streak')
+
+    def __init__(self):
+        self.dates = []            # sorted dates of anomalous records in the window
+        self.last_date = None      # date of the latest scored record
+        self.last_anomalous = False
+        self.streak = 0            # anomalous records in a row, ending at last_date
+
+class AnomalyCounter:
+    """Per-employee rolling anomaly counts, kept up to date on every check-out.
+
+    Tracks both the anomalous days inside the CONSECUTIVE_ANOMALIES_WINDOW_DAYS
+    window and the current run of back-to-back anomalous check-outs. Counts
+    are process-local and rebuilt from the database by backfill(); since
+    other server processes score check-outs too, should_escalate() first
+    re-reads the employee's counter with one bounded query. That only
+    happens for anomalous check-outs, the only ones that can escalate.
+    """
+
+    def __init__(self):
+        self._employees = {}
+        self._lock = threading.Lock()
+        self.backfilled_records = 0
+
+    def observe(self, employee_id, date, is_anomaly):
+        """Record the outcome of scoring one checked-out record (after commit)"""
+        with self._lock:
+            self._observe(self._employees, employee_id, date, is_anomaly)
+
+    def should_escalate(self, employee_id, date):
+        """Whether an anomaly being recorded for date crosses the threshold.
+
+        The anomaly itself counts, committed or not. Needs an app context.
+        """
+        threshold = Config.CONSECUTIVE_ANOMALIES_THRESHOLD
+        today = datetime.now().date()
+        self.refresh(employee_id)
+        with self._lock:
+            counter = self._employees.get(employee_id) or _EmployeeCounter()
+
+            if Config.CONSECUTIVE_ANOMALIES_MODE == 'streak':
+                if counter.last_date is None or date > counter.last_date:
+                    return counter.streak + 1 >= threshold
+                if date == counter.last_date:
+                    # Rescoring the latest record
+                    return counter.streak - counter.last_anomalous + 1 >= threshold
+                # Back-dated records don't end the current run
+                return False
+
+            count = _count_in_window(counter.dates, today)
+            if _in_window(date, today) and not _contains(counter.dates, date):
+                count += 1
+            return count >= threshold
+
+    def refresh(self, employee_id):
+        """Reload one employee's counter from the database (needs an app context)"""
+        stmt = select(AttendanceRecord.date, AttendanceRecord.is_anomaly).where(
+            AttendanceRecord.employee_id == employee_id,
+            AttendanceRecord.time_out.isnot(None)
+        )
+        if Config.CONSECUTIVE_ANOMALIES_MODE == 'streak':
+            # A run longer than the threshold decides nothing more
+            stmt = stmt.order_by(AttendanceRecord.date.desc()).limit(Config.CONSECUTIVE_ANOMALIES_THRESHOLD)
+        else:
+            start = datetime.now().date() - timedelta(days=Config.CONSECUTIVE_ANOMALIES_WINDOW_DAYS)
+            stmt = stmt.where(AttendanceRecord.date >= start)
+        rows = sorted(db.session.execute(stmt).all())
+
+        employees = {}
+        for date, is_anomaly in rows:
+            self._observe(employees, employee_id, date, bool(is_anomaly))
+        with self._lock:
+            if employee_id in employees:
+                self._employees[employee_id] = employees[employee_id]
+            else:
+                self._employees.pop(employee_id, None)
+
+    def discard(self, employee_id):
+        with self._lock:
+            self._employees.pop(employee_id, None)
+
+    def backfill(self, days=None):
+        """Rebuild every counter from recent history (needs an app context)"""
+        days = days or Config.ANOMALY_COUNTER_BACKFILL_DAYS
+        cutoff = datetime.now().date() - timedelta(days=days)
+        stmt = select(
+            AttendanceRecord.employee_id, AttendanceRecord.date, AttendanceRecord.is_anomaly
+        ).where(
+            AttendanceRecord.date >= cutoff,
+            AttendanceRecord.time_out.isnot(None)
+        ).order_by(AttendanceRecord.employee_id, AttendanceRecord.date)
+
+        employees = {}
+        count = 0
+        result = db.session.execute(stmt.execution_options(yield_per=Config.TRAINING_CHUNK_SIZE))
+        try:
+            for employee_id, date, is_anomaly in result:
+                self._observe(employees, employee_id, date, bool(is_anomaly))
+                count += 1
+        finally:
+            result.close()
+
+        with self._lock:
+            self._employees = employees
+            self.backfilled_records = count
+        return count
+
+    def stats(self):
+        today = datetime.now().date()
+        with self._lock:
+            return {
+                'employees': len(self._employees),
+                'mode': Config.CONSECUTIVE_ANOMALIES_MODE,
+                'employees_in_window': sum(1 for c in self._employees.values() if _count_in_window(c.dates, today)),
+                'longest_streak': max((c.streak for c in self._employees.values()), default=0),
+                'backfilled_records': self.backfilled_records
+            }
+
+    def _observe(self, employees, employee_id, date, is_anomaly):
+        counter = employees.get(employee_id)
+        if counter is None:
+            counter = employees[employee_id] = _EmployeeCounter()
+
+        # Window: anomalous dates, older ones pruned as we go
+        present = _contains(counter.dates, date)
+        if is_anomaly and not present:
+            bisect.insort(counter.dates, date)
+        elif not is_anomaly and present:
+            counter.dates.remove(date)
+        cutoff = datetime.now().date() - timedelta(days=Config.CONSECUTIVE_ANOMALIES_WINDOW_DAYS)
+        del counter.dates[:bisect.bisect_left(counter.dates, cutoff)]
+
+        # Streak: only the latest record extends or resets the run
+        if counter.last_date is None or date > counter.last_date:
+            counter.streak = counter.streak + 1 if is_anomaly else 0
+            counter.last_date = date
+            counter.last_anomalous = is_anomaly
+        elif date == counter.last_date:
+            counter.streak += int(is_anomaly) - int(counter.last_anomalous)
+            counter.last_anomalous = is_anomaly
+
+def _in_window(date, today):
+    return today - timedelta(days=Config.CONSECUTIVE_ANOMALIES_WINDOW_DAYS) <= date <= today
+
+def _count_in_window(dates, today):
+    start = today - timedelta(days=Config.CONSECUTIVE_ANOMALIES_WINDOW_DAYS)
+    return bisect.bisect_right(dates, today) - bisect.bisect_left(dates, start)
+
+def _contains(dates, date):
+    index = bisect.bisect_left(dates, date)
+    return index < len(dates) and dates[index] == date
+
+# Shared by the swipe path and the anomaly pipeline workers
+anomaly_counter = AnomalyCounter()
@@ -1,25 +1,97 @@
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.ensemble import IsolationForest
-from datetime import datetime, time
+from app.utils.rule_engine import rule_engine
 from config.config import Config
 
+# Everything scoring needs, swapped as one object. departments and employees
+# map a group to its own model; groups with too little history aren't in
+# them and fall back to the department model, then the global one.
+ModelSet = namedtuple('ModelSet', ['model', 'departments', 'employees', 'employee_departments', 'info'])
+
 class AnomalyDetector:
-    def __init__(self):
-        self.model = IsolationForest(contamination=0.05, random_state=42)
-        self.trained = False
+    def __init__(self, baselines=None, rules=None, scorer=None):
+        # Streaming per-employee baselines (online_baselines.OnlineBaselines),
+        # used when ANOMALY_DETECTOR_MODE is 'online' or 'both'
+        self.baselines = baselines
+        # Rule-based checks (rule_engine.RuleEngine)
+        self.rules = rules or rule_engine
+        # Micro-batches single-record predictions (batch_scorer.BatchScorer);
+        # without one, detect_anomalies() calls predict() directly
+        self.scorer = scorer
+        # A new model set replaces the old one whole (models are never
+        # refitted in place), so scoring that already holds a reference keeps
+        # using a consistent set while another is installed.
+        self.models = ModelSet(None, {}, {}, {}, None)
+    
+    @property
+    def model(self):
+        # The global IsolationForest
+        return self.models.model
+    
+    @property
+    def model_info(self):
+        return self.models.info
+    
+    @property
+    def trained(self):
+        return self.model is not None
+    
+    @property
+    def model_version(self):
+        return self.model_info['version'] if self.model_info else None
         
-    def train_model(self, attendance_records):
-        if not attendance_records or len(attendance_records) < 10:
-            return False
-            
-        features = self._extract_features(attendance_records)
-        if len(features) > 0:
-            self.model.fit(features)
-            self.trained = True
-            return True
-        return False
+    def fit_model(self, features, n_jobs=None):
+        """Fit a new model without installing it; None if there's too little data"""
+        if len(features) < 10:
+            return None
+        
+        model = IsolationForest(contamination=0.05, random_state=42, n_jobs=n_jobs)
+        model.fit(features)
+        # Trees are built in parallel; scoring one record at a time is
+        # faster without the worker pool
+        model.set_params(n_jobs=None)
+        return model
+    
+    def fit_models(self, training_set, n_jobs=None):
+        """Fit the global model plus per-department (and optionally
+        per-employee) models from a training_data.TrainingSet.
+
+        Returns a ModelSet without installing it, or None if there's too
+        little data. Group models are fitted in parallel threads.
+        """
+        model = self.fit_model(training_set.features, n_jobs=n_jobs)
+        if model is None:
+            return None
+        
+        groups = []
+        if Config.ANOMALY_DEPARTMENT_MODELS:
+            indices = pd.Series(training_set.departments).groupby(training_set.departments).indices
+            groups += [('department', key, rows) for key, rows in indices.items()]
+        if Config.ANOMALY_EMPLOYEE_MODELS:
+            indices = pd.Series(training_set.employee_ids).groupby(training_set.employee_ids).indices
+            groups += [('employee', int(key), rows) for key, rows in indices.items()]
+        groups = [group for group in groups if len(group[2]) >= Config.ANOMALY_GROUP_MIN_SAMPLES]
+        
+        fitted = {'department': {}, 'employee': {}}
+        if groups:
+            with ThreadPoolExecutor(max_workers=Config.TRAINING_GROUP_WORKERS) as executor:
+                group_models = executor.map(lambda group: self.fit_model(training_set.features[group[2]]), groups)
+                for (kind, key, _), group_model in zip(groups, group_models):
+                    fitted[kind][key] = group_model
+        
+        employee_departments = dict(zip(training_set.employee_ids.tolist(), training_set.departments.tolist()))
+        return ModelSet(model, fitted['department'], fitted['employee'], employee_departments, None)
+    
+    def install(self, model, info=None):
+        """Install a global model only, dropping any group models"""
+        self.install_models(ModelSet(model, {}, {}, {}, None), info)
+    
+    def install_models(self, models, info=None):
+        # Single reference swap: callers see either the old set or the new one
+        self.models = models._replace(info=info)
     
     def _extract_features(self, attendance_records):
         features = []
@@ -45,87 +117,155 @@ class AnomalyDetector:
         return t.hour * 60 + t.minute
     
     def detect_anomalies(self, record):
-        anomalies = []
-        
         # Check if time_in exists
         if not record.time_in:
-            anomalies.append({
-                'type': Config.ALERT_TYPES['MISSING_CHECK_IN'],
-                'severity': Config.SEVERITY_LEVELS['HIGH'],
-                'description': 'Missing check-in record detected.'
-            })
-            return anomalies
-            
-        # Check for late arrival
-        normal_start = datetime.strptime(Config.NORMAL_WORK_START, '%H:%M').time()
-        normal_start_dt = datetime.combine(record.date, normal_start)
-        if record.time_in > normal_start_dt + timedelta(minutes=Config.LATE_THRESHOLD):
-            minutes_late = (record.time_in - normal_start_dt).total_seconds() / 60
-            anomalies.append({
-                'type': Config.ALERT_TYPES['LATE_ARRIVAL'],
-                'severity': Config.SEVERITY_LEVELS['MEDIUM'],
-                'description': f'Late arrival detected. Employee arrived {int(minutes_late)} minutes late.'
-            })
-            
-        # Check for early departure if time_out exists
-        if record.time_out:
-            normal_end = datetime.strptime(Config.NORMAL_WORK_END, '%H:%M').time()
-            normal_end_dt = datetime.combine(record.date, normal_end)
-            if record.time_out < normal_end_dt - timedelta(minutes=Config.EARLY_DEPARTURE_THRESHOLD):
-                minutes_early = (normal_end_dt - record.time_out).total_seconds() / 60
-                anomalies.append({
-                    'type': Config.ALERT_TYPES['EARLY_DEPARTURE'],
-                    'severity': Config.SEVERITY_LEVELS['MEDIUM'],
-                    'description': f'Early departure detected. Employee left {int(minutes_early)} minutes early.'
-                })
-        else:
-            anomalies.append({
-                'type': Config.ALERT_TYPES['MISSING_CHECK_OUT'],
-                'severity': Config.SEVERITY_LEVELS['MEDIUM'],
-                'description': 'Missing check-out record detected.'
-            })
-            
-        # Check for extended breaks
-        for break_record in record.breaks:
-            if break_record.duration and break_record.duration > Config.NORMAL_BREAK_DURATION * Config.ABNORMAL_BREAK_THRESHOLD:
-                excess_minutes = break_record.duration - Config.NORMAL_BREAK_DURATION
-                anomalies.append({
-                    'type': Config.ALERT_TYPES['EXTENDED_BREAK'],
-                    'severity': Config.SEVERITY_LEVELS['LOW'],
-                    'description': f'Extended break detected. Break was {int(excess_minutes)} minutes longer than usual.'
-                })
-                
-        # Check for short workday
-        if record.total_hours and record.total_hours < Config.WORK_HOURS_PER_DAY * 0.75:
-            anomalies.append({
-                'type': Config.ALERT_TYPES['SHORT_WORKDAY'],
-                'severity': Config.SEVERITY_LEVELS['MEDIUM'],
-                'description': f'Short workday detected. Employee worked only {record.total_hours:.2f} hours.'
-            })
+            return [_missing_check_in()]
+        
+        # Declarative rules: late arrival, early departure, breaks, short days...
+        anomalies = self.rules.evaluate(record)
             
         # Use machine learning model for unusual pattern detection if trained
-        if self.trained and record.time_in and record.time_out:
+        model = _select_model(self.models, record) if self._uses_model() else None
+        if model is not None and record.time_in and record.time_out:
             features = self._extract_features([record])
             if len(features) > 0:
-                prediction = self.model.predict(features)
-                if prediction[0] == -1:  # -1 indicates anomaly
-                    anomalies.append({
-                        'type': Config.ALERT_TYPES['UNUSUAL_PATTERN'],
-                        'severity': Config.SEVERITY_LEVELS['HIGH'],
-                        'description': 'Unusual attendance pattern detected by machine learning model.'
-                    })
+                if self.scorer is not None:
+                    prediction = self.scorer.predict(model, features[0])
+                else:
+                    prediction = model.predict(features)[0]
+                if prediction == -1:  # -1 indicates anomaly
+                    anomalies.append(_unusual_pattern())
+        
+        # Compare with the employee's own running baseline; like the model,
+        # only complete days are scored
+        if self.uses_baselines() and record.time_out:
+            deviations = self.baselines.score(record.employee_id, record_features(record))
+            if deviations:
+                anomalies.append(_baseline_deviation(deviations))
                     
         return anomalies
+    
+    def _uses_model(self):
+        return Config.ANOMALY_DETECTOR_MODE in ('model', 'both')
+    
+    def uses_baselines(self):
+        """Whether ANOMALY_DETECTOR_MODE scores records against the online baselines"""
+        return self.baselines is not None and Config.ANOMALY_DETECTOR_MODE in ('online', 'both')
+    
+    def detect_anomalies_batch(self, records):
+        """Score many records in one pass; returns one anomaly list per record.
+
+        Gives the same anomalies, in the same order, as calling
+        detect_anomalies() on each record. Load breaks eagerly (selectinload)
+        when passing ORM records, or each record lazy-loads its own.
+        """
+        n = len(records)
+        results = [[] for _ in range(n)]
+        if n == 0:
+            return results
+        
+        checked_in = [i for i, record in enumerate(records) if record.time_in]
+        for i in sorted(set(range(n)) - set(checked_in)):
+            results[i].append(_missing_check_in())
+        
+        # Rules are evaluated over whole columns
+        rule_results = self.rules.evaluate_batch([records[i] for i in checked_in])
+        for i, anomalies in zip(checked_in, rule_results):
+            results[i] = anomalies
+        
+        complete = [i for i in checked_in if records[i].time_out]
         
-    def detect_multiple_swipes(self, employee_id, timestamp, recent_swipes):
-        relevant_swipes = [s for s in recent_swipes 
-                           if s['employee_id'] == employee_id 
-                           and (timestamp - s['timestamp']).total_seconds() / 60 <= Config.TIME_WINDOW_FOR_MULTIPLE_SWIPES]
+        unusual = set()
+        models = self.models
+        if models.model is not None and self._uses_model():
+            # One predict() per model that the scored records map to
+            by_model = {}
+            for i in complete:
+                model = _select_model(models, records[i])
+                by_model.setdefault(id(model), (model, []))[1].append(i)
+            for model, scored in by_model.values():
+                features = self._extract_features([records[i] for i in scored])
+                predictions = model.predict(features)
+                unusual.update(i for i, prediction in zip(scored, predictions) if prediction == -1)
         
-        if len(relevant_swipes) >= Config.MULTIPLE_SWIPE_THRESHOLD:
+        # Baseline scoring is a constant-time lookup per record
+        baseline_deviations = {}
+        if self.uses_baselines():
+            for i in complete:
+                baseline_deviations[i] = self.baselines.score(records[i].employee_id, record_features(records[i]))
+        
+        # Same order as detect_anomalies(): rules, model, baseline
+        for i in complete:
+            if i in unusual:
+                results[i].append(_unusual_pattern())
+            if baseline_deviations.get(i):
+                results[i].append(_baseline_deviation(baseline_deviations[i]))
+        
+        return results
+        
+    def detect_multiple_swipes(self, employee_id, timestamp, swipe_window):
+        # swipe_window is a SwipeWindow; only this employee's swipes are counted
+        swipe_count = swipe_window.count(employee_id, timestamp)
+        
+        if swipe_count >= Config.MULTIPLE_SWIPE_THRESHOLD:
             return {
                 'type': Config.ALERT_TYPES['MULTIPLE_SWIPES'],
                 'severity': Config.SEVERITY_LEVELS['HIGH'],
                 'description': f'Multiple card swipes detected within {Config.TIME_WINDOW_FOR_MULTIPLE_SWIPES} minutes.'
             }
-        return None 
\ No newline at end of file
+        return None 
+def _select_model(models, record):
+    # Most specific model first: employee, then department, then global
+    employee_id = getattr(record, 'employee_id', None)
+    model = models.employees.get(employee_id)
+    if model is None and models.departments:
+        department = models.employee_departments.get(employee_id)
+        if department is None:
+            # Employees hired after training: a lazy load, once per record
+            employee = getattr(record, 'employee', None)
+            department = employee.department if employee is not None else None
+        model = models.departments.get(department)
+    return model if model is not None else models.model
+
+# Baseline features of a completed record: arrival and departure minutes,
+# break minutes and hours worked
+def record_features(record):
+    if not record.time_in or not record.time_out:
+        return None
+    return [
+        record.time_in.hour * 60 + record.time_in.minute,
+        record.time_out.hour * 60 + record.time_out.minute,
+        sum(b.duration or 0 for b in record.breaks),
+        record.total_hours or 0
+    ]
+
+# Alert payloads shared by detect_anomalies() and detect_anomalies_batch();
+# the rule-based ones come from rule_engine
+def _missing_check_in():
+    return {
+        'type': Config.ALERT_TYPES['MISSING_CHECK_IN'],
+        'severity': Config.SEVERITY_LEVELS['HIGH'],
+        'description': 'Missing check-in record detected.'
+    }
+
+def _unusual_pattern():
+    return {
+        'type': Config.ALERT_TYPES['UNUSUAL_PATTERN'],
+        'severity': Config.SEVERITY_LEVELS['HIGH'],
+        'description': 'Unusual attendance pattern detected by machine learning model.'
+    }
+
+_DEVIATION_PHRASES = {
+    'arrival': lambda d: f"arrived {abs(d):.0f} minutes {'later' if d > 0 else 'earlier'} than usual",
+    'departure': lambda d: f"left {abs(d):.0f} minutes {'later' if d > 0 else 'earlier'} than usual",
+    'break_minutes': lambda d: f"took {abs(d):.0f} {'more' if d > 0 else 'fewer'} break minutes than usual",
+    'hours_worked': lambda d: f"worked {abs(d):.1f} {'more' if d > 0 else 'fewer'} hours than usual"
+}
+
+def _baseline_deviation(deviations):
+    details = ', '.join(_DEVIATION_PHRASES[name](deviation) for name, deviation in deviations)
+    return {
+        'type': Config.ALERT_TYPES['UNUSUAL_PATTERN'],
+        'severity': Config.SEVERITY_LEVELS['HIGH'],
+        'description': f'Unusual day for this employee: {details}.'
+    }
@@ -0,0 +1,186 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from app.models.models import AttendanceRecord, db
+from app.utils.helpers import record_anomalies, unit_of_work
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Queue sentinel telling a worker to exit
+_STOP = object()
+
+class AnomalyPipeline:
+    """Runs check-out anomaly detection and alerting on background workers.
+
+    Swipes enqueue the id of a committed attendance record. A worker takes
+    every id already queued (up to MICRO_BATCH_MAX_SIZE) without waiting for
+    more, loads the records in its own app context, scores them with one
+    detect_anomalies_batch() call and commits the resulting alerts in one
+    unit of work. Queued work is drained on interpreter exit.
+    """
+
+    def __init__(self, num_workers=None, max_queue_size=None):
+        self.num_workers = num_workers or Config.ANOMALY_WORKERS
+        self._queue = queue.Queue(maxsize=max_queue_size or Config.ANOMALY_QUEUE_SIZE)
+        self._workers = []
+        self._lock = threading.Lock()
+        self.app = None
+        self.detector = None
+        self.running = False
+
+        # Metrics
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.last_lag = None
+        self.max_lag = 0.0
+        self._total_lag = 0.0
+
+    def init_app(self, app, detector):
+        with self._lock:
+            self.app = app
+            self.detector = detector
+            if self.running or not app.config.get('ANOMALY_DETECTION_ASYNC', True):
+                return
+
+            for i in range(self.num_workers):
+                worker = threading.Thread(
+                    target=self._run, name=f'anomaly-worker-{i}', daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+            self.running = True
+            atexit.register(self.shutdown)
+
+    def submit(self, record_id):
+        # Blocks when the queue is full, pushing back on swipe ingestion
+        self._queue.put((record_id, time.monotonic()))
+
+    def drain(self):
+        """Block until every queued record has been processed"""
+        self._queue.join()
+
+    def shutdown(self, timeout=None):
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+            workers, self._workers = self._workers, []
+
+        # Sentinels queue up behind pending work, so everything drains first
+        for _ in workers:
+            self._queue.put(_STOP)
+
+        deadline = time.monotonic() + (timeout or Config.ANOMALY_SHUTDOWN_TIMEOUT)
+        for worker in workers:
+            worker.join(max(0, deadline - time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self.running,
+                'workers': len(self._workers),
+                'queue_depth': self._queue.qsize(),
+                'processed': self.processed,
+                'failed': self.failed,
+                'batches': self.batches,
+                'batch_size_max': self.max_batch,
+                'lag_seconds_last': round(self.last_lag, 4) if self.last_lag is not None else None,
+                'lag_seconds_max': round(self.max_lag, 4),
+                'lag_seconds_avg': round(self._total_lag / self.processed, 4) if self.processed else None
+            }
+
+    def _run(self):
+        while True:
+            items = self._take()
+            stop = items[-1] is _STOP
+            try:
+                if stop:
+                    items.pop()
+                if items:
+                    self._process(items)
+            finally:
+                for _ in range(len(items) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _take(self):
+        # Block for the first item, then take what's already queued
+        items = [self._queue.get()]
+        max_size = self.app.config.get('MICRO_BATCH_MAX_SIZE', 256)
+        while len(items) < max_size and items[-1] is not _STOP:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _process(self, items):
+        try:
+            with self.app.app_context():
+                with unit_of_work():
+                    later = self._score([record_id for record_id, _ in items])
+        except Exception:
+            if len(items) > 1:
+                # Find the record that fails by processing one at a time
+                for item in items:
+                    self._process([item])
+                return
+            logger.exception('Anomaly detection failed for attendance record %s', items[0][0])
+            with self._lock:
+                self.failed += 1
+            return
+
+        done = time.monotonic()
+        scored = [item for item in items if item[0] not in later]
+        with self._lock:
+            self.batches += 1
+            self.max_batch = max(self.max_batch, len(scored))
+            for _, enqueued_at in scored:
+                lag = done - enqueued_at
+                self.processed += 1
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self._total_lag += lag
+
+        if later:
+            self._process([item for item in items if item[0] in later])
+
+    def _score(self, record_ids):
+        """Score and stage alerts for the checked-out records among record_ids.
+
+        Returns the ids left for a later unit of work: an employee's second
+        record waits until the first is committed, so escalation and the
+        baselines see the days one after another, as they would unbatched.
+        """
+        records = db.session.execute(
+            select(AttendanceRecord)
+            .options(selectinload(AttendanceRecord.breaks))
+            .where(AttendanceRecord.id.in_(record_ids), AttendanceRecord.time_out.isnot(None))
+        ).scalars().all()
+        order = {record_id: i for i, record_id in enumerate(record_ids)}
+        records.sort(key=lambda record: order[record.id])
+
+        batch = []
+        later = set()
+        employees = set()
+        for record in records:
+            if record.employee_id in employees:
+                later.add(record.id)
+            else:
+                employees.add(record.employee_id)
+                batch.append(record)
+
+        for record, anomalies in zip(batch, self.detector.detect_anomalies_batch(batch)):
+            record_anomalies(self.detector, record, anomalies)
+        return later
+
+# Shared instance started by init_services()
+anomaly_pipeline = AnomalyPipeline()
@@ -0,0 +1,223 @@
+import threading
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+from app.models.models import AttendanceRecord, Break, db
+
+# What a swipe needs to know about an employee's day. record_id is None when
+# the employee hasn't checked in; open_break_* are set while on a break.
+DayState = namedtuple('DayState', ['record_id', 'time_out', 'open_break_id', 'open_break_start'])
+NO_RECORD = DayState(None, None, None, None)
+
+# Statements issued by the swipe path itself carry this execution option so
+# they aren't mistaken for outside edits.
+MANAGED_OPTION = 'attendance_state_managed'
+
+class AttendanceStateCache:
+    """In-memory "today state" per employee for the swipe state machine.
+
+    The cache is complete for a single date: an employee missing from it has
+    not checked in. Swipes stage their new state in the session and the
+    cache only takes it once the transaction commits. A rollback discards
+    the staged states and marks every employee the transaction looked up as
+    stale: the cache is per process, so a failed write (e.g. the unique
+    index rejecting a check-in another worker already made) usually means
+    the cached state was wrong, and the retry must read the database. ORM
+    events invalidate employees whose records or breaks are changed outside
+    the swipe path; bulk updates and deletes clear the whole cache.
+    """
+
+    def __init__(self):
+        self.date = None
+        self._states = {}
+        self._record_owner = {}
+        self._stale = set()
+        self._lock = threading.Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def load(self, date=None):
+        """Rebuild the cache for a date from committed data (needs an app context)"""
+        date = date or datetime.now().date()
+        stmt = select(
+            AttendanceRecord.id, AttendanceRecord.employee_id, AttendanceRecord.time_out,
+            Break.id, Break.start_time
+        ).outerjoin(
+            Break, (Break.attendance_record_id == AttendanceRecord.id) & Break.end_time.is_(None)
+        ).where(AttendanceRecord.date == date)
+
+        while True:
+            with self._lock:
+                version = self._version
+
+            # A separate connection sees only committed rows
+            with db.engine.connect() as conn:
+                rows = conn.execute(stmt).all()
+
+            states = {}
+            owners = {}
+            for record_id, employee_id, time_out, break_id, break_start in rows:
+                states[employee_id] = DayState(record_id, time_out, break_id, break_start)
+                owners[record_id] = employee_id
+
+            with self._lock:
+                # Retry if a swipe committed while we were reading
+                if version != self._version:
+                    continue
+                self.date = date
+                self._states = states
+                self._record_owner = owners
+                self._stale.clear()
+                return len(states)
+
+    def get(self, employee_id, date):
+        """Return the cached DayState, or None when the caller must read the DB"""
+        pending = _pending(db.session)
+        if (employee_id, date) in pending['states']:
+            return pending['states'][(employee_id, date)]
+        pending['read'].add(employee_id)
+
+        rollover = False
+        with self._lock:
+            if self.date == date and employee_id not in self._stale:
+                self.hits += 1
+                return self._states.get(employee_id, NO_RECORD)
+            # Reload only when the calendar day has actually rolled over,
+            # not for back-dated or future-dated batch events
+            rollover = (self.date is None or date > self.date) and date == datetime.now().date()
+            if not rollover:
+                self.misses += 1
+
+        if rollover:
+            self.load(date)
+            return self.get(employee_id, date)
+        return None
+
+    def stage(self, employee_id, date, state):
+        """Record the state a swipe leaves behind; applied on commit"""
+        _pending(db.session)['states'][(employee_id, date)] = state
+
+    def invalidate(self, employee_id=None):
+        """Drop one employee (or everything when employee_id is None) right away"""
+        with self._lock:
+            self.invalidations += 1
+            if employee_id is None:
+                self.date = None
+                self._states = {}
+                self._record_owner = {}
+                self._stale.clear()
+            else:
+                self._stale.add(employee_id)
+
+    def _mark_stale(self, employee_ids):
+        if not employee_ids:
+            return
+        with self._lock:
+            self.invalidations += 1
+            self._stale.update(employee_ids)
+
+    def owner_of(self, record_id):
+        with self._lock:
+            return self._record_owner.get(record_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'date': self.date.strftime('%Y-%m-%d') if self.date else None,
+                'employees': len(self._states),
+                'stale': len(self._stale),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+    def _apply(self, pending):
+        with self._lock:
+            self._version += 1
+            if pending['clear']:
+                self.invalidations += 1
+                self.date = None
+                self._states = {}
+                self._record_owner = {}
+                self._stale.clear()
+                return
+
+            # Invalidations first: the swipe path's own writes also fire the
+            # ORM events, and its staged states below supersede them
+            if pending['invalidate']:
+                self.invalidations += 1
+                self._stale.update(pending['invalidate'])
+
+            for (employee_id, date), state in pending['states'].items():
+                if date != self.date:
+                    continue
+                if state.record_id is None:
+                    self._states.pop(employee_id, None)
+                else:
+                    self._states[employee_id] = state
+                    self._record_owner[state.record_id] = employee_id
+                self._stale.discard(employee_id)
+
+attendance_state = AttendanceStateCache()
+
+def _pending(session, create=True):
+    if session is None:
+        return None
+    pending = session.info.get('attendance_state_pending')
+    if pending is None and create:
+        pending = session.info['attendance_state_pending'] = {
+            'states': {}, 'read': set(), 'invalidate': set(), 'clear': False
+        }
+    return pending
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending_state(session):
+    pending = session.info.pop('attendance_state_pending', None)
+    if pending:
+        attendance_state._apply(pending)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_state(session, previous_transaction):
+    pending = session.info.pop('attendance_state_pending', None)
+    if pending:
+        attendance_state._mark_stale(pending['read'] | {employee_id for employee_id, _ in pending['states']})
+
+@event.listens_for(Session, 'do_orm_execute')
+def _watch_bulk_statements(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get(MANAGED_OPTION):
+        return
+    mappers = {m.class_ for m in orm_execute_state.all_mappers}
+    if mappers & {AttendanceRecord, Break}:
+        _pending(orm_execute_state.session)['clear'] = True
+
+def _invalidate_record_owner(mapper, connection, target):
+    pending = _pending(object_session(target))
+    if pending is not None:
+        pending['invalidate'].add(target.employee_id)
+
+def _invalidate_record_owner_on_change(mapper, connection, target):
+    # Flags like is_anomaly don't affect what the next swipe means
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in _STATE_COLUMNS):
+        _invalidate_record_owner(mapper, connection, target)
+
+def _invalidate_break_owner(mapper, connection, target):
+    employee_id = attendance_state.owner_of(target.attendance_record_id)
+    pending = _pending(object_session(target))
+    if employee_id is not None and pending is not None:
+        pending['invalidate'].add(employee_id)
+
+_STATE_COLUMNS = ('employee_id', 'date', 'time_in', 'time_out')
+
+event.listen(AttendanceRecord, 'after_insert', _invalidate_record_owner)
+event.listen(AttendanceRecord, 'after_update', _invalidate_record_owner_on_change)
+event.listen(AttendanceRecord, 'after_delete', _invalidate_record_owner)
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Break, _event_name, _invalidate_break_owner)
@@ -0,0 +1,144 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import numpy as np
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+class BatchScorer:
+    """Micro-batches single-record model predictions.
+
+    Check-outs arrive in bursts, and predict() on one row costs about as much
+    as predict() on hundreds. Callers queue their feature row and wait; a
+    dispatcher thread collects rows for up to MICRO_BATCH_WINDOW_MS (or until
+    MICRO_BATCH_MAX_SIZE rows), runs one predict() per model and hands each
+    caller its own prediction. A caller that waits longer than
+    MICRO_BATCH_TIMEOUT_MS withdraws its row and predicts directly.
+
+    Only synchronous detection (ANOMALY_DETECTION_ASYNC off) scores on
+    request threads one record at a time, and only for single swipes
+    applied without the journal: journal groups and batch requests score
+    their check-outs together (helpers.batched_anomaly_scoring). The
+    background pipeline batches its own queue, so the dispatcher isn't
+    started when it runs.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.app = None
+        self.running = False
+
+        # Metrics
+        self.batches = 0
+        self.rows = 0
+        self.max_batch = 0
+        self.fallbacks = 0
+        self.direct = 0
+        self._total_wait = 0.0
+        self.max_wait = 0.0
+
+    def init_app(self, app):
+        with self._lock:
+            self.app = app
+            if self.running or not app.config.get('MICRO_BATCH_ENABLED', True) \
+                    or app.config.get('ANOMALY_DETECTION_ASYNC', True):
+                return
+            threading.Thread(target=self._run, name='batch-scorer', daemon=True).start()
+            self.running = True
+
+    def predict(self, model, row):
+        """Prediction (1 or -1) of model for a single feature row"""
+        if not self.running:
+            return self._predict_direct(model, row)
+
+        future = Future()
+        self._queue.put((model, row, future, time.monotonic()))
+        timeout = self.app.config.get('MICRO_BATCH_TIMEOUT_MS', 100) / 1000
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            # Only withdrawn if the dispatcher hasn't picked it up yet
+            if not future.cancel():
+                return future.result()
+            with self._lock:
+                self.fallbacks += 1
+            return self._predict_direct(model, row)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self.running,
+                'queue_depth': self._queue.qsize(),
+                'batches': self.batches,
+                'rows': self.rows,
+                'batch_size_avg': round(self.rows / self.batches, 2) if self.batches else None,
+                'batch_size_max': self.max_batch,
+                'queue_wait_ms_avg': round(self._total_wait / self.rows * 1000, 3) if self.rows else None,
+                'queue_wait_ms_max': round(self.max_wait * 1000, 3),
+                'fallbacks': self.fallbacks,
+                'direct': self.direct
+            }
+
+    def _predict_direct(self, model, row):
+        with self._lock:
+            self.direct += 1
+        return int(model.predict(np.asarray([row]))[0])
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._score(batch)
+            except Exception:
+                logger.exception('Micro-batch scoring failed')
+
+    def _collect(self):
+        # Block for the first row, then gather until the window closes
+        batch = [self._queue.get()]
+        window = self.app.config.get('MICRO_BATCH_WINDOW_MS', 5) / 1000
+        max_size = self.app.config.get('MICRO_BATCH_MAX_SIZE', 256)
+        deadline = time.monotonic() + window
+        while len(batch) < max_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _score(self, batch):
+        started = time.monotonic()
+        # Skip rows whose caller already gave up and predicted directly
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        by_model = {}
+        for item in batch:
+            by_model.setdefault(id(item[0]), (item[0], []))[1].append(item)
+        for model, items in by_model.values():
+            try:
+                predictions = model.predict(np.asarray([item[1] for item in items]))
+            except Exception as e:
+                for item in items:
+                    item[2].set_exception(e)
+                continue
+            for item, prediction in zip(items, predictions):
+                item[2].set_result(int(prediction))
+
+        waits = [started - item[3] for item in batch]
+        with self._lock:
+            self.batches += 1
+            self.rows += len(batch)
+            self.max_batch = max(self.max_batch, len(batch))
+            self._total_wait += sum(waits)
+            self.max_wait = max(self.max_wait, max(waits))
+
+# Shared instance started by init_services()
+batch_scorer = BatchScorer()
@@ -0,0 +1,32 @@
+from app.utils.rfid_cache import rfid_cache
+from app.utils.anomaly_pipeline import anomaly_pipeline
+from app.utils.attendance_state import attendance_state
+from app.utils.anomaly_counter import anomaly_counter
+from app.utils.db_tuning import check_sqlite_settings
+from app.utils.swipe_journal import swipe_journal
+from app.utils.model_store import model_store
+from app.utils.training_jobs import training_jobs
+from app.utils.online_baselines import online_baselines
+from app.utils.batch_scorer import batch_scorer
+
+def init_services(app):
+    """Warm up process-local caches and services after the database is ready"""
+    # Imported here: the attendance API imports this package's modules
+    from app.api.attendance import anomaly_detector, apply_swipe_event
+    
+    check_sqlite_settings(app)
+    
+    with app.app_context():
+        rfid_cache.load()
+        attendance_state.load()
+        anomaly_counter.backfill()
+    
+    # Warm start from the last saved model instead of scoring untrained
+    model_store.init_app(app, anomaly_detector)
+    training_jobs.init_app(app, anomaly_detector, model_store)
+    online_baselines.init_app(app)
+    batch_scorer.init_app(app)
+    anomaly_pipeline.init_app(app, anomaly_detector)
+    
+    # Replays swipes that never reached the database, so it comes last
+    swipe_journal.init_app(app, apply_swipe_event)
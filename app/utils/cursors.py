@@ -0,0 +1,26 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+# Keyset pagination cursors: the sort key of the last row served, as an
+# opaque URL-safe token. The first value is always a timestamp.
+_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+def encode_cursor(timestamp, *rest):
+    key = [timestamp.strftime(_TIMESTAMP_FORMAT)] + list(rest)
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+def decode_cursor(token, *types):
+    """(timestamp, *rest) from a token, each of rest converted by types;
+    None for an empty token. Raises ValueError for anything malformed."""
+    if not token:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        if not isinstance(key, list) or len(key) != len(types) + 1:
+            raise ValueError('Invalid cursor')
+        return (datetime.strptime(key[0], _TIMESTAMP_FORMAT),
+                *(convert(value) for convert, value in zip(types, key[1:])))
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise ValueError('Invalid cursor')
@@ -0,0 +1,63 @@
+import logging
+from sqlalchemy import event
+from app.models.models import db
+
+logger = logging.getLogger(__name__)
+
+def configure_sqlite(app):
+    """Apply SQLITE_PRAGMAS to every connection the app's engine opens"""
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite' or not pragmas:
+            return
+
+        @event.listens_for(engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in pragmas.items():
+                    cursor.execute(f'PRAGMA {name}={value}')
+            finally:
+                cursor.close()
+
+        # Connections opened before the listener existed don't have the pragmas
+        engine.dispose()
+
+def check_sqlite_settings(app):
+    """Log the effective database settings and warn where they differ from the config"""
+    requested = app.config.get('SQLITE_PRAGMAS') or {}
+
+    with app.app_context():
+        engine = db.engine
+        report = {
+            'dialect': engine.dialect.name,
+            'pool': type(engine.pool).__name__,
+            'pool_size': engine.pool.size() if hasattr(engine.pool, 'size') else None
+        }
+
+        if engine.dialect.name == 'sqlite':
+            pragmas = {}
+            with engine.connect() as conn:
+                for name in set(requested) | {'journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size'}:
+                    pragmas[name] = conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+            report['pragmas'] = pragmas
+
+            for name, value in requested.items():
+                if not _pragma_matches(name, value, pragmas.get(name)):
+                    logger.warning('SQLite PRAGMA %s requested %r but is %r', name, value, pragmas.get(name))
+
+    logger.info('Database settings: %s', report)
+    app.config['DATABASE_SETTINGS_REPORT'] = report
+    return report
+
+# PRAGMA synchronous reports numbers rather than names
+_SYNCHRONOUS_LEVELS = {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3}
+
+def _pragma_matches(name, requested, effective):
+    if name == 'synchronous' and isinstance(requested, str):
+        requested = _SYNCHRONOUS_LEVELS.get(requested.upper(), requested)
+    if isinstance(requested, str) and isinstance(effective, str):
+        return requested.lower() == effective.lower()
+    return requested == effective
@@ -1,5 +1,10 @@
+from contextlib import contextmanager
+from sqlalchemy import update
 from datetime import datetime, timedelta
 from app.models.models import Employee, AttendanceRecord, Break, Alert, db
+from app.utils.attendance_state import MANAGED_OPTION
+from app.utils.rollups import TRACKED_OPTION, track_closed_break
+from app.utils.anomaly_counter import anomaly_counter
 from config.config import Config
 
 def calculate_work_hours(time_in, time_out, breaks):
@@ -29,6 +34,43 @@ def get_current_attendance_record(employee_id, current_date):
         date=current_date
     ).first()
 
+@contextmanager
+def unit_of_work():
+    """Stage all changes made inside the block and commit them once.
+    
+    Units of work nest: only the outermost block commits, so a caller can
+    group many swipes (and their alerts) into a single commit by wrapping
+    them in its own unit_of_work(). Any exception rolls back everything.
+    """
+    info = db.session.info
+    depth = info.get('unit_of_work_depth', 0)
+    info['unit_of_work_depth'] = depth + 1
+    try:
+        yield db.session
+        if depth == 0:
+            db.session.commit()
+    except Exception:
+        if depth == 0:
+            db.session.rollback()
+            info.pop('after_commit_callbacks', None)
+        raise
+    finally:
+        info['unit_of_work_depth'] = depth
+    
+    if depth == 0:
+        for callback in info.pop('after_commit_callbacks', []):
+            callback()
+
+def run_after_commit(callback):
+    """Run callback once the current unit of work has committed"""
+    if db.session.info.get('unit_of_work_depth', 0) == 0:
+        callback()
+    else:
+        db.session.info.setdefault('after_commit_callbacks', []).append(callback)
+
+# The helpers below only stage changes in the session. Callers commit them
+# through unit_of_work(); queries in between see them through autoflush.
+
 def create_attendance_record(employee_id, current_time):
     record = AttendanceRecord(
         employee_id=employee_id,
@@ -36,29 +78,38 @@ def create_attendance_record(employee_id, current_time):
         time_in=current_time
     )
     db.session.add(record)
-    db.session.commit()
     return record
 
 def record_time_out(record, current_time):
     record.time_out = current_time
     record.total_hours = calculate_work_hours(record.time_in, current_time, record.breaks)
-    db.session.commit()
     return record
 
-def start_break(record, current_time):
+def start_break(record_id, current_time):
     break_record = Break(
-        attendance_record_id=record.id,
+        attendance_record_id=record_id,
         start_time=current_time
     )
     db.session.add(break_record)
-    db.session.commit()
     return break_record
 
-def end_break(break_record, current_time):
-    break_record.end_time = current_time
-    break_record.duration = calculate_break_duration(break_record.start_time, current_time)
-    db.session.commit()
-    return break_record
+def end_break(break_id, record_id, start_time, current_time):
+    """Close a break of record_id with a single UPDATE, without loading it first.
+    
+    Returns the break duration in minutes, or None if the break no longer
+    exists.
+    """
+    duration = calculate_break_duration(start_time, current_time)
+    result = db.session.execute(
+        update(Break)
+        .where(Break.id == break_id, Break.end_time.is_(None))
+        .values(end_time=current_time, duration=duration)
+        .execution_options(**{MANAGED_OPTION: True, TRACKED_OPTION: True})
+    )
+    if not result.rowcount:
+        return None
+    track_closed_break(record_id, duration)
+    return duration
 
 def get_active_break(record):
     return Break.query.filter_by(
@@ -74,23 +125,85 @@ def create_alert(employee_id, alert_info):
         description=alert_info['description']
     )
     db.session.add(alert)
-    db.session.commit()
     return alert
 
-def check_consecutive_anomalies(employee_id, days=7):
-    end_date = datetime.now().date()
-    start_date = end_date - timedelta(days=days)
+def check_consecutive_anomalies(employee_id, current_date):
+    """Whether an anomaly recorded for current_date calls for a critical alert.
+    
+    Asks anomaly_counter, which re-reads the employee's recent records;
+    CONSECUTIVE_ANOMALIES_MODE picks the window count or the streak.
+    """
+    return anomaly_counter.should_escalate(employee_id, current_date)
+
+def record_anomalies(anomaly_detector, record, anomalies=None):
+    """Run anomaly detection on a checked-out record and stage its alerts.
+    
+    Pass anomalies when the record was already scored, e.g. by
+    detect_anomalies_batch().
+    """
+    if anomalies is None:
+        anomalies = anomaly_detector.detect_anomalies(record)
+    if anomalies:
+        record.is_anomaly = True
+        
+        for anomaly in anomalies:
+            create_alert(record.employee_id, anomaly)
+        
+        # Check for consecutive anomalies
+        if check_consecutive_anomalies(record.employee_id, record.date):
+            if Config.CONSECUTIVE_ANOMALIES_MODE == 'streak':
+                description = f'Employee has shown anomalies on {Config.CONSECUTIVE_ANOMALIES_THRESHOLD} or more consecutive working days.'
+            else:
+                description = f'Employee has shown {Config.CONSECUTIVE_ANOMALIES_THRESHOLD} or more anomalies in the past week.'
+            consecutive_alert = {
+                'type': Config.ALERT_TYPES['CONSECUTIVE_ANOMALIES'],
+                'severity': Config.SEVERITY_LEVELS['CRITICAL'],
+                'description': description
+            }
+            create_alert(record.employee_id, consecutive_alert)
+    
+    # Counters only move once the anomaly is committed
+    employee_id, date, is_anomaly = record.employee_id, record.date, bool(anomalies)
+    run_after_commit(lambda: anomaly_counter.observe(employee_id, date, is_anomaly))
+    
+    # Scored first, so the day doesn't count towards its own baseline
+    if anomaly_detector.uses_baselines():
+        anomaly_detector.baselines.observe(record)
     
-    records = AttendanceRecord.query.filter(
-        AttendanceRecord.employee_id == employee_id,
-        AttendanceRecord.date >= start_date,
-        AttendanceRecord.date <= end_date,
-        AttendanceRecord.is_anomaly == True
-    ).order_by(AttendanceRecord.date.desc()).all()
+    return anomalies
+
+def record_anomalies_batched(anomaly_detector, record):
+    """record_anomalies(), or queue the record when inside batched_anomaly_scoring()"""
+    checkouts = db.session.info.get('batched_checkouts')
+    if checkouts is None:
+        return record_anomalies(anomaly_detector, record)
+    checkouts.append((anomaly_detector, record))
+
+@contextmanager
+def batched_anomaly_scoring():
+    """Score the check-outs staged inside the block together as it ends.
     
-    if len(records) >= Config.CONSECUTIVE_ANOMALIES_THRESHOLD:
-        return True
-    return False
+    Records passed to record_anomalies_batched() in the block are scored
+    with one detect_anomalies_batch() call per detector, then their alerts
+    are staged in order. Use it inside the unit_of_work() that applies a
+    group of swipes, so the group doesn't make a predict() per check-out.
+    """
+    info = db.session.info
+    if 'batched_checkouts' in info:
+        # Nested: the outer block scores
+        yield
+        return
+    checkouts = info['batched_checkouts'] = []
+    try:
+        yield
+        by_detector = {}
+        for anomaly_detector, record in checkouts:
+            by_detector.setdefault(id(anomaly_detector), (anomaly_detector, []))[1].append(record)
+        for anomaly_detector, records in by_detector.values():
+            for record, anomalies in zip(records, anomaly_detector.detect_anomalies_batch(records)):
+                record_anomalies(anomaly_detector, record, anomalies)
+    finally:
+        info.pop('batched_checkouts', None)
 
 def generate_random_attendance_data(employee, date, normal=True):
     from random import randint, choice, random
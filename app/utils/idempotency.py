@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from config.config import Config
+
+class _Entry:
+    __slots__ = ('created', 'done', 'response')
+
+    def __init__(self):
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.response = None
+
+class IdempotencyStore:
+    """Bounded, time-expiring store of responses keyed by idempotency key.
+
+    The first request for a key owns it and must call complete() (or
+    abandon() on failure). Repeats get the stored response; a repeat that
+    arrives while the first is still running waits for it. Keys live in
+    insertion order, so expiry only ever looks at the oldest entries.
+    """
+
+    def __init__(self, ttl=None, max_keys=None):
+        self.ttl = ttl or Config.IDEMPOTENCY_TTL
+        self.max_keys = max_keys or Config.IDEMPOTENCY_MAX_KEYS
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    def begin(self, key):
+        """Returns (entry, True) if the caller owns the key, else (existing entry, False)"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.replays += 1
+                return entry, False
+
+            entry = self._entries[key] = _Entry()
+            return entry, True
+
+    def complete(self, entry, response):
+        entry.response = response
+        entry.done.set()
+
+    def abandon(self, key, entry):
+        # Let a retry run the request again
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.done.set()
+
+    def wait(self, entry, timeout=None):
+        """Wait for an in-flight request; returns its response or None"""
+        entry.done.wait(timeout if timeout is not None else Config.IDEMPOTENCY_WAIT_TIMEOUT)
+        return entry.response
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self._entries), 'max_keys': self.max_keys, 'replays': self.replays}
+
+    def _expire(self, now):
+        # Drop expired keys, then the oldest ones until there is room for
+        # one more. An evicted request that is still running completes as
+        # usual; only a later repeat of its key would run again.
+        cutoff = now - self.ttl
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.created >= cutoff and len(self._entries) < self.max_keys:
+                break
+            del self._entries[key]
+
+# Shared by all request threads of the process
+idempotency_store = IdempotencyStore()
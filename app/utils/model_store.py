@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from datetime import datetime
+import sklearn
+from app.utils.anomaly_detector import ModelSet
+from app.utils.training_data import FEATURE_COLUMNS
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+LATEST_FILE = 'latest.json'
+
+class ModelStore:
+    """Versioned anomaly models on disk, shared by every worker process.
+
+    Each trained model is pickled to its own file. latest.json points at the
+    current one and records its version, training-data fingerprint and
+    feature schema. Both are written to a temp file and renamed into place,
+    so readers never see a partial file.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or Config.MODEL_DIR
+        self.app = None
+        self.detector = None
+        self._lock = threading.Lock()
+        self._latest_mtime = None
+        self.reloads = 0
+
+    def init_app(self, app, detector):
+        """Install the latest saved model and start watching for new versions"""
+        with self._lock:
+            if self.app is not None:
+                return
+            self.app = app
+            self.detector = detector
+            self.directory = app.config.get('MODEL_DIR', self.directory)
+
+        self.reload()
+        threading.Thread(target=self._watch, name='model-reload', daemon=True).start()
+
+    def save(self, models, features):
+        """Persist a fitted ModelSet as the latest version; returns its metadata"""
+        os.makedirs(self.directory, exist_ok=True)
+        fingerprint = fingerprint_features(features)
+        version = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{fingerprint[:8]}"
+        filename = f'model-{version}.pkl'
+
+        models = models._asdict()
+        models.pop('info')
+        payload = pickle.dumps(models, protocol=pickle.HIGHEST_PROTOCOL)
+        write_atomic(os.path.join(self.directory, filename), payload)
+
+        info = {
+            'version': version,
+            'file': filename,
+            'checksum': hashlib.sha256(payload).hexdigest(),
+            'fingerprint': fingerprint,
+            'feature_schema': FEATURE_COLUMNS,
+            'n_samples': len(features),
+            'department_models': len(models['departments']),
+            'employee_models': len(models['employees']),
+            'sklearn_version': sklearn.__version__,
+            'trained_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        write_atomic(os.path.join(self.directory, LATEST_FILE),
+                      json.dumps(info, indent=2).encode('utf-8'))
+        self._prune(keep=filename)
+        return info
+
+    def load_latest(self):
+        """Return the latest saved ModelSet (with its info), or None"""
+        try:
+            with open(os.path.join(self.directory, LATEST_FILE)) as f:
+                info = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        if info.get('feature_schema') != FEATURE_COLUMNS:
+            logger.warning('Ignoring model %s: feature schema %s does not match %s',
+                           info.get('version'), info.get('feature_schema'), FEATURE_COLUMNS)
+            return None
+        if info.get('sklearn_version') != sklearn.__version__:
+            logger.warning('Model %s was trained with scikit-learn %s, running %s',
+                           info['version'], info.get('sklearn_version'), sklearn.__version__)
+
+        with open(os.path.join(self.directory, info['file']), 'rb') as f:
+            payload = f.read()
+        if hashlib.sha256(payload).hexdigest() != info['checksum']:
+            logger.error('Ignoring model %s: checksum mismatch', info['version'])
+            return None
+
+        models = pickle.loads(payload)
+        if not isinstance(models, dict):
+            # Saved before group models existed: a bare global model
+            models = {'model': models, 'departments': {}, 'employees': {}, 'employee_departments': {}}
+        return ModelSet(info=info, **models)
+
+    def reload(self):
+        """Install the latest saved model if it differs from the one in use"""
+        path = os.path.join(self.directory, LATEST_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._latest_mtime:
+            return False
+        self._latest_mtime = mtime
+
+        try:
+            loaded = self.load_latest()
+        except Exception:
+            logger.exception('Loading the saved anomaly model failed')
+            return False
+        if loaded is None:
+            return False
+
+        info = loaded.info
+        if info['version'] == self.detector.model_version:
+            return False
+        self.detector.install_models(loaded, info)
+        self.reloads += 1
+        logger.info('Installed anomaly model %s (%d samples)', info['version'], info['n_samples'])
+        return True
+
+    def stats(self):
+        info = self.detector.model_info if self.detector else None
+        return {
+            'version': info['version'] if info else None,
+            'n_samples': info['n_samples'] if info else None,
+            'trained_at': info['trained_at'] if info else None,
+            'department_models': info.get('department_models', 0) if info else 0,
+            'employee_models': info.get('employee_models', 0) if info else 0,
+            'reloads': self.reloads
+        }
+
+    def _watch(self):
+        # Picks up models saved by other worker processes
+        while True:
+            time.sleep(self.app.config.get('MODEL_RELOAD_INTERVAL', 30))
+            self.reload()
+
+    def _prune(self, keep):
+        # Keep the newest few versions for rollback; file names sort by time
+        keep_count = self.app.config.get('MODEL_KEEP_VERSIONS', 5) if self.app else Config.MODEL_KEEP_VERSIONS
+        models = sorted(name for name in os.listdir(self.directory)
+                        if name.startswith('model-') and name.endswith('.pkl'))
+        for name in models[:-keep_count]:
+            if name != keep:
+                os.remove(os.path.join(self.directory, name))
+
+def fingerprint_features(features):
+    """sha256 of the training feature matrix"""
+    digest = hashlib.sha256()
+    digest.update(str(features.shape).encode('utf-8'))
+    digest.update(features.astype('float64').tobytes())
+    return digest.hexdigest()
+
+def write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+# Shared instance opened by init_services()
+model_store = ModelStore()
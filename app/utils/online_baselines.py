@@ -0,0 +1,252 @@
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+from app.models.models import AttendanceRecord, db
+from app.utils.anomaly_detector import record_features
+from app.utils.helpers import run_after_commit
+from app.utils.model_store import write_atomic
+from app.utils.training_data import feature_query
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Statistics kept per employee, in the order of record_features()
+BASELINE_FEATURES = ['arrival', 'departure', 'break_minutes', 'hours_worked']
+
+class OnlineBaselines:
+    """Streaming per-employee baselines: EWMA mean and variance per feature.
+
+    Each employee's state is [count, mean, variance, mean, variance, ...],
+    so updates and scoring are constant time. A record is scored against the
+    baseline before it's folded in. State is flushed to a JSON file
+    periodically and on exit. Server processes share the file: a flush
+    reads it back under a file lock and folds this process's observations
+    since the last flush into it, so every process ends up with everyone's.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.ONLINE_BASELINE_PATH
+        self.app = None
+        self.persist = False
+        self._stats = {}
+        self._unsaved = []     # (employee_id, features) observed since the last flush
+        self._replace = False  # next flush writes _stats as is (after a rebuild)
+        self._seen_version = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        self.updates = 0
+        self.last_flush = None
+
+    def init_app(self, app):
+        """Load the saved state (rebuilding it from history if there is none).
+
+        Without ONLINE_BASELINE_PERSIST the state lives in memory only.
+        """
+        if self.app is not None:
+            return
+        self.app = app
+        self.path = app.config.get('ONLINE_BASELINE_PATH', self.path)
+        # In 'model' mode nothing reads the baselines, so they aren't saved
+        self.persist = (app.config.get('ONLINE_BASELINE_PERSIST', True)
+                        and app.config.get('ANOMALY_DETECTOR_MODE', 'model') != 'model')
+
+        loaded = self.persist and self.load()
+        if not loaded and app.config.get('ANOMALY_DETECTOR_MODE', 'model') != 'model':
+            with app.app_context():
+                self.rebuild()
+            self.flush()
+
+        if self.persist:
+            threading.Thread(target=self._run_flushes, name='baseline-flush', daemon=True).start()
+            atexit.register(self.flush)
+
+    def score(self, employee_id, features):
+        """Return [(feature, deviation)] for features far from the baseline"""
+        with self._lock:
+            state = self._stats.get(employee_id)
+            if state is None or state[0] < Config.ONLINE_BASELINE_MIN_SAMPLES:
+                return []
+            state = list(state)
+
+        deviations = []
+        for i, name in enumerate(BASELINE_FEATURES):
+            mean, variance = state[1 + 2 * i], state[2 + 2 * i]
+            std = max(math.sqrt(variance), Config.ONLINE_BASELINE_MIN_STD[name])
+            deviation = features[i] - mean
+            if abs(deviation) > Config.ONLINE_BASELINE_Z_THRESHOLD * std:
+                deviations.append((name, deviation))
+        return deviations
+
+    def update(self, employee_id, features):
+        with self._lock:
+            self._update(employee_id, features)
+            if self.persist:
+                self._unsaved.append((employee_id, features))
+            self._dirty = True
+            self.updates += 1
+
+    def observe(self, record):
+        """Fold a checked-out record into its employee's baseline after commit"""
+        features = record_features(record)
+        if features is None:
+            return
+        employee_id = record.employee_id
+        run_after_commit(lambda: self.update(employee_id, features))
+
+    def rebuild(self):
+        """Recompute every baseline from history in one pass (needs an app context)"""
+        stmt = feature_query().order_by(None).order_by(AttendanceRecord.date, AttendanceRecord.id)
+        result = db.session.execute(stmt.execution_options(yield_per=Config.TRAINING_CHUNK_SIZE))
+
+        stats = {}
+        count = 0
+        try:
+            for row in result:
+                arrival, departure, break_minutes, work_minutes, _, employee_id, _ = row
+                self._update(employee_id, [arrival, departure, break_minutes, work_minutes / 60], stats)
+                count += 1
+        finally:
+            result.close()
+
+        with self._lock:
+            self._stats = stats
+            self._unsaved = []
+            self._replace = True
+            self._dirty = True
+        logger.info('Rebuilt online baselines for %d employees from %d records', len(stats), count)
+        return count
+
+    def load(self):
+        version = _version(self.path)
+        stats = self._read()
+        if stats is None:
+            return False
+
+        with self._lock:
+            self._stats = stats
+            self._seen_version = version
+            self._dirty = False
+        return True
+
+    def flush(self):
+        """Save this process's observations into the shared file and pick
+        up those other processes saved since the last flush"""
+        if not self.persist:
+            return
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty and _version(self.path) == self._seen_version:
+                    return
+                observations, self._unsaved = self._unsaved, []
+                replace, self._replace = self._replace, False
+                own = {employee_id: list(state) for employee_id, state in self._stats.items()}
+                self._dirty = False
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with _file_lock(self.path + '.lock'):
+                stats = None if replace else self._read()
+                if stats is None:
+                    stats = own
+                    changed = True
+                else:
+                    for employee_id, features in observations:
+                        self._update(employee_id, features, stats)
+                    changed = bool(observations)
+                if changed:
+                    data = {
+                        'features': BASELINE_FEATURES,
+                        'alpha': Config.ONLINE_BASELINE_ALPHA,
+                        'employees': {str(employee_id): state for employee_id, state in stats.items()}
+                    }
+                    write_atomic(self.path, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+                self._seen_version = _version(self.path)
+
+            with self._lock:
+                # Observed while saving: kept for the next flush, and applied on top
+                for employee_id, features in self._unsaved:
+                    self._update(employee_id, features, stats)
+                self._stats = stats
+            self.last_flush = time.time()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'employees': len(self._stats),
+                'updates': self.updates,
+                'dirty': self._dirty,
+                'last_flush': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.last_flush)) if self.last_flush else None
+            }
+
+    def _read(self):
+        # Saved {employee_id: state}, or None if there is no usable file
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        if data.get('features') != BASELINE_FEATURES:
+            logger.warning('Ignoring %s: saved for features %s', self.path, data.get('features'))
+            return None
+        return {int(employee_id): state for employee_id, state in data['employees'].items()}
+
+    def _update(self, employee_id, features, stats=None):
+        stats = self._stats if stats is None else stats
+        state = stats.get(employee_id)
+        if state is None:
+            # First observation: the value itself, no spread yet
+            state = [1]
+            for value in features:
+                state += [float(value), 0.0]
+            stats[employee_id] = state
+            return
+
+        alpha = Config.ONLINE_BASELINE_ALPHA
+        state[0] += 1
+        for i, value in enumerate(features):
+            mean, variance = state[1 + 2 * i], state[2 + 2 * i]
+            diff = value - mean
+            increment = alpha * diff
+            state[1 + 2 * i] = mean + increment
+            state[2 + 2 * i] = (1 - alpha) * (variance + diff * increment)
+
+    def _run_flushes(self):
+        while True:
+            time.sleep(self.app.config.get('ONLINE_BASELINE_FLUSH_INTERVAL', 60))
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Saving online baselines failed')
+
+def _version(path):
+    # Changes whenever the file is replaced
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+@contextmanager
+def _file_lock(path):
+    # Exclusive lock on a lock file, held for the with block
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        yield
+    finally:
+        os.close(fd)
+
+# Shared instance opened by init_services()
+online_baselines = OnlineBaselines()
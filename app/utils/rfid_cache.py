@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict, namedtuple
+from app.models.models import Employee
+from config.config import Config
+
+# Lightweight snapshot of the employee fields the swipe path needs. ORM objects
+# are bound to a request session, so they can't be shared between requests.
+CachedEmployee = namedtuple('CachedEmployee', ['id', 'employee_id', 'name', 'department'])
+
+class RFIDCache:
+    """Process-local LRU cache mapping RFID tags to employees"""
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or Config.RFID_CACHE_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self):
+        """Bulk load employees into the cache (call inside an app context)"""
+        rows = Employee.query.with_entities(
+            Employee.rfid_tag, Employee.id, Employee.employee_id,
+            Employee.name, Employee.department
+        ).order_by(Employee.id).limit(self.max_size).all()
+
+        with self._lock:
+            self._entries.clear()
+            for row in rows:
+                self._entries[row.rfid_tag] = CachedEmployee(
+                    row.id, row.employee_id, row.name, row.department
+                )
+        return len(rows)
+
+    def get(self, rfid_tag):
+        with self._lock:
+            entry = self._entries.get(rfid_tag)
+            if entry is not None:
+                self._entries.move_to_end(rfid_tag)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Fall back to the database outside the lock
+        employee = Employee.query.filter_by(rfid_tag=rfid_tag).first()
+        if not employee:
+            return None
+        return self.put(employee)
+
+    def put(self, employee):
+        entry = CachedEmployee(employee.id, employee.employee_id, employee.name, employee.department)
+        with self._lock:
+            self._entries[employee.rfid_tag] = entry
+            self._entries.move_to_end(employee.rfid_tag)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def discard(self, rfid_tag):
+        with self._lock:
+            self._entries.pop(rfid_tag, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+# Shared instance used by the attendance and employee APIs
+rfid_cache = RFIDCache()
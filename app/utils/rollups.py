@@ -0,0 +1,558 @@
+"""Daily summary tables, kept up to date in the same transaction as the data.
+
+DailyEmployeeSummary holds one row per employee per day with an attendance
+record or an alert; DailyDepartmentSummary adds those up per department.
+Late arrivals and early departures are the detector's own verdicts, read
+from its alerts, so the summaries agree with the alerts whatever rules
+are configured.
+The columns add up into the department rows: present, checked_out, late,
+early and anomalous are 0 or 1 for the (single) record of the day, and
+late/early stay 1 however many such alerts the day has.
+ORM events note what each change adds to or takes from its employee-day,
+and just before the transaction commits the totals are added in place to
+the employee rows and the department rows they roll up into. Bulk
+UPDATE/DELETE statements recompute the employee-days they touch instead.
+rebuild_rollups() recomputes everything, for backfills.
+"""
+import logging
+from collections import defaultdict
+from datetime import date as date_type, datetime, timedelta
+from sqlalchemy import delete, event, func, inspect, insert, select, update
+from sqlalchemy.orm import Session, object_session
+from app.models.models import (
+    Alert, AttendanceRecord, Break, DailyDepartmentSummary, DailyEmployeeSummary, Employee, db
+)
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Summary column holding the alert count of each severity
+ALERT_COLUMNS = {severity: f'alerts_{severity}' for severity in Config.SEVERITY_LEVELS.values()}
+
+# Summary flag set by any alerts of each type
+FLAG_ALERTS = {
+    Config.ALERT_TYPES['LATE_ARRIVAL']: 'late',
+    Config.ALERT_TYPES['EARLY_DEPARTURE']: 'early'
+}
+
+# Employee summary column -> department summary column it adds up into
+_DEPARTMENT_COLUMNS = {
+    'present': 'employees_present', 'hours_worked': 'hours_worked', 'break_minutes': 'break_minutes',
+    'late': 'late_count', 'early': 'early_count', 'anomalous': 'anomalous_count',
+    **{column: column for column in ALERT_COLUMNS.values()}
+}
+
+# A row is only kept while one of these is non-zero
+_EMPLOYEE_COUNTS = ('present', 'late', 'early', *ALERT_COLUMNS.values())
+
+_employee_table = DailyEmployeeSummary.__table__
+_department_table = DailyDepartmentSummary.__table__
+
+def refresh_rollups(executor, keys):
+    """Recompute the summaries of a set of (employee_id, date) keys"""
+    by_date = defaultdict(set)
+    for employee_id, date in keys:
+        by_date[date].add(employee_id)
+
+    for date, employee_ids in sorted(by_date.items()):
+        days = _collect_days(
+            executor,
+            [AttendanceRecord.date == date, AttendanceRecord.employee_id.in_(employee_ids)],
+            _alert_range(date, date) + [Alert.employee_id.in_(employee_ids)]
+        )
+
+        # Employees can move department; the old one needs recomputing too
+        departments = set(executor.execute(
+            select(DailyEmployeeSummary.department).where(
+                DailyEmployeeSummary.date == date,
+                DailyEmployeeSummary.employee_id.in_(employee_ids)
+            )
+        ).scalars())
+        departments.update(day['department'] for day in days)
+
+        executor.execute(delete(_employee_table).where(
+            _employee_table.c.date == date,
+            _employee_table.c.employee_id.in_(employee_ids)
+        ))
+        if days:
+            executor.execute(insert(_employee_table), days)
+        if departments:
+            _refresh_departments(executor, date, date, departments)
+
+def rebuild_rollups(executor=None, chunk_days=None):
+    """Recompute every summary row from the raw tables; returns
+    (employee_days, department_days). Works on a Session or a Connection."""
+    executor = executor or db.session
+    chunk_days = chunk_days or Config.ROLLUP_REBUILD_CHUNK_DAYS
+
+    executor.execute(delete(_department_table))
+    executor.execute(delete(_employee_table))
+
+    first, last = executor.execute(select(func.min(AttendanceRecord.date), func.max(AttendanceRecord.date))).one()
+    alert_first, alert_last = executor.execute(select(func.min(Alert.timestamp), func.max(Alert.timestamp))).one()
+    bounds = [value for value in (first, last, _as_date(alert_first), _as_date(alert_last)) if value is not None]
+    if not bounds:
+        return 0, 0
+
+    # A chunk of days at a time keeps memory bounded on long histories
+    start, end = min(bounds), max(bounds)
+    while start <= end:
+        chunk_end = min(start + timedelta(days=chunk_days - 1), end)
+        days = _collect_days(
+            executor,
+            [AttendanceRecord.date >= start, AttendanceRecord.date <= chunk_end],
+            _alert_range(start, chunk_end)
+        )
+        if days:
+            executor.execute(insert(_employee_table), days)
+        _refresh_departments(executor, start, chunk_end)
+        start = chunk_end + timedelta(days=1)
+
+    counts = executor.execute(select(
+        select(func.count()).select_from(_employee_table).scalar_subquery(),
+        select(func.count()).select_from(_department_table).scalar_subquery()
+    )).one()
+    logger.info('Rebuilt daily rollups: %d employee-days, %d department-days', *counts)
+    return tuple(counts)
+
+def _collect_days(executor, record_conditions, alert_conditions):
+    # Summary rows, as dicts, for the records and alerts matching the conditions
+    days = {}
+
+    record_breaks = Break.attendance_record_id == AttendanceRecord.id
+    rows = executor.execute(
+        select(
+            AttendanceRecord.employee_id, AttendanceRecord.date, Employee.department,
+            AttendanceRecord.time_out, AttendanceRecord.total_hours,
+            AttendanceRecord.is_anomaly,
+            select(func.coalesce(func.sum(Break.duration), 0)).where(record_breaks).scalar_subquery(),
+            select(func.count(Break.id)).where(record_breaks).scalar_subquery()
+        ).join(Employee, Employee.id == AttendanceRecord.employee_id).where(*record_conditions)
+    )
+    for employee_id, date, department, time_out, total_hours, is_anomaly, break_minutes, break_count in rows:
+        day = days[(employee_id, date)] = _empty_day(employee_id, date, department)
+        day.update({
+            'present': 1,
+            'checked_out': int(time_out is not None),
+            'hours_worked': total_hours or 0.0,
+            'break_minutes': float(break_minutes),
+            'break_count': break_count,
+            'anomalous': int(bool(is_anomaly))
+        })
+
+    alert_date = func.date(Alert.timestamp)
+    rows = executor.execute(
+        select(Alert.employee_id, alert_date, Employee.department, Alert.severity, Alert.alert_type, func.count())
+        .join(Employee, Employee.id == Alert.employee_id)
+        .where(*alert_conditions)
+        .group_by(Alert.employee_id, alert_date, Employee.department, Alert.severity, Alert.alert_type)
+    )
+    for employee_id, date, department, severity, alert_type, count in rows:
+        column = ALERT_COLUMNS.get(severity)
+        flag = FLAG_ALERTS.get(alert_type)
+        if column is None and flag is None:
+            continue
+        date = _as_date(date)
+        day = days.get((employee_id, date))
+        if day is None:
+            day = days[(employee_id, date)] = _empty_day(employee_id, date, department)
+        if column is not None:
+            day[column] += count
+        if flag is not None:
+            day[flag] = 1
+
+    return list(days.values())
+
+def _empty_day(employee_id, date, department):
+    day = {
+        'employee_id': employee_id, 'date': date, 'department': department,
+        'present': 0, 'checked_out': 0, 'hours_worked': 0.0, 'break_minutes': 0.0,
+        'break_count': 0, 'late': 0, 'early': 0, 'anomalous': 0
+    }
+    day.update({column: 0 for column in ALERT_COLUMNS.values()})
+    return day
+
+def _refresh_departments(executor, start, end, departments=None):
+    # Re-aggregate department-days from the employee summaries
+    conditions = [_employee_table.c.date >= start, _employee_table.c.date <= end]
+    delete_conditions = [_department_table.c.date >= start, _department_table.c.date <= end]
+    if departments is not None:
+        conditions.append(_employee_table.c.department.in_(departments))
+        delete_conditions.append(_department_table.c.department.in_(departments))
+
+    e = _employee_table.c
+    totals = select(
+        e.department, e.date, *(func.sum(e[column]) for column in _DEPARTMENT_COLUMNS)
+    ).where(*conditions).group_by(e.department, e.date)
+
+    executor.execute(delete(_department_table).where(*delete_conditions))
+    executor.execute(insert(_department_table).from_select(
+        ['department', 'date', *_DEPARTMENT_COLUMNS.values()], totals
+    ))
+
+def _alert_range(start, end):
+    # Alerts are bucketed by the date of their timestamp
+    return [
+        Alert.timestamp >= datetime.combine(start, datetime.min.time()),
+        Alert.timestamp < datetime.combine(end + timedelta(days=1), datetime.min.time())
+    ]
+
+def _as_date(value):
+    # SQLite returns date() results as strings
+    if value is None or type(value) is date_type:
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date_type.fromisoformat(str(value)[:10])
+
+# Change tracking. ORM events add up what each inserted, updated or deleted
+# row contributes to its employee-day in session.info; just before the commit
+# the totals are added to the summary rows in place. Changes that can't be
+# told as a delta (bulk statements, a record moving, an employee changing
+# department) recompute their employee-days from the raw tables instead.
+
+# Execution option for bulk statements whose caller reports the change itself
+TRACKED_OPTION = 'rollups_tracked'
+
+_RECORD_FIELDS = ('employee_id', 'date', 'time_out', 'total_hours', 'is_anomaly')
+_BREAK_FIELDS = ('attendance_record_id', 'duration')
+_ALERT_FIELDS = ('employee_id', 'timestamp', 'severity', 'alert_type')
+
+def track_closed_break(record_id, minutes):
+    """Count a break closed by an UPDATE carrying TRACKED_OPTION"""
+    _add(_pending(db.session)['records'][record_id], {'break_minutes': minutes})
+
+def _pending(session):
+    if session is None:
+        return None
+    pending = session.info.get('rollups_pending')
+    if pending is None:
+        pending = session.info['rollups_pending'] = {
+            'days': defaultdict(lambda: defaultdict(int)),
+            'records': defaultdict(lambda: defaultdict(int)),
+            'record_days': {},
+            'flags': defaultdict(set),
+            'keys': set(),
+            'employees': set()
+        }
+    return pending
+
+def _add(totals, values, sign=1):
+    for column, value in values.items():
+        totals[column] += sign * value
+
+def _record_values(values):
+    return {
+        'present': 1,
+        'checked_out': int(values['time_out'] is not None),
+        'hours_worked': values['total_hours'] or 0.0,
+        'anomalous': int(bool(values['is_anomaly']))
+    }
+
+def _break_values(values):
+    return {'break_minutes': values['duration'] or 0.0, 'break_count': 1}
+
+def _alert_values(values):
+    # Flags aren't counts; see _track_alert_insert()
+    if values['severity'] in ALERT_COLUMNS:
+        return {ALERT_COLUMNS[values['severity']]: 1}
+    return {}
+
+def _alert_day(values):
+    return values['employee_id'], _as_date(values['timestamp'])
+
+@event.listens_for(Session, 'before_commit')
+def _update_rollups(session):
+    # Changes not flushed yet only show up in the change events once they are
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    pending = session.info.pop('rollups_pending', None)
+    if not pending:
+        return
+
+    days, record_days = pending['days'], pending['record_days']
+    unresolved = set(pending['records']) - set(record_days)
+    if unresolved:
+        for record_id, employee_id, date in session.execute(
+            select(AttendanceRecord.id, AttendanceRecord.employee_id, AttendanceRecord.date)
+            .where(AttendanceRecord.id.in_(unresolved))
+        ):
+            record_days[record_id] = (employee_id, date)
+    for record_id, totals in pending['records'].items():
+        # A record deleted in bulk is recomputed through its keys
+        if record_id in record_days:
+            _add(days[record_days[record_id]], totals)
+
+    keys = set(pending['keys'])
+    if pending['employees']:
+        keys.update(session.execute(
+            select(DailyEmployeeSummary.employee_id, DailyEmployeeSummary.date)
+            .where(DailyEmployeeSummary.employee_id.in_(pending['employees']))
+        ).tuples())
+
+    deltas, flags = {}, {}
+    for key in set(days) | set(pending['flags']):
+        if key in keys or key[0] in pending['employees']:
+            keys.add(key)
+            continue
+        totals = {column: value for column, value in days.get(key, {}).items() if value}
+        if totals:
+            deltas[key] = totals
+        if pending['flags'].get(key):
+            flags[key] = pending['flags'][key]
+    if deltas or flags:
+        keys.update(_apply_deltas(session, deltas, flags))
+    if keys:
+        refresh_rollups(session, keys)
+
+def _apply_deltas(executor, deltas, flags):
+    # Add {(employee_id, date): {column: delta}} to the employee rows and the
+    # department rows they roll up into, creating rows that don't exist yet,
+    # and set {(employee_id, date): {flag}}. Returns keys left to recompute.
+    e, d = _employee_table.c, _department_table.c
+    deltas = {key: dict(totals) for key, totals in deltas.items()}
+    flags = {key: set(day_flags) for key, day_flags in flags.items()}
+    departments = {}
+    recompute = set()
+    for (employee_id, date), totals in deltas.items():
+        department = executor.execute(
+            update(_employee_table)
+            .where(e.employee_id == employee_id, e.date == date)
+            .values({column: e[column] + value for column, value in totals.items()})
+            .returning(e.department)
+        ).scalar()
+        if department is not None:
+            departments[(employee_id, date)] = department
+
+    missing = [key for key in deltas if key not in departments]
+    if missing:
+        employee_departments = {employee_id: department for employee_id, department in executor.execute(
+            select(Employee.id, Employee.department).where(Employee.id.in_({key[0] for key in missing}))
+        )}
+        rows = []
+        for employee_id, date in missing:
+            department = employee_departments.get(employee_id)
+            if department is None:
+                continue
+            row = _empty_day(employee_id, date, department)
+            _add(row, deltas[(employee_id, date)])
+            for flag in flags.pop((employee_id, date), ()):
+                row[flag] = deltas[(employee_id, date)][flag] = 1
+            rows.append(row)
+            departments[(employee_id, date)] = department
+        if rows:
+            executor.execute(insert(_employee_table), rows)
+
+    # A flag only counts once per day: set it where it isn't set yet
+    for (employee_id, date), day_flags in flags.items():
+        for flag in day_flags:
+            department = executor.execute(
+                update(_employee_table)
+                .where(e.employee_id == employee_id, e.date == date, e[flag] == 0)
+                .values({flag: 1})
+                .returning(e.department)
+            ).scalar()
+            if department is not None:
+                departments[(employee_id, date)] = department
+                deltas.setdefault((employee_id, date), {})[flag] = 1
+            elif (employee_id, date) not in departments:
+                # Already set, or no row yet
+                recompute.add((employee_id, date))
+
+    department_deltas = defaultdict(lambda: defaultdict(int))
+    for key, department in departments.items():
+        totals = department_deltas[(department, key[1])]
+        for column, value in deltas[key].items():
+            if column in _DEPARTMENT_COLUMNS:
+                totals[_DEPARTMENT_COLUMNS[column]] += value
+    for (department, date), totals in department_deltas.items():
+        totals = {column: value for column, value in totals.items() if value}
+        if not totals:
+            continue
+        result = executor.execute(
+            update(_department_table)
+            .where(d.department == department, d.date == date)
+            .values({column: d[column] + value for column, value in totals.items()})
+        )
+        if not result.rowcount:
+            executor.execute(insert(_department_table).values(department=department, date=date, **totals))
+
+    # Rows with nothing left to count go, as a rebuild wouldn't create them
+    if any(value < 0 for totals in deltas.values() for value in totals.values()):
+        dates = {date for _, date in deltas}
+        executor.execute(delete(_employee_table).where(
+            e.date.in_(dates), e.employee_id.in_({employee_id for employee_id, _ in deltas}),
+            *(e[column] == 0 for column in _EMPLOYEE_COUNTS)
+        ))
+        executor.execute(delete(_department_table).where(
+            d.date.in_(dates), d.department.in_(set(departments.values())),
+            *(d[_DEPARTMENT_COLUMNS[column]] == 0 for column in _EMPLOYEE_COUNTS)
+        ))
+    return recompute
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_rollups(session, previous_transaction):
+    session.info.pop('rollups_pending', None)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _watch_bulk_statements(orm_execute_state):
+    # Bulk UPDATE/DELETE skip the ORM events: read the keys they will touch
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get(TRACKED_OPTION):
+        return
+    mappers = {m.class_ for m in orm_execute_state.all_mappers}
+    if AttendanceRecord in mappers:
+        stmt = select(AttendanceRecord.employee_id, AttendanceRecord.date)
+    elif Break in mappers:
+        stmt = select(AttendanceRecord.employee_id, AttendanceRecord.date).join(
+            Break, Break.attendance_record_id == AttendanceRecord.id
+        )
+    elif Alert in mappers:
+        stmt = select(Alert.employee_id, Alert.timestamp)
+    else:
+        return
+
+    whereclause = orm_execute_state.statement.whereclause
+    if whereclause is not None:
+        stmt = stmt.where(whereclause)
+    session = orm_execute_state.session
+    keys = _pending(session)['keys']
+    keys.update((employee_id, _as_date(date)) for employee_id, date in session.execute(stmt))
+
+def _current(target, fields):
+    return {name: getattr(target, name) for name in fields}
+
+def _committed(connection, target, fields):
+    # Values of the fields as the database holds them before this flush.
+    # Attributes that weren't loaded are read from the row, not yet changed.
+    state = inspect(target)
+    values, unknown = {}, []
+    for name in fields:
+        history = state.attrs[name].history
+        if history.deleted:
+            values[name] = history.deleted[0]
+        elif history.unchanged:
+            values[name] = history.unchanged[0]
+        else:
+            unknown.append(name)
+    if unknown:
+        table = type(target).__table__
+        row = connection.execute(
+            select(*(table.c[name] for name in unknown)).where(table.c.id == target.id)
+        ).one()
+        values.update(zip(unknown, row))
+    return values
+
+def _changed(connection, target, fields):
+    # (old, new) values of the fields, or None if none of them changed
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in fields):
+        return None
+    old = _committed(connection, target, fields)
+    new = dict(old)
+    for name in fields:
+        added = state.attrs[name].history.added
+        if added:
+            new[name] = added[0]
+    return old, new
+
+def _track_record_insert(mapper, connection, target):
+    pending = _pending(object_session(target))
+    if pending is not None:
+        values = _current(target, _RECORD_FIELDS)
+        key = pending['record_days'][target.id] = (values['employee_id'], values['date'])
+        _add(pending['days'][key], _record_values(values))
+
+def _track_record_update(mapper, connection, target):
+    pending = _pending(object_session(target))
+    changed = pending is not None and _changed(connection, target, _RECORD_FIELDS)
+    if not changed:
+        return
+    old, new = changed
+    old_key = (old['employee_id'], old['date'])
+    key = pending['record_days'][target.id] = (new['employee_id'], new['date'])
+    if old_key != key:
+        # Its breaks move with it: recompute both days
+        pending['keys'].update((old_key, key))
+        return
+    _add(pending['days'][key], _record_values(old), -1)
+    _add(pending['days'][key], _record_values(new))
+
+def _track_record_delete(mapper, connection, target):
+    pending = _pending(object_session(target))
+    if pending is not None:
+        old = _committed(connection, target, ('employee_id', 'date'))
+        key = pending['record_days'][target.id] = (old['employee_id'], old['date'])
+        pending['keys'].add(key)
+
+def _track_break_insert(mapper, connection, target):
+    pending = _pending(object_session(target))
+    if pending is not None:
+        values = _current(target, _BREAK_FIELDS)
+        _add(pending['records'][values['attendance_record_id']], _break_values(values))
+
+def _track_break_update(mapper, connection, target):
+    pending = _pending(object_session(target))
+    changed = pending is not None and _changed(connection, target, _BREAK_FIELDS)
+    if changed:
+        old, new = changed
+        _add(pending['records'][old['attendance_record_id']], _break_values(old), -1)
+        _add(pending['records'][new['attendance_record_id']], _break_values(new))
+
+def _track_break_delete(mapper, connection, target):
+    pending = _pending(object_session(target))
+    if pending is not None:
+        old = _committed(connection, target, _BREAK_FIELDS)
+        _add(pending['records'][old['attendance_record_id']], _break_values(old), -1)
+
+def _track_alert_insert(mapper, connection, target):
+    pending = _pending(object_session(target))
+    if pending is not None:
+        values = _current(target, _ALERT_FIELDS)
+        _add(pending['days'][_alert_day(values)], _alert_values(values))
+        if values['alert_type'] in FLAG_ALERTS:
+            pending['flags'][_alert_day(values)].add(FLAG_ALERTS[values['alert_type']])
+
+def _track_alert_update(mapper, connection, target):
+    pending = _pending(object_session(target))
+    changed = pending is not None and _changed(connection, target, _ALERT_FIELDS)
+    if not changed:
+        return
+    old, new = changed
+    if old['alert_type'] in FLAG_ALERTS or new['alert_type'] in FLAG_ALERTS:
+        # Whether the flag stays set depends on the day's other alerts
+        pending['keys'].update((_alert_day(old), _alert_day(new)))
+        return
+    _add(pending['days'][_alert_day(old)], _alert_values(old), -1)
+    _add(pending['days'][_alert_day(new)], _alert_values(new))
+
+def _track_alert_delete(mapper, connection, target):
+    pending = _pending(object_session(target))
+    if pending is not None:
+        old = _committed(connection, target, _ALERT_FIELDS)
+        if old['alert_type'] in FLAG_ALERTS:
+            pending['keys'].add(_alert_day(old))
+        else:
+            _add(pending['days'][_alert_day(old)], _alert_values(old), -1)
+
+def _track_employee(mapper, connection, target):
+    pending = _pending(object_session(target))
+    if pending is not None:
+        pending['employees'].add(target.id)
+
+def _track_employee_change(mapper, connection, target):
+    if inspect(target).attrs.department.history.has_changes():
+        _track_employee(mapper, connection, target)
+
+event.listen(AttendanceRecord, 'after_insert', _track_record_insert)
+event.listen(AttendanceRecord, 'before_update', _track_record_update)
+event.listen(AttendanceRecord, 'before_delete', _track_record_delete)
+event.listen(Break, 'after_insert', _track_break_insert)
+event.listen(Break, 'before_update', _track_break_update)
+event.listen(Break, 'before_delete', _track_break_delete)
+event.listen(Alert, 'after_insert', _track_alert_insert)
+event.listen(Alert, 'before_update', _track_alert_update)
+event.listen(Alert, 'before_delete', _track_alert_delete)
+event.listen(Employee, 'after_update', _track_employee_change)
+event.listen(Employee, 'after_delete', _track_employee)
@@ -0,0 +1,434 @@
+"""Declarative anomaly rules.
+
+Rules are data: a condition over record (or break) fields, an alert type,
+a severity and a description template. They are loaded from
+ANOMALY_RULES_PATH (falling back to the shipped config/anomaly_rules.json),
+compiled once into predicates, and recompiled when the file changes.
+
+A rule looks like:
+
+    {
+        "name": "late_arrival",
+        "type": "LATE_ARRIVAL",              # key of Config.ALERT_TYPES, or a literal type
+        "severity": "MEDIUM",                # key of Config.SEVERITY_LEVELS, or a literal
+        "when": "minutes_late > LATE_THRESHOLD",
+        "values": {"excess": "minutes_late - LATE_THRESHOLD"},   # optional
+        "description": "Employee arrived {minutes_late!i} minutes late.",
+        "scope": "record"                    # or "break": evaluated once per break
+    }
+
+Conditions and values are arithmetic, comparisons and and/or/not over
+field names and upper-case Config constants, which are read when the rule
+is compiled. Descriptions are str.format templates over the fields and
+values; the !i conversion truncates to an int.
+"""
+import ast
+import json
+import logging
+import operator
+import os
+import string
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Fields available to record-scope rules. Times are relative to the
+# NORMAL_WORK_START/END of the record's date.
+RECORD_FIELDS = {
+    'minutes_late': 'minutes between the normal start and check-in (negative when early)',
+    'minutes_early': 'minutes between check-out and the normal end (0 without a check-out)',
+    'has_time_out': 'whether the employee checked out',
+    'total_hours': 'hours worked (0 when unknown)',
+    'arrival_minute': 'minute of the day of check-in',
+    'departure_minute': 'minute of the day of check-out (0 without a check-out)',
+    'break_count': 'number of breaks',
+    'break_minutes': 'total break minutes'
+}
+
+# Break-scope rules see the record fields plus these
+BREAK_FIELDS = {
+    'break_duration': 'minutes of this break (0 while it is open)'
+}
+
+# The rules shipped with the app, used whenever ANOMALY_RULES_PATH is missing
+DEFAULT_RULES_PATH = os.path.join(Config.BASE_DIR, 'config', 'anomaly_rules.json')
+
+def load_default_rules():
+    """Rule definitions from DEFAULT_RULES_PATH.
+
+    Raises RuleError if the file can't be read, so a broken install fails
+    at startup instead of scoring every record without rules.
+    """
+    try:
+        with open(DEFAULT_RULES_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise RuleError(f'Cannot read the default anomaly rules {DEFAULT_RULES_PATH}: {e}')
+
+@lru_cache(maxsize=None)
+def _clock_time(value):
+    # NORMAL_WORK_START/END are 'HH:MM' strings; parse each value only once
+    return datetime.strptime(value, '%H:%M').time()
+
+def record_fields(record):
+    """Field values of one checked-in record, as plain Python numbers"""
+    start = datetime.combine(record.date, _clock_time(Config.NORMAL_WORK_START))
+    fields = {
+        'minutes_late': (record.time_in - start).total_seconds() / 60,
+        'minutes_early': 0.0,
+        'has_time_out': False,
+        'total_hours': record.total_hours or 0,
+        'arrival_minute': record.time_in.hour * 60 + record.time_in.minute,
+        'departure_minute': 0,
+        'break_count': len(record.breaks),
+        'break_minutes': sum(b.duration or 0 for b in record.breaks)
+    }
+    if record.time_out:
+        end = datetime.combine(record.date, _clock_time(Config.NORMAL_WORK_END))
+        fields['minutes_early'] = (end - record.time_out).total_seconds() / 60
+        fields['has_time_out'] = True
+        fields['departure_minute'] = record.time_out.hour * 60 + record.time_out.minute
+    return fields
+
+class _Formatter(string.Formatter):
+    def convert_field(self, value, conversion):
+        if conversion == 'i':
+            return int(value)
+        return super().convert_field(value, conversion)
+
+_formatter = _Formatter()
+
+class RuleError(ValueError):
+    """A rule definition that can't be compiled"""
+
+# Expression compiler: turns a parsed expression into a function of a field
+# mapping. Scalar functions use plain Python logic for single records; vector
+# functions use NumPy's elementwise logic for columns.
+_BINARY = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+           ast.Div: operator.truediv, ast.Mod: operator.mod}
+_COMPARE = {ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Lt: operator.lt,
+            ast.LtE: operator.le, ast.Eq: operator.eq, ast.NotEq: operator.ne}
+
+def _all(values):
+    return all(values)
+
+def _any(values):
+    return any(values)
+
+def _vector_all(values):
+    return np.logical_and.reduce(values)
+
+def _vector_any(values):
+    return np.logical_or.reduce(values)
+
+def compile_expression(source, fields, vector=False):
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as e:
+        raise RuleError(f'Invalid expression {source!r}: {e.msg}')
+    return _compile_node(tree.body, fields, source, vector)
+
+def _compile_node(node, fields, source, vector):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, bool)):
+        return _constant(node.value)
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name.isupper():
+            value = getattr(Config, name, None)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise RuleError(f'{name} in {source!r} is not a numeric Config setting')
+            return _constant(value)
+        if name not in fields:
+            raise RuleError(f'Unknown field {name!r} in {source!r}')
+        return lambda f: f[name]
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        op = _BINARY[type(node.op)]
+        left = _compile_node(node.left, fields, source, vector)
+        right = _compile_node(node.right, fields, source, vector)
+        if hasattr(left, 'constant') and hasattr(right, 'constant'):
+            # Thresholds like NORMAL_BREAK_DURATION * ABNORMAL_BREAK_THRESHOLD
+            # are worked out once, here
+            return _constant(op(left.constant, right.constant))
+        return lambda f: op(left(f), right(f))
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        operand = _compile_node(node.operand, fields, source, vector)
+        if hasattr(operand, 'constant'):
+            return _constant(-operand.constant)
+        return lambda f: -operand(f)
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        operand = _compile_node(node.operand, fields, source, vector)
+        if vector:
+            return lambda f: np.logical_not(operand(f))
+        return lambda f: not operand(f)
+
+    if isinstance(node, ast.BoolOp):
+        combine = (_vector_all if vector else _all) if isinstance(node.op, ast.And) else \
+                  (_vector_any if vector else _any)
+        operands = [_compile_node(value, fields, source, vector) for value in node.values]
+        if vector:
+            return lambda f: combine([operand(f) for operand in operands])
+        # Generator, so scalar and/or short-circuit
+        return lambda f: combine(operand(f) for operand in operands)
+
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+        terms = [_compile_node(node.left, fields, source, vector)] + \
+                [_compile_node(comparator, fields, source, vector) for comparator in node.comparators]
+        ops = [_COMPARE[type(op)] for op in node.ops]
+        if len(ops) == 1:
+            op, left, right = ops[0], terms[0], terms[1]
+            return lambda f: op(left(f), right(f))
+        combine = _vector_all if vector else _all
+        def evaluate(f):
+            values = [term(f) for term in terms]
+            return combine([ops[i](values[i], values[i + 1]) for i in range(len(ops))])
+        return evaluate
+
+    raise RuleError(f'Unsupported syntax {ast.dump(node)} in {source!r}')
+
+def _constant(value):
+    evaluate = lambda f: value
+    evaluate.constant = value
+    return evaluate
+
+class CompiledRule:
+    __slots__ = ('name', 'scope', 'alert_type', 'severity', 'predicate', 'vector_predicate',
+                 'values', 'vector_values', 'description')
+
+    def __init__(self, definition):
+        try:
+            self.name = definition['name']
+            self.scope = definition.get('scope', 'record')
+            if self.scope not in ('record', 'break'):
+                raise RuleError(f"Rule {self.name!r}: scope must be 'record' or 'break'")
+            fields = dict(RECORD_FIELDS, **BREAK_FIELDS) if self.scope == 'break' else dict(RECORD_FIELDS)
+
+            self.alert_type = Config.ALERT_TYPES.get(definition['type'], definition['type'])
+            self.severity = Config.SEVERITY_LEVELS.get(definition['severity'], definition['severity'])
+            self.predicate = compile_expression(definition['when'], fields)
+            self.vector_predicate = compile_expression(definition['when'], fields, vector=True)
+            values = definition.get('values', {})
+            self.values = {name: compile_expression(expression, fields)
+                           for name, expression in values.items()}
+            self.vector_values = {name: compile_expression(expression, fields, vector=True)
+                                  for name, expression in values.items()}
+            self.description = definition['description']
+        except KeyError as e:
+            raise RuleError(f'Rule {definition.get("name", definition)!r} is missing {e.args[0]!r}')
+
+        # Catch template typos now rather than on the first match
+        sample = {name: 0 for name in list(fields) + list(self.values)}
+        try:
+            _formatter.format(self.description, **sample)
+        except (KeyError, ValueError, IndexError) as e:
+            raise RuleError(f'Rule {self.name!r}: bad description template: {e}')
+
+    def alert(self, context):
+        return {
+            'type': self.alert_type,
+            'severity': self.severity,
+            'description': _formatter.format(self.description, **context)
+        }
+
+class RuleEngine:
+    """Evaluates the compiled rule set against records, one or many at a time"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._rules = self._compile(load_default_rules())
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._timings = {}
+        self.source = 'defaults'
+        self.reload_errors = 0
+
+    @property
+    def rules(self):
+        self.maybe_reload()
+        return self._rules
+
+    def maybe_reload(self):
+        """Recompile if the rules file changed (checked every few seconds)"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + Config.ANOMALY_RULES_RELOAD_INTERVAL
+        return self.reload()
+
+    def reload(self, force=False):
+        path = self.path or Config.ANOMALY_RULES_PATH
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        except OSError as e:
+            return self._reload_failed(path, e)
+        if mtime == self._mtime and not force:
+            return False
+
+        try:
+            if mtime is None:
+                rules, source = self._compile(load_default_rules()), 'defaults'
+            else:
+                with open(path) as f:
+                    rules, source = self._compile(json.load(f)), path
+        except OSError as e:
+            # Possibly transient: try again at the next check
+            return self._reload_failed(path, e)
+        except (ValueError, RuleError) as e:
+            # Bad contents: wait for the file to change
+            self._mtime = mtime
+            return self._reload_failed(path, e)
+        self._mtime = mtime
+
+        self._rules = rules
+        self.source = source
+        logger.info('Loaded %d anomaly rules from %s', len(rules), source)
+        return True
+
+    def _reload_failed(self, path, error):
+        # Keep scoring with the rules we have
+        self.reload_errors += 1
+        logger.error('Not reloading anomaly rules from %s: %s', path, error)
+        return False
+
+    def evaluate(self, record):
+        """Alerts for one checked-in record, in rule order"""
+        fields = record_fields(record)
+        breaks = None
+        anomalies = []
+        timings = []
+        for rule in self.rules:
+            started = time.perf_counter()
+            if rule.scope == 'break':
+                if breaks is None:
+                    breaks = [dict(fields, break_duration=b.duration or 0) for b in record.breaks]
+                matched = 0
+                for break_fields in breaks:
+                    if rule.predicate(break_fields):
+                        anomalies.append(rule.alert(_context(rule, break_fields)))
+                        matched += 1
+            else:
+                matched = int(bool(rule.predicate(fields)))
+                if matched:
+                    anomalies.append(rule.alert(_context(rule, fields)))
+            timings.append((rule.name, 1, time.perf_counter() - started, matched))
+        self._record_timings(timings)
+        return anomalies
+
+    def evaluate_batch(self, records):
+        """Alerts for many checked-in records; same result as evaluate() on each.
+
+        Field extraction is one Python pass over the records; each rule is
+        then evaluated once over whole NumPy columns.
+        """
+        n = len(records)
+        results = [[] for _ in range(n)]
+        if n == 0:
+            return results
+
+        rows = [record_fields(record) for record in records]
+        columns = {name: np.array([row[name] for row in rows]) for name in RECORD_FIELDS}
+        owners = []
+        durations = []
+        for i, record in enumerate(records):
+            for break_record in record.breaks:
+                owners.append(i)
+                durations.append(break_record.duration or 0)
+        owners = np.asarray(owners, dtype=np.int64)
+        break_columns = None
+
+        # Evaluate rule by rule, then collect matches per record in rule order
+        matches = []
+        timings = []
+        for rule in self.rules:
+            started = time.perf_counter()
+            if rule.scope == 'break':
+                if break_columns is None:
+                    break_columns = {name: column[owners] for name, column in columns.items()}
+                    break_columns['break_duration'] = np.asarray(durations, dtype=np.float64)
+                hits = _mask(rule.vector_predicate(break_columns), len(owners))
+                source, hit_rows = break_columns, np.flatnonzero(hits)
+                owner_rows = owners[hit_rows]
+            else:
+                hits = _mask(rule.vector_predicate(columns), n)
+                source, hit_rows = columns, np.flatnonzero(hits)
+                owner_rows = hit_rows
+            values = {name: value(source) for name, value in rule.vector_values.items()}
+            matches.append((rule, source, values, hit_rows.tolist(), owner_rows.tolist()))
+            timings.append((rule.name, n, time.perf_counter() - started, len(hit_rows)))
+
+        # Break hits are in break order, which is the order evaluate() uses
+        per_record = [[] for _ in range(n)]
+        for rule_index, (rule, source, values, hit_rows, owner_rows) in enumerate(matches):
+            for row, owner in zip(hit_rows, owner_rows):
+                per_record[owner].append((rule_index, row))
+        for i in range(n):
+            for rule_index, row in per_record[i]:
+                rule, source, values, _, _ = matches[rule_index]
+                context = {name: _item(column[row]) for name, column in source.items()}
+                context.update({name: _item(_at(value, row)) for name, value in values.items()})
+                results[i].append(rule.alert(context))
+
+        self._record_timings(timings)
+        return results
+
+    def stats(self):
+        with self._lock:
+            timings = {
+                name: {
+                    'records': records,
+                    'matches': matched,
+                    'total_ms': round(seconds * 1000, 3),
+                    'us_per_record': round(seconds * 1e6 / records, 3) if records else None
+                }
+                for name, (records, seconds, matched) in self._timings.items()
+            }
+        return {
+            'source': self.source,
+            'rules': [rule.name for rule in self._rules],
+            'reload_errors': self.reload_errors,
+            'timings': timings
+        }
+
+    def _compile(self, definitions):
+        if not isinstance(definitions, list):
+            raise RuleError('Rules must be a JSON list')
+        rules = tuple(CompiledRule(definition) for definition in definitions)
+        names = [rule.name for rule in rules]
+        if len(set(names)) != len(names):
+            raise RuleError('Rule names must be unique')
+        return rules
+
+    def _record_timings(self, timings):
+        with self._lock:
+            for name, records, seconds, matched in timings:
+                total = self._timings.get(name, (0, 0.0, 0))
+                self._timings[name] = (total[0] + records, total[1] + seconds, total[2] + matched)
+
+def _context(rule, fields):
+    context = dict(fields)
+    context.update({name: value(fields) for name, value in rule.values.items()})
+    return context
+
+def _mask(result, size):
+    # Constant expressions evaluate to a scalar
+    return np.broadcast_to(np.asarray(result, dtype=bool), (size,))
+
+def _at(value, row):
+    return value[row] if np.ndim(value) else value
+
+def _item(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+# Shared by every AnomalyDetector
+rule_engine = RuleEngine()
@@ -0,0 +1,427 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from app.models.models import JournalCheckpoint, db
+from app.utils.helpers import batched_anomaly_scoring, unit_of_work
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+class CheckpointMoved(Exception):
+    """The checkpoint row changed outside this process"""
+
+class SwipeJournal:
+    """Append-only, fsynced log of raw swipes.
+
+    Every swipe is written here before it touches the database. Concurrent
+    writers share fsyncs: whoever finds no sync in flight becomes the leader,
+    waits a moment for others to append, then syncs for the whole group.
+
+    Entries are applied in sequence order. The applied sequence number is
+    stored in JournalCheckpoint and updated in the same transaction as the
+    swipes, so an entry is applied exactly once even across crashes. Entries
+    that can't be applied (e.g. the database is locked) stay pending and are
+    retried by a background thread and on the next startup. An entry that
+    fails for another reason is retried on its own right away, and set
+    aside as rejected after SWIPE_JOURNAL_MAX_ATTEMPTS failures.
+
+    Each server process needs a journal of its own, since sequence numbers
+    and the checkpoint row belong to one file. init_app() takes an
+    exclusive lock on SWIPE_JOURNAL_PATH, or on the first free of
+    swipe_journal.1.log, swipe_journal.2.log, ... next to it when another
+    process holds that one. After a restart a process picks up whichever
+    free journal it locks first, along with that journal's unapplied entries,
+    and applies what is left in the others that no process holds.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.SWIPE_JOURNAL_PATH
+        self.name = os.path.basename(self.path)
+        self.enabled = False
+        self.app = None
+        self.apply_entry = None
+        self.applied_seq = 0
+
+        self._fd = None
+        self._lock_fd = None
+        self._cond = threading.Condition()
+        self._apply_lock = threading.Lock()
+        self._written_seq = 0
+        self._durable_seq = 0
+        self._syncing = False
+        self._pending = {}
+        self._attempts = {}
+        self._waiting = set()
+        self._results = {}
+        self._orphans = []
+
+        # Metrics
+        self.fsyncs = 0
+        self.synced_entries = 0
+        self.rejected = 0
+
+    def init_app(self, app, apply_entry):
+        """Open the journal, replay unapplied swipes and start the retry thread.
+
+        apply_entry(entry) stages one swipe and returns its (body, status) result.
+        """
+        if self.enabled or not app.config.get('SWIPE_JOURNAL_ENABLED', True):
+            return
+
+        self.app = app
+        self.apply_entry = apply_entry
+        path = app.config.get('SWIPE_JOURNAL_PATH', self.path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path, self._lock_fd = _claim_journal(path)
+        self.name = os.path.basename(self.path)
+        if self.path != path:
+            logger.info('%s is in use by another process, journaling to %s', path, self.path)
+
+        self._open()
+        # Swipes left in journals of processes that died
+        self._orphans = self._adopt_orphans(path)
+
+        threading.Thread(target=self._run_retries, name='swipe-journal-retry', daemon=True).start()
+
+    def record(self, events):
+        """Append events durably; returns their sequence numbers"""
+        with self._cond:
+            seqs = []
+            lines = []
+            for event in events:
+                self._written_seq += 1
+                entry = dict(event, seq=self._written_seq)
+                lines.append(json.dumps(entry, separators=(',', ':')) + '\n')
+                self._pending[entry['seq']] = entry
+                self._waiting.add(entry['seq'])
+                seqs.append(entry['seq'])
+            os.write(self._fd, ''.join(lines).encode('utf-8'))
+            target = self._written_seq
+
+        self._wait_durable(target)
+        return seqs
+
+    def apply(self, seqs):
+        """Apply journaled entries up to the last of seqs.
+
+        Returns {seq: (body, status)}, with None for entries that the
+        database couldn't take right now; those stay pending for the retry
+        thread. Returns None when none of seqs could be applied.
+        """
+        try:
+            self.apply_pending(upto=max(seqs))
+        except OperationalError as e:
+            with self._cond:
+                self._waiting.difference_update(seqs)
+                # Applying one at a time may have committed some before failing
+                results = {seq: self._results.pop(seq, None) for seq in seqs}
+            deferred = [seq for seq, result in results.items() if result is None]
+            logger.warning('Deferring %d journaled swipes: %s', len(deferred), e)
+            return results if len(deferred) < len(seqs) else None
+
+        with self._cond:
+            self._waiting.difference_update(seqs)
+            return {seq: self._results.pop(seq, None) for seq in seqs}
+
+    def apply_pending(self, upto=None):
+        with self._apply_lock:
+            with self._cond:
+                limit = self._durable_seq if upto is None else min(upto, self._durable_seq)
+                batch = [self._pending[seq] for seq in sorted(self._pending) if seq <= limit]
+            if batch:
+                self._apply_group(batch)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'enabled': self.enabled,
+                'journal': self.name,
+                'written_seq': self._written_seq,
+                'durable_seq': self._durable_seq,
+                'applied_seq': self.applied_seq,
+                'pending': len(self._pending),
+                'fsyncs': self.fsyncs,
+                'avg_group_size': round(self.synced_entries / self.fsyncs, 2) if self.fsyncs else None,
+                'rejected': self.rejected
+            }
+
+    def _open(self):
+        # Load the checkpoint, queue unapplied entries and replay them
+        with self.app.app_context():
+            self.applied_seq, created = self._load_checkpoint()
+
+        entries = self._read_entries()
+        last_seq = max([self.applied_seq] + [entry['seq'] for entry in entries])
+        if created and entries:
+            # The checkpoint row is created before the first swipe is accepted,
+            # so these entries were written against a different database
+            logger.warning('Ignoring %d entries in %s: no checkpoint for this journal in the database',
+                           len(entries), self.path)
+            with self.app.app_context(), unit_of_work():
+                self._advance_checkpoint(last_seq)
+            self.applied_seq = last_seq
+
+        self._written_seq = self._durable_seq = last_seq
+        for entry in entries:
+            if entry['seq'] > self.applied_seq:
+                self._pending[entry['seq']] = entry
+
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.enabled = True
+
+        if self._pending:
+            logger.info('Replaying %d unapplied swipes from %s', len(self._pending), self.path)
+            self._retry_pending()
+
+    def _adopt_orphans(self, path):
+        # A numbered journal nobody holds belonged to a process that died;
+        # its swipes would wait until another process claims that number.
+        # Lock it and apply them, retrying with our own pending entries.
+        orphans = []
+        for candidate in _sibling_journals(path):
+            if candidate == self.path:
+                continue
+            lock_fd = _try_lock(candidate + '.lock')
+            if lock_fd is None:
+                continue
+            orphan = SwipeJournal(candidate)
+            orphan.app, orphan.apply_entry, orphan._lock_fd = self.app, self.apply_entry, lock_fd
+            orphan._open()
+            if orphan._pending:
+                orphans.append(orphan)
+            else:
+                orphan._close()
+        return orphans
+
+    def _close(self):
+        self.enabled = False
+        os.close(self._fd)
+        os.close(self._lock_fd)
+
+    def _apply_group(self, batch, resynced=False):
+        try:
+            # Check-outs in the group share one model pass; waiting on the
+            # batch scorer here would hold the apply lock for every one
+            with unit_of_work(), batched_anomaly_scoring():
+                results = [(entry['seq'], self.apply_entry(entry)) for entry in batch]
+                self._advance_checkpoint(batch[-1]['seq'])
+        except OperationalError:
+            raise
+        except CheckpointMoved:
+            self._resync_checkpoint()
+            if not resynced:
+                self._apply_group(batch, resynced=True)
+            return
+        except Exception:
+            if len(batch) > 1:
+                # Find the entry that fails by applying one at a time
+                for entry in batch:
+                    self._apply_group([entry])
+                return
+            logger.warning('Applying journaled swipe %s failed', batch[0]['seq'], exc_info=True)
+            if self._record_failure(batch[0]):
+                return
+            # The rollback marked the state the swipe read as stale, so the
+            # next attempt reads the database instead of the cache
+            self._apply_group(batch)
+            return
+
+        self._mark_applied(batch[-1]['seq'], results)
+
+    def _advance_checkpoint(self, seq):
+        # Conditional update: fails if another process moved the checkpoint
+        result = db.session.execute(
+            update(JournalCheckpoint)
+            .where(JournalCheckpoint.journal == self.name,
+                   JournalCheckpoint.applied_seq == self.applied_seq)
+            .values(applied_seq=seq)
+        )
+        if result.rowcount != 1:
+            raise CheckpointMoved()
+
+    def _mark_applied(self, seq, results):
+        with self._cond:
+            self.applied_seq = seq
+            for applied in [s for s in self._pending if s <= seq]:
+                del self._pending[applied]
+                self._attempts.pop(applied, None)
+            for entry_seq, result in results:
+                if entry_seq in self._waiting:
+                    self._results[entry_seq] = result
+            self._maybe_compact()
+
+    def _record_failure(self, entry):
+        # Returns whether the entry was rejected
+        seq = entry['seq']
+        self._attempts[seq] = self._attempts.get(seq, 0) + 1
+        if self._attempts[seq] < self.app.config.get('SWIPE_JOURNAL_MAX_ATTEMPTS', 3):
+            return False
+
+        # Don't let one bad entry block every swipe behind it
+        logger.error('Rejecting journaled swipe %s after %d failed attempts', seq, self._attempts[seq])
+        with open(self.path + '.rejected', 'a') as rejected:
+            rejected.write(json.dumps(entry) + '\n')
+        with unit_of_work():
+            self._advance_checkpoint(seq)
+        self.rejected += 1
+        self._mark_applied(seq, [(seq, ({'error': 'Swipe could not be applied'}, 500))])
+        return True
+
+    def _load_checkpoint(self):
+        # Returns (applied_seq, whether the checkpoint row was just created)
+        checkpoint = db.session.get(JournalCheckpoint, self.name)
+        if checkpoint:
+            return checkpoint.applied_seq, False
+        try:
+            with unit_of_work():
+                db.session.add(JournalCheckpoint(journal=self.name, applied_seq=0))
+        except IntegrityError:
+            # Created concurrently by another process
+            return db.session.get(JournalCheckpoint, self.name).applied_seq, False
+        return 0, True
+
+    def _resync_checkpoint(self):
+        # Only this process writes this journal, so its pending entries
+        # haven't been applied whatever the row says; they stay pending
+        # and move the checkpoint on from its new value.
+        with self.app.app_context():
+            db.session.expire_all()
+            applied_seq, _ = self._load_checkpoint()
+        with self._cond:
+            logger.warning('Journal %s checkpoint was moved to %s outside this process; %d swipes still to apply',
+                           self.name, applied_seq, len(self._pending))
+            self.applied_seq = applied_seq
+
+    def _wait_durable(self, target):
+        with self._cond:
+            while self._durable_seq < target:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+
+                # Become the leader and sync for everyone written so far
+                self._syncing = True
+                sync_to = None
+                self._cond.release()
+                try:
+                    window = self.app.config.get('SWIPE_JOURNAL_GROUP_COMMIT_WINDOW', 0)
+                    if window:
+                        time.sleep(window)
+                    with self._cond:
+                        sync_to = self._written_seq
+                    os.fsync(self._fd)
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    if sync_to is not None and sync_to > self._durable_seq:
+                        self.synced_entries += sync_to - self._durable_seq
+                        self._durable_seq = sync_to
+                        self.fsyncs += 1
+                    self._cond.notify_all()
+
+    def _maybe_compact(self):
+        # Called with self._cond held. Once every entry is applied the
+        # contents are redundant; sequence numbers carry on from the checkpoint.
+        if self._pending or self._written_seq != self.applied_seq:
+            return
+        if os.fstat(self._fd).st_size < self.app.config.get('SWIPE_JOURNAL_COMPACT_BYTES', 0):
+            return
+        os.ftruncate(self._fd, 0)
+        os.fsync(self._fd)
+
+    def _read_entries(self):
+        if not os.path.exists(self.path):
+            return []
+
+        entries = []
+        good_bytes = 0
+        with open(self.path, 'rb') as journal:
+            data = journal.read()
+
+        for line in data.splitlines(keepends=True):
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError('incomplete line')
+                entries.append(json.loads(line))
+                good_bytes += len(line)
+            except ValueError:
+                if good_bytes + len(line) >= len(data):
+                    # Torn write from a crash: drop the partial tail
+                    logger.warning('Truncating partial entry at the end of %s', self.path)
+                    with open(self.path, 'r+b') as journal:
+                        journal.truncate(good_bytes)
+                    break
+                logger.error('Skipping unreadable entry in %s', self.path)
+                good_bytes += len(line)
+        return entries
+
+    def _retry_pending(self):
+        try:
+            with self.app.app_context():
+                self.apply_pending()
+        except OperationalError as e:
+            logger.warning('Database still unavailable for journaled swipes: %s', e)
+        except Exception:
+            logger.exception('Applying journaled swipes failed')
+
+    def _run_retries(self):
+        while True:
+            time.sleep(self.app.config.get('SWIPE_JOURNAL_RETRY_INTERVAL', 5))
+            if self._pending:
+                self._retry_pending()
+            for orphan in list(self._orphans):
+                orphan._retry_pending()
+                if not orphan._pending:
+                    orphan._close()
+                    self._orphans.remove(orphan)
+
+def _claim_journal(path):
+    """Lock path, or the first free numbered journal next to it.
+
+    Returns (journal path, lock file descriptor); the lock is held for as
+    long as the descriptor stays open.
+    """
+    root, ext = os.path.splitext(path)
+    slot = 0
+    while True:
+        candidate = path if slot == 0 else f'{root}.{slot}{ext}'
+        fd = _try_lock(candidate + '.lock')
+        if fd is not None:
+            return candidate, fd
+        slot += 1
+
+def _sibling_journals(path):
+    # path and the numbered journals next to it that exist, in slot order
+    root, ext = os.path.splitext(path)
+    slots = {0: path} if os.path.exists(path) else {}
+    for candidate in glob.glob(glob.escape(root) + '.*' + glob.escape(ext)):
+        slot = candidate[len(root) + 1:len(candidate) - len(ext)]
+        if slot.isdigit():
+            slots[int(slot)] = candidate
+    return [slots[slot] for slot in sorted(slots)]
+
+def _try_lock(path):
+    # Exclusive lock on a lock file; None while another process holds it
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+# Shared instance opened by init_services()
+swipe_journal = SwipeJournal()
@@ -0,0 +1,93 @@
+import threading
+from bisect import insort
+from collections import deque
+from datetime import timedelta
+from config.config import Config
+
+class SwipeWindow:
+    """Per-employee sliding window of recent swipe timestamps.
+
+    Each employee gets a time-ordered deque. Expired entries are dropped from
+    the left whenever that employee swipes, so a multiple-swipe check costs
+    O(k) in that employee's own recent swipes rather than every swipe in the
+    building. Employees that stop swiping are swept out periodically so memory
+    stays bounded by the number of recently active employees.
+
+    Swipes are recorded while they are applied, before the transaction
+    commits. A journaled swipe carries its sequence number as swipe_id, so
+    applying it again after a rollback doesn't count it twice.
+    """
+
+    def __init__(self, window_minutes=None, max_per_employee=None, sweep_interval=None):
+        self.window = timedelta(minutes=window_minutes or Config.TIME_WINDOW_FOR_MULTIPLE_SWIPES)
+        self.max_per_employee = max_per_employee or Config.SWIPE_WINDOW_MAX_PER_EMPLOYEE
+        self.sweep_interval = sweep_interval or Config.SWIPE_WINDOW_SWEEP_INTERVAL
+        self._swipes = {}
+        self._lock = threading.Lock()
+        self._ops_since_sweep = 0
+
+    def record(self, employee_id, timestamp, swipe_id=None):
+        """Add a swipe and return how many swipes the employee has in the window"""
+        with self._lock:
+            swipes = self._swipes.get(employee_id)
+            if swipes is None:
+                swipes = self._swipes[employee_id] = deque(maxlen=self.max_per_employee)
+
+            # Entries are (timestamp, swipe_id or 0), so they sort by time.
+            # A journaled swipe applied again after a rollback is already in.
+            entry = (timestamp, swipe_id or 0)
+            if not (swipe_id and entry in swipes):
+                self._insert(swipes, entry)
+
+            self._expire(swipes, timestamp)
+            count = self._count(swipes, timestamp)
+
+            self._ops_since_sweep += 1
+            if self._ops_since_sweep >= self.sweep_interval:
+                self._sweep(timestamp)
+
+            return count
+
+    def count(self, employee_id, timestamp):
+        with self._lock:
+            swipes = self._swipes.get(employee_id)
+            if not swipes:
+                return 0
+            return self._count(swipes, timestamp)
+
+    def clear(self):
+        with self._lock:
+            self._swipes.clear()
+            self._ops_since_sweep = 0
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(swipes) for swipes in self._swipes.values())
+
+    def _insert(self, swipes, entry):
+        if not swipes or swipes[-1] <= entry:
+            swipes.append(entry)
+            return
+        # Reader-supplied timestamps can arrive slightly out of order
+        ordered = list(swipes)
+        insort(ordered, entry)
+        swipes.clear()
+        swipes.extend(ordered[-self.max_per_employee:])
+
+    def _expire(self, swipes, now):
+        cutoff = now - self.window
+        while swipes and swipes[0][0] < cutoff:
+            swipes.popleft()
+
+    def _count(self, swipes, now):
+        # Swipes later than `now` (out-of-order batches) don't count towards it
+        cutoff = now - self.window
+        return sum(1 for ts, _ in swipes if cutoff <= ts <= now)
+
+    def _sweep(self, now):
+        cutoff = now - self.window
+        idle = [emp_id for emp_id, swipes in self._swipes.items()
+                if not swipes or swipes[-1][0] < cutoff]
+        for emp_id in idle:
+            del self._swipes[emp_id]
+        self._ops_since_sweep = 0
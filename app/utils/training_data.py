@@ -0,0 +1,214 @@
+import numpy as np
+from collections import namedtuple
+from sqlalchemy import extract, func, select
+from app.models.models import AttendanceRecord, Break, Employee, db
+from config.config import Config
+
+# Column order of the feature matrix, same as AnomalyDetector._extract_features()
+FEATURE_COLUMNS = [
+    'time_in_minutes', 'time_out_minutes', 'total_breaks_duration',
+    'work_duration', 'break_count'
+]
+
+# Feature matrix plus, per row, the employee (primary key) and department it
+# belongs to, for training per-group models
+TrainingSet = namedtuple('TrainingSet', ['features', 'employee_ids', 'departments'])
+
+def _break_totals():
+    return select(
+        Break.attendance_record_id.label('record_id'),
+        func.coalesce(func.sum(Break.duration), 0).label('total_duration'),
+        func.count(Break.id).label('count')
+    ).group_by(Break.attendance_record_id).subquery()
+
+def feature_query():
+    """One row of model features per completed attendance record.
+
+    Break sums and counts are aggregated in the database, so no ORM objects
+    or per-record break queries are needed. The last two columns are the
+    employee id and department.
+    """
+    breaks = _break_totals()
+    return select(
+        extract('hour', AttendanceRecord.time_in) * 60 + extract('minute', AttendanceRecord.time_in),
+        extract('hour', AttendanceRecord.time_out) * 60 + extract('minute', AttendanceRecord.time_out),
+        func.coalesce(breaks.c.total_duration, 0),
+        func.coalesce(AttendanceRecord.total_hours, 0) * 60,
+        func.coalesce(breaks.c.count, 0),
+        AttendanceRecord.employee_id,
+        Employee.department
+    ).outerjoin(
+        breaks, breaks.c.record_id == AttendanceRecord.id
+    ).outerjoin(
+        Employee, Employee.id == AttendanceRecord.employee_id
+    ).where(
+        AttendanceRecord.time_in.isnot(None),
+        AttendanceRecord.time_out.isnot(None)
+    ).order_by(AttendanceRecord.id)
+
+def count_feature_rows():
+    return db.session.execute(
+        select(func.count()).select_from(AttendanceRecord).where(
+            AttendanceRecord.time_in.isnot(None),
+            AttendanceRecord.time_out.isnot(None)
+        )
+    ).scalar()
+
+def iter_feature_chunks(chunk_size=None):
+    """Yield TrainingSet chunks of at most chunk_size rows"""
+    chunk_size = chunk_size or Config.TRAINING_CHUNK_SIZE
+    width = len(FEATURE_COLUMNS)
+    result = db.session.execute(feature_query().execution_options(yield_per=chunk_size))
+    try:
+        for rows in result.partitions():
+            columns = list(zip(*rows))
+            yield TrainingSet(
+                np.array(columns[:width], dtype=np.float64).T,
+                columns[width],
+                columns[width + 1]
+            )
+    finally:
+        result.close()
+
+def load_training_set(chunk_size=None, progress=None):
+    """Build the full training set without materializing records.
+
+    Memory is the matrix itself plus one chunk of rows. Rows inserted after
+    the count are left out. progress(rows_loaded, total_rows) is called
+    after each chunk.
+    """
+    total = count_feature_rows()
+    features = np.empty((total, len(FEATURE_COLUMNS)), dtype=np.float64)
+    employee_ids = np.empty(total, dtype=np.int64)
+    departments = np.empty(total, dtype=object)
+    if progress:
+        progress(0, total)
+
+    filled = 0
+    for chunk in iter_feature_chunks(chunk_size):
+        take = min(len(chunk.features), total - filled)
+        features[filled:filled + take] = chunk.features[:take]
+        employee_ids[filled:filled + take] = chunk.employee_ids[:take]
+        departments[filled:filled + take] = chunk.departments[:take]
+        filled += take
+        if progress:
+            progress(filled, total)
+        if filled == total:
+            break
+
+    return TrainingSet(features[:filled], employee_ids[:filled], departments[:filled])
+
+def _month(column):
+    return extract('year', column) * 100 + extract('month', column)
+
+def count_strata():
+    """Completed records per (department, month), month as YYYYMM"""
+    month = _month(AttendanceRecord.date)
+    rows = db.session.execute(
+        select(Employee.department, month, func.count()).select_from(AttendanceRecord).outerjoin(
+            Employee, Employee.id == AttendanceRecord.employee_id
+        ).where(
+            AttendanceRecord.time_in.isnot(None),
+            AttendanceRecord.time_out.isnot(None)
+        ).group_by(Employee.department, month)
+    )
+    return {(department, int(month)): count for department, month, count in rows}
+
+def allocate(counts, sample_size):
+    """Split sample_size across strata in proportion to their counts.
+
+    Largest-remainder rounding, so the quotas add up to sample_size exactly.
+    """
+    total = sum(counts.values())
+    shares = {key: sample_size * count / total for key, count in counts.items()}
+    quotas = {key: int(share) for key, share in shares.items()}
+    by_remainder = sorted(shares, key=lambda key: shares[key] - quotas[key], reverse=True)
+    for key in by_remainder[:sample_size - sum(quotas.values())]:
+        quotas[key] += 1
+    return quotas
+
+def sample_training_set(sample_size=None, seed=None, stratified=None, chunk_size=None, progress=None):
+    """A bounded random sample of the training set, streamed from the database.
+
+    Every row gets a random key and the rows with the smallest keys are kept
+    (bottom-k sampling, equivalent to a reservoir). When stratified, each
+    (department, month) stratum keeps its own smallest keys, with the sample
+    split across strata in proportion to their size. Memory is bounded by
+    the sample size, not the history; the same seed over the same rows gives
+    the same sample. Histories no bigger than the sample are loaded whole.
+    progress(rows_scanned, total_rows) is called after each chunk.
+    """
+    sample_size = sample_size or Config.TRAINING_SAMPLE_SIZE
+    seed = Config.TRAINING_SAMPLE_SEED if seed is None else seed
+    stratified = Config.TRAINING_SAMPLE_STRATIFIED if stratified is None else stratified
+    chunk_size = chunk_size or Config.TRAINING_CHUNK_SIZE
+
+    counts = count_strata()
+    total = sum(counts.values())
+    if total <= sample_size:
+        return load_training_set(chunk_size, progress)
+    if not stratified:
+        counts = {None: total}
+    quotas = allocate(counts, sample_size)
+    if progress:
+        progress(0, total)
+
+    # Strata are numbered as they're first seen; quota_of[code] is their quota
+    codes = {}
+    quota_of = []
+    rng = np.random.default_rng(seed)
+    width = len(FEATURE_COLUMNS)
+    buffered = []
+    buffered_rows = 0
+    scanned = 0
+
+    stmt = feature_query().add_columns(_month(AttendanceRecord.date))
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+    try:
+        for rows in result.partitions():
+            columns = list(zip(*rows))
+            strata = np.empty(len(rows), dtype=np.int64)
+            for i, department, month in zip(range(len(rows)), columns[width + 1], columns[width + 2]):
+                key = (department, int(month)) if stratified else None
+                code = codes.get(key)
+                if code is None:
+                    code = codes[key] = len(quota_of)
+                    # Strata that appeared after counting get no share
+                    quota_of.append(quotas.get(key, 0))
+                strata[i] = code
+
+            buffered.append([
+                np.array(columns[:width], dtype=np.float64).T,
+                np.array(columns[width], dtype=np.int64),
+                np.array(columns[width + 1], dtype=object),
+                strata,
+                rng.random(len(rows))
+            ])
+            buffered_rows += len(rows)
+            # Cut back to the sample once the buffer has doubled it
+            if buffered_rows >= 2 * sample_size:
+                buffered = [_bottom_k(buffered, np.array(quota_of))]
+                buffered_rows = len(buffered[0][0])
+
+            scanned += len(rows)
+            if progress:
+                progress(min(scanned, total), total)
+    finally:
+        result.close()
+
+    if not buffered:
+        return load_training_set(chunk_size, progress)
+    kept = _bottom_k(buffered, np.array(quota_of))
+    return TrainingSet(kept[0], kept[1], kept[2])
+
+def _bottom_k(chunks, quota_of):
+    # Keep, per stratum, the rows with the smallest random keys (in the
+    # order they were read)
+    columns = [np.concatenate(parts) for parts in zip(*chunks)]
+    strata, keys = columns[3], columns[4]
+    order = np.lexsort((keys, strata))
+    sorted_strata = strata[order]
+    starts = np.searchsorted(sorted_strata, sorted_strata, side='left')
+    rank = np.arange(len(order)) - starts
+    keep = np.sort(order[rank < quota_of[sorted_strata]])
+    return [column[keep] for column in columns]
@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from app.utils.training_data import sample_training_set
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+class TrainingJob:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.phase = 'queued'
+        self.rows_processed = 0
+        self.total_rows = None
+        self.sample_size = None
+        self.model_version = None
+        self.error = None
+        self.created_at = datetime.now()
+        self._started = None
+        self._finished = None
+
+    @property
+    def active(self):
+        return self.phase not in ('done', 'failed')
+
+    def serialize(self):
+        elapsed = None
+        if self._started is not None:
+            elapsed = round((self._finished or time.monotonic()) - self._started, 3)
+        return {
+            'job_id': self.id,
+            'phase': self.phase,
+            'rows_processed': self.rows_processed,
+            'total_rows': self.total_rows,
+            'sample_size': self.sample_size,
+            'elapsed_seconds': elapsed,
+            'model_version': self.model_version,
+            'error': self.error,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+class TrainingJobManager:
+    """Runs anomaly model training off the request path, one job at a time.
+
+    A train request made while a job is queued or running gets that job back
+    instead of starting another. Finished jobs are kept for status lookups.
+    """
+
+    def __init__(self, max_jobs=None):
+        self.max_jobs = max_jobs or Config.TRAINING_JOBS_KEPT
+        self._jobs = OrderedDict()
+        self._current = None
+        self._lock = threading.Lock()
+        self.app = None
+        self.detector = None
+        self.store = None
+
+    def init_app(self, app, detector, store):
+        self.app = app
+        self.detector = detector
+        self.store = store
+
+    def submit(self):
+        """Returns (job, created); created is False when joining a running job"""
+        with self._lock:
+            if self._current is not None and self._current.active:
+                return self._current, False
+
+            job = self._current = TrainingJob()
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+        threading.Thread(target=self._run, args=(job,), name=f'train-{job.id[:8]}', daemon=True).start()
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job._started = time.monotonic()
+        try:
+            with self.app.app_context():
+                job.phase = 'loading'
+                # Histories larger than TRAINING_SAMPLE_SIZE are sampled
+                training_set = sample_training_set(
+                    sample_size=self.app.config.get('TRAINING_SAMPLE_SIZE'),
+                    seed=self.app.config.get('TRAINING_SAMPLE_SEED'),
+                    stratified=self.app.config.get('TRAINING_SAMPLE_STRATIFIED'),
+                    progress=lambda done, total: self._progress(job, done, total)
+                )
+                job.sample_size = len(training_set.features)
+
+            job.phase = 'fitting'
+            models = self.detector.fit_models(training_set, n_jobs=self.app.config.get('TRAINING_N_JOBS'))
+            if models is None:
+                job.error = 'Not enough data to train the model'
+                job.phase = 'failed'
+                return
+
+            # Save before installing so other worker processes can pick it up
+            job.phase = 'saving'
+            info = self.store.save(models, training_set.features)
+            self.detector.install_models(models, info)
+            job.model_version = info['version']
+            job.phase = 'done'
+        except Exception as e:
+            logger.exception('Training job %s failed', job.id)
+            job.error = str(e)
+            job.phase = 'failed'
+        finally:
+            job._finished = time.monotonic()
+
+    def _progress(self, job, done, total):
+        job.total_rows = total
+        job.rows_processed = done
+
+# Shared instance opened by init_services()
+training_jobs = TrainingJobManager()
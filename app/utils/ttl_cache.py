@@ -0,0 +1,82 @@
+import threading
+import time
+
+class _Entry:
+    __slots__ = ('value', 'expires', 'error', 'ready')
+
+    def __init__(self):
+        self.value = None
+        self.expires = 0.0
+        self.error = None
+        self.ready = threading.Event()
+
+class CoalescingTTLCache:
+    """Short-lived cache for expensive read-only results.
+
+    A value is computed at most once per key per ttl. Callers that ask while
+    it's being computed wait for that computation instead of starting their
+    own (single flight), so N dashboards polling at once cost one query run.
+    Errors are passed to the waiting callers but not cached.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, compute, ttl):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.ready.is_set() and entry.expires > time.monotonic():
+                self.hits += 1
+                return entry.value
+            if entry is not None and not entry.ready.is_set():
+                # Someone else is computing it
+                self.coalesced += 1
+                owner = False
+            else:
+                entry = self._entries[key] = _Entry()
+                self.misses += 1
+                owner = True
+
+        if not owner:
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+            return entry.value
+
+        try:
+            entry.value = compute()
+            entry.expires = time.monotonic() + ttl
+        except Exception as e:
+            entry.error = e
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            raise
+        finally:
+            entry.ready.set()
+        return entry.value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses + self.coalesced
+            return {
+                'keys': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': round((self.hits + self.coalesced) / requests, 4) if requests else None
+            }
+
+# Dashboard aggregates, shared by every request thread in the process
+dashboard_cache = CoalescingTTLCache()
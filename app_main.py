@@ -1,24 +1,37 @@
 from flask import Flask
+from werkzeug.serving import is_running_from_reloader
+from sqlalchemy.engine import make_url
 from app.models.models import db
+from app.models.migrations import upgrade_schema
 from app.api.attendance import attendance_bp
 from app.api.employees import employees_bp
 from app.api.dashboard import dashboard_bp
 from app.api.web import web_bp
-from config.config import Config
+from app.utils.bootstrap import init_services
+from app.utils.db_tuning import configure_sqlite
+from config.config import get_config
 import os
 
-def create_app(config_class=Config):
+def create_app(config_class=None, start_services=True):
+    # Default to the profile named by APP_CONFIG (e.g. "production").
+    # Only the process that serves requests should start the services: each
+    # claims a swipe journal and runs background threads.
+    config_class = config_class or get_config()
+    
     app = Flask(__name__,
                 static_folder='app/static',
                 template_folder='app/templates')
     
     app.config.from_object(config_class)
     
-    # Ensure data directory exists
-    os.makedirs(os.path.join(config_class.BASE_DIR, 'data'), exist_ok=True)
+    # Ensure the SQLite database's directory exists
+    database = make_url(config_class.SQLALCHEMY_DATABASE_URI).database
+    if database and database != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
     
     # Initialize database
     db.init_app(app)
+    configure_sqlite(app)
     
     # Register blueprints
     app.register_blueprint(web_bp, url_prefix='/')
@@ -28,11 +41,22 @@ def create_app(config_class=Config):
     
     with app.app_context():
         db.create_all()
+        # create_all() skips existing tables, so bring older databases up to date
+        upgrade_schema()
+    
+    # Load caches and start background services
+    if start_services:
+        init_services(app)
     
     return app
 
-# Create the main application instance
-app = create_app()
+# Create the main application instance. Scripts import it for an app
+# context, so it starts no services; WSGI servers should call create_app().
+app = create_app(start_services=False)
 
 if __name__ == '__main__':
+    # The debug reloader's parent only watches for changes and restarts the
+    # child process, which is the one that serves
+    if is_running_from_reloader():
+        init_services(app)
     app.run(debug=True, port=5000)
\ No newline at end of file
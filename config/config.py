@@ -8,6 +8,9 @@ class Config:
         f'sqlite:///{os.path.join(BASE_DIR, "data", "attendance.db")}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # PRAGMAs applied to every new SQLite connection (none by default)
+    SQLITE_PRAGMAS = {}
+    
     # Work hour settings
     NORMAL_WORK_START = '09:00'  # 9 AM
     NORMAL_WORK_END = '17:00'    # 5 PM
@@ -20,8 +23,98 @@ class Config:
     EARLY_DEPARTURE_THRESHOLD = 30  # minutes
     ABNORMAL_BREAK_THRESHOLD = 1.5  # multiplier of normal break duration
     CONSECUTIVE_ANOMALIES_THRESHOLD = 3  # number of consecutive anomalies before critical alert
+    CONSECUTIVE_ANOMALIES_MODE = 'window'  # 'window': threshold anomalous days within the window; 'streak': threshold anomalous check-outs in a row
+    CONSECUTIVE_ANOMALIES_WINDOW_DAYS = 7
+    ANOMALY_COUNTER_BACKFILL_DAYS = 60   # history read to rebuild the anomaly counters at startup
     MULTIPLE_SWIPE_THRESHOLD = 3 # number of swipes within short period
     TIME_WINDOW_FOR_MULTIPLE_SWIPES = 5  # minutes
+    SWIPE_WINDOW_MAX_PER_EMPLOYEE = 32  # swipes remembered per employee inside the window
+    SWIPE_WINDOW_SWEEP_INTERVAL = 1000  # swipes between sweeps of idle employees
+    
+    # Background anomaly pipeline settings
+    ANOMALY_DETECTION_ASYNC = False  # run check-out anomaly detection off the request path (on in production)
+    ANOMALY_WORKERS = 2              # worker threads processing the queue
+    ANOMALY_QUEUE_SIZE = 10000       # max queued check-outs before swipes block
+    ANOMALY_SHUTDOWN_TIMEOUT = 30    # seconds to wait for the queue to drain on exit
+    
+    # Micro-batched model scoring. Pipeline workers score up to MAX_SIZE
+    # queued check-outs at once; with synchronous detection, concurrent
+    # single-swipe requests share one predict() through the batch scorer
+    # (journal groups and batch requests already score together).
+    MICRO_BATCH_ENABLED = True
+    MICRO_BATCH_WINDOW_MS = 5      # how long the first queued check-out waits for others (synchronous only)
+    MICRO_BATCH_MAX_SIZE = 256     # rows scored per predict() at most
+    MICRO_BATCH_TIMEOUT_MS = 100   # latency ceiling before a caller predicts on its own (synchronous only)
+    
+    # Swipe ingestion settings
+    SWIPE_BATCH_MAX_EVENTS = 10000  # max events accepted by /swipe/batch
+    
+    # Swipe journal settings. Each server process locks a journal of its own:
+    # SWIPE_JOURNAL_PATH, or swipe_journal.1.log, .2.log... when it is taken.
+    SWIPE_JOURNAL_ENABLED = False    # on in production
+    SWIPE_JOURNAL_PATH = os.environ.get('SWIPE_JOURNAL_PATH') or \
+        os.path.join(BASE_DIR, 'data', 'swipe_journal.log')
+    SWIPE_JOURNAL_GROUP_COMMIT_WINDOW = 0.002  # seconds to gather swipes into one fsync
+    SWIPE_JOURNAL_RETRY_INTERVAL = 5           # seconds between replays of unapplied swipes
+    SWIPE_JOURNAL_MAX_ATTEMPTS = 3             # failures before a swipe is set aside as rejected
+    SWIPE_JOURNAL_COMPACT_BYTES = 64 * 1024 * 1024  # truncate once fully applied and this large
+    
+    # Idempotent swipe settings
+    IDEMPOTENCY_TTL = 600            # seconds a swipe response is kept for retries
+    IDEMPOTENCY_MAX_KEYS = 100000
+    IDEMPOTENCY_WAIT_TIMEOUT = 30    # seconds a retry waits for the original request
+    
+    # Rule-based anomaly checks (see app/utils/rule_engine.py); edits to the
+    # file are picked up without a restart
+    ANOMALY_RULES_PATH = os.environ.get('ANOMALY_RULES_PATH') or \
+        os.path.join(BASE_DIR, 'config', 'anomaly_rules.json')
+    ANOMALY_RULES_RELOAD_INTERVAL = 5    # seconds between checks for changed rules
+    
+    # Which detector flags unusual days: 'model' (IsolationForest), 'online'
+    # (per-employee streaming baselines) or 'both'
+    ANOMALY_DETECTOR_MODE = os.environ.get('ANOMALY_DETECTOR_MODE') or 'model'
+    
+    # Online baseline settings
+    ONLINE_BASELINE_PATH = os.environ.get('ONLINE_BASELINE_PATH') or \
+        os.path.join(BASE_DIR, 'data', 'online_baselines.json')
+    ONLINE_BASELINE_ALPHA = 0.1          # EWMA weight of the newest day
+    ONLINE_BASELINE_MIN_SAMPLES = 10     # days observed before an employee is scored
+    ONLINE_BASELINE_Z_THRESHOLD = 3.0    # standard deviations from the mean that count as unusual
+    ONLINE_BASELINE_MIN_STD = {          # floor on the spread, so very regular employees aren't flagged for small changes
+        'arrival': 10,                   # minutes
+        'departure': 10,                 # minutes
+        'break_minutes': 10,
+        'hours_worked': 0.5
+    }
+    ONLINE_BASELINE_PERSIST = False      # save baselines to ONLINE_BASELINE_PATH, shared by server processes (on in production; never in 'model' mode)
+    ONLINE_BASELINE_FLUSH_INTERVAL = 60  # seconds between saves of the baseline file
+    
+    # Model training settings
+    TRAINING_CHUNK_SIZE = 5000   # feature rows fetched per round trip when training
+    MODEL_DIR = os.environ.get('MODEL_DIR') or os.path.join(BASE_DIR, 'data', 'models')
+    MODEL_RELOAD_INTERVAL = 30   # seconds between checks for a model saved by another process
+    MODEL_KEEP_VERSIONS = 5      # saved model files kept on disk
+    TRAINING_N_JOBS = -1         # cores used to fit the model (-1 = all)
+    TRAINING_JOBS_KEPT = 20      # finished training jobs kept for status lookups
+    ANOMALY_DEPARTMENT_MODELS = True   # fit a model per department
+    ANOMALY_EMPLOYEE_MODELS = False    # also fit a model per employee
+    ANOMALY_GROUP_MIN_SAMPLES = 50     # records a group needs for its own model
+    TRAINING_GROUP_WORKERS = 4         # group models fitted in parallel
+    TRAINING_SAMPLE_SIZE = 200000      # records sampled from larger histories
+    TRAINING_SAMPLE_STRATIFIED = True  # sample each department and month proportionally
+    TRAINING_SAMPLE_SEED = 42          # same seed and history give the same sample
+    
+    # Caching settings
+    RFID_CACHE_SIZE = 10000      # max RFID tags kept in the in-memory lookup cache
+    DASHBOARD_STATS_TTL = 5      # seconds /api/dashboard/stats results are reused
+    
+    # Dashboard settings
+    TREND_MAX_DAYS = 1096        # longest range /api/dashboard/trend accepts
+    ACTIVITY_FEED_MAX_LIMIT = 100   # most events one /api/dashboard/activities page returns
+    ALERT_PAGE_SIZE = 100           # alerts per page when no limit is given
+    ALERT_MAX_PAGE_SIZE = 1000      # largest limit an alert listing accepts
+    ALERT_EXPORT_CHUNK_SIZE = 1000  # alerts fetched per round trip when exporting
+    ROLLUP_REBUILD_CHUNK_DAYS = 31  # days of history recomputed at a time by a rollup rebuild
     
     # Alert severity levels
     SEVERITY_LEVELS = {
@@ -42,4 +135,44 @@ class Config:
         'UNUSUAL_PATTERN': 'Unusual Pattern',
         'SHORT_WORKDAY': 'Short Workday',
         'CONSECUTIVE_ANOMALIES': 'Consecutive Anomalies'
-    } 
\ No newline at end of file
+    }
+
+class ProductionConfig(Config):
+    # Tuned for many concurrent swipe writers plus dashboard readers on SQLite
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',       # readers no longer block the writer
+        'synchronous': 'NORMAL',     # fsync at checkpoints only; safe with WAL
+        'busy_timeout': 5000,        # ms to wait for a lock before "database is locked"
+        'cache_size': -65536,        # negative means KiB, so 64 MB of page cache
+        'mmap_size': 268435456,      # 256 MB memory-mapped reads
+    }
+    
+    # Durable swipes, detection off the request path and baselines that
+    # survive restarts; off by default so local runs start no threads
+    ANOMALY_DETECTION_ASYNC = True
+    SWIPE_JOURNAL_ENABLED = True
+    ONLINE_BASELINE_PERSIST = True
+    
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 20,             # one connection per server thread
+        'max_overflow': 10,
+        'pool_timeout': 30,
+        'pool_pre_ping': True,
+    }
+    if Config.SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        # Pooled connections are handed between threads. The lock wait is
+        # the busy_timeout pragma above, not the driver's timeout argument.
+        SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {'check_same_thread': False}
+
+config_by_name = {
+    'default': Config,
+    'development': Config,
+    'production': ProductionConfig
+}
+
+def get_config(name=None):
+    """Return the config class selected by name or the APP_CONFIG environment variable"""
+    name = name or os.environ.get('APP_CONFIG', 'default')
+    if name not in config_by_name:
+        raise ValueError(f"Unknown config '{name}', expected one of: {', '.join(config_by_name)}")
+    return config_by_name[name]
@@ -6,10 +6,13 @@ import time
 import requests
 from datetime import datetime, timedelta
 import argparse
-# Import from app_main to avoid confusion with the app package
+from contextlib import nullcontext
+# Import from app_main to avoid confusion with the app package. Swipes go
+# through the running server, so the apps made here start no services.
 from app_main import app, create_app
 from app.models.models import Employee, AttendanceRecord, Break, Alert, db
-from app.utils.helpers import generate_random_attendance_data, get_active_break
+from app.utils.helpers import generate_random_attendance_data, get_active_break, unit_of_work
+from app.utils import rollups
 
 # Sample employee data for seeding the database
 SAMPLE_EMPLOYEES = [
@@ -90,7 +93,7 @@ def seed_database():
     print("Seeding database with sample employees...")
     
     # Create a new app instance using the imported create_app function
-    flask_app = create_app()
+    flask_app = create_app(start_services=False)
     with flask_app.app_context():
         # Check if we already have employees
         if Employee.query.count() > 0:
@@ -105,12 +108,16 @@ def seed_database():
         db.session.commit()
         print(f"Successfully added {len(SAMPLE_EMPLOYEES)} employees.")
 
-def generate_historical_data(days_back=30):
-    """Generate historical attendance data for specified number of days"""
+def generate_historical_data(days_back=30, group_commit=False):
+    """Generate historical attendance data for specified number of days
+    
+    With group_commit, all days are committed in a single transaction
+    instead of one commit per day.
+    """
     print(f"Generating historical attendance data for the past {days_back} days...")
     
     # Create a new app instance using the imported create_app function
-    flask_app = create_app()
+    flask_app = create_app(start_services=False)
     with flask_app.app_context():
         # Get all employees
         employees = Employee.query.all()
@@ -124,11 +131,11 @@ def generate_historical_data(days_back=30):
         start_date = end_date - timedelta(days=days_back-1)
         
         # Clear existing historical data in this range
-        AttendanceRecord.query.filter(
-            AttendanceRecord.date >= start_date,
-            AttendanceRecord.date <= end_date
-        ).delete()
-        db.session.commit()
+        with unit_of_work():
+            AttendanceRecord.query.filter(
+                AttendanceRecord.date >= start_date,
+                AttendanceRecord.date <= end_date
+            ).delete()
         
         # Generate new data
         print(f"Generating attendance data from {start_date} to {end_date}...")
@@ -136,33 +143,35 @@ def generate_historical_data(days_back=30):
         total_records = 0
         current_date = start_date
         
-        while current_date <= end_date:
-            print(f"Generating data for {current_date}...")
-            day_records = 0
-            
-            for employee in employees:
-                # Randomly skip some employees (weekends, vacations, etc.)
-                if random.random() < 0.2:  # 20% chance of absence
-                    continue
-                    
-                # Randomly determine if this will be an anomalous day (10% chance)
-                is_anomaly = random.random() < 0.1
-                
-                # Generate attendance record
-                record = generate_random_attendance_data(employee, current_date, not is_anomaly)
+        # An outer unit of work turns the per-day commits into one group commit
+        with unit_of_work() if group_commit else nullcontext():
+            while current_date <= end_date:
+                print(f"Generating data for {current_date}...")
+                day_records = 0
                 
-                # Mark as anomaly if applicable
-                if is_anomaly:
-                    record.is_anomaly = True
-                
-                db.session.add(record)
-                day_records += 1
+                with unit_of_work():
+                    for employee in employees:
+                        # Randomly skip some employees (weekends, vacations, etc.)
+                        if random.random() < 0.2:  # 20% chance of absence
+                            continue
+                            
+                        # Randomly determine if this will be an anomalous day (10% chance)
+                        is_anomaly = random.random() < 0.1
+                        
+                        # Generate attendance record
+                        record = generate_random_attendance_data(employee, current_date, not is_anomaly)
+                        
+                        # Mark as anomaly if applicable
+                        if is_anomaly:
+                            record.is_anomaly = True
+                        
+                        db.session.add(record)
+                        day_records += 1
+                    
+                total_records += day_records
+                print(f"  Added {day_records} records for {current_date}")
                 
-            db.session.commit()
-            total_records += day_records
-            print(f"  Added {day_records} records for {current_date}")
-            
-            current_date += timedelta(days=1)
+                current_date += timedelta(days=1)
             
         print(f"Successfully generated {total_records} historical attendance records.")
         
@@ -170,12 +179,21 @@ def generate_historical_data(days_back=30):
         print("Training anomaly detection model on historical data...")
         requests.post('http://localhost:5000/api/train-model')
 
+def rebuild_rollups():
+    """Recompute the daily summary tables from the full attendance history"""
+    print("Rebuilding daily summary tables...")
+    flask_app = create_app(start_services=False)
+    with flask_app.app_context():
+        employee_days, department_days = rollups.rebuild_rollups()
+        db.session.commit()
+    print(f"Rebuilt {employee_days} employee-day and {department_days} department-day summaries.")
+
 def simulate_day():
     """Simulate a full day of attendance activities"""
     print("Starting full day attendance simulation...")
     
     # Create a new app instance using the imported create_app function
-    flask_app = create_app()
+    flask_app = create_app(start_services=False)
     with flask_app.app_context():
         # Get all employees
         employees = Employee.query.all()
@@ -191,6 +209,12 @@ def simulate_day():
         AttendanceRecord.query.filter_by(date=today).delete()
         db.session.commit()
         
+        # The server caches today's attendance state, so tell it to re-read it
+        try:
+            requests.post('http://localhost:5000/api/attendance/state/reload')
+        except Exception as e:
+            print(f"  Could not reload server attendance state: {str(e)}")
+        
         # Simulate morning check-ins (8:30 AM - 9:30 AM)
         print("Simulating morning check-ins...")
         base_time = datetime.combine(today, datetime.strptime("08:30", "%H:%M").time())
@@ -393,7 +417,7 @@ def interactive_mode():
     print("This mode allows you to manually simulate RFID card swipes.")
     
     # Create a new app instance using the imported create_app function
-    flask_app = create_app()
+    flask_app = create_app(start_services=False)
     with flask_app.app_context():
         # Get all employees for reference
         employees = Employee.query.all()
@@ -521,8 +545,10 @@ if __name__ == "__main__":
     parser.add_argument('--seed', action='store_true', help='Seed the database with sample employees')
     parser.add_argument('--historical', action='store_true', help='Generate historical attendance data')
     parser.add_argument('--days', type=int, default=30, help='Number of historical days to generate (default: 30)')
+    parser.add_argument('--group-commit', action='store_true', help='Commit all generated historical data in one transaction')
     parser.add_argument('--simulate', action='store_true', help='Simulate a full day of attendance activities')
     parser.add_argument('--interactive', action='store_true', help='Interactive mode for manual simulation')
+    parser.add_argument('--rebuild-rollups', action='store_true', help='Rebuild the daily summary tables from history')
     
     # No need to start Flask server as it's running in a separate terminal
     print("Connecting to Flask server running on port 5000...")
@@ -534,7 +560,7 @@ if __name__ == "__main__":
         seed_database()
         
     if args.historical:
-        generate_historical_data(args.days)
+        generate_historical_data(args.days, group_commit=args.group_commit)
         
     if args.simulate:
         simulate_day()
@@ -542,8 +568,11 @@ if __name__ == "__main__":
     if args.interactive:
         interactive_mode()
         
+    if args.rebuild_rollups:
+        rebuild_rollups()
+        
     # If no arguments, show help
-    if not (args.seed or args.historical or args.simulate or args.interactive):
+    if not (args.seed or args.historical or args.simulate or args.interactive or args.rebuild_rollups):
         parser.print_help()
         print("\nExample usage:")
         print("  python run_simulation.py --seed")
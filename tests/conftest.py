@@ -0,0 +1,66 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# Config reads these when it is imported, so they are set before the app is
+_data_dir = tempfile.mkdtemp(prefix='attendance-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_data_dir, 'attendance.db')}"
+os.environ['SWIPE_JOURNAL_PATH'] = os.path.join(_data_dir, 'swipe_journal.log')
+os.environ['MODEL_DIR'] = os.path.join(_data_dir, 'models')
+os.environ['ONLINE_BASELINE_PATH'] = os.path.join(_data_dir, 'online_baselines.json')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_main import app as _app
+from app.models.models import Employee, db
+from app.api.attendance import apply_swipe_event
+from app.utils.rfid_cache import rfid_cache
+from app.utils.swipe_journal import SwipeJournal
+
+@pytest.fixture(scope='session')
+def app():
+    yield _app
+    shutil.rmtree(_data_dir, ignore_errors=True)
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.remove()
+
+@pytest.fixture
+def employee(app_context):
+    """A fresh employee per test, so tests don't share attendance days"""
+    number = Employee.query.count() + 1
+    employee = Employee(
+        employee_id=f'TEST{number:03d}',
+        name=f'Test Employee {number}',
+        department=f'Department {number % 2}',
+        position='Tester',
+        rfid_tag=f'RFID-TEST-{number:03d}'
+    )
+    db.session.add(employee)
+    db.session.commit()
+    rfid_cache.put(employee)
+    return employee
+
+@pytest.fixture
+def open_journal(app, monkeypatch):
+    """Opens SwipeJournals the way init_services() does; closed after the test"""
+    journals = []
+
+    def open_journal(path, apply_entry=None):
+        monkeypatch.setitem(app.config, 'SWIPE_JOURNAL_ENABLED', True)
+        monkeypatch.setitem(app.config, 'SWIPE_JOURNAL_PATH', str(path))
+        journal = SwipeJournal()
+        journal.init_app(app, apply_entry or apply_swipe_event)
+        journals.append(journal)
+        return journal
+
+    yield open_journal
+    for journal in journals:
+        for opened in [journal] + journal._orphans:
+            if opened.enabled:
+                opened._close()
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+from app.models.models import AttendanceRecord, db
+from app.utils.anomaly_counter import AnomalyCounter
+from config.config import Config
+
+def _checked_out(employee, date, is_anomaly):
+    start = datetime.combine(date, datetime.min.time())
+    db.session.add(AttendanceRecord(
+        employee_id=employee.id, date=date, time_in=start + timedelta(hours=9),
+        time_out=start + timedelta(hours=17), total_hours=8.0, is_anomaly=is_anomaly
+    ))
+
+def test_escalates_on_anomalies_scored_by_another_process(employee, monkeypatch):
+    monkeypatch.setattr(Config, 'CONSECUTIVE_ANOMALIES_THRESHOLD', 3)
+    today = datetime.now().date()
+    # Another process scored these; this counter never saw them
+    counter = AnomalyCounter()
+    for days_ago in (2, 1):
+        _checked_out(employee, today - timedelta(days=days_ago), True)
+    db.session.commit()
+
+    for mode in ('window', 'streak'):
+        monkeypatch.setattr(Config, 'CONSECUTIVE_ANOMALIES_MODE', mode)
+        assert counter.should_escalate(employee.id, today)
+
+def test_streak_is_broken_by_a_normal_day(employee, monkeypatch):
+    monkeypatch.setattr(Config, 'CONSECUTIVE_ANOMALIES_THRESHOLD', 3)
+    monkeypatch.setattr(Config, 'CONSECUTIVE_ANOMALIES_MODE', 'streak')
+    today = datetime.now().date()
+    for days_ago, is_anomaly in ((3, True), (2, False), (1, True)):
+        _checked_out(employee, today - timedelta(days=days_ago), is_anomaly)
+    db.session.commit()
+
+    assert not AnomalyCounter().should_escalate(employee.id, today)
@@ -0,0 +1,75 @@
+import random
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils.anomaly_detector import AnomalyDetector, ModelSet, record_features
+from app.utils.online_baselines import OnlineBaselines
+from config.config import Config
+
+def _record(employee_id, day, arrival, departure, breaks=(), department='Engineering'):
+    # Minutes after midnight; None leaves the time out
+    start = datetime.combine(day, datetime.min.time())
+    time_in = start + timedelta(minutes=arrival) if arrival is not None else None
+    time_out = start + timedelta(minutes=departure) if departure is not None else None
+    break_records = [SimpleNamespace(duration=duration) for duration in breaks]
+    total_hours = None
+    if time_in and time_out:
+        total_hours = ((time_out - time_in).total_seconds() / 60 - sum(breaks)) / 60
+    return SimpleNamespace(
+        employee_id=employee_id, date=day, time_in=time_in, time_out=time_out,
+        total_hours=total_hours, breaks=break_records,
+        employee=SimpleNamespace(department=department)
+    )
+
+def _normal_day(rng, employee_id, day, department):
+    return _record(employee_id, day, 540 + rng.randint(-10, 15), 1020 + rng.randint(-15, 20),
+                   [rng.choice([10, 15]), rng.choice([45, 60])], department)
+
+@pytest.fixture
+def detector(monkeypatch):
+    monkeypatch.setattr(Config, 'ANOMALY_DETECTOR_MODE', 'both')
+    rng = random.Random(7)
+    start = date(2026, 1, 5)
+    history = [_normal_day(rng, employee_id, start + timedelta(days=n), department)
+               for n in range(40) for employee_id, department in ((1, 'Engineering'), (2, 'Sales'))]
+
+    baselines = OnlineBaselines()
+    detector = AnomalyDetector(baselines=baselines)
+    for record in history:
+        baselines.update(record.employee_id, record_features(record))
+
+    features = detector._extract_features(history)
+    engineering = detector._extract_features([r for r in history if r.employee.department == 'Engineering'])
+    detector.install_models(ModelSet(
+        detector.fit_model(features), {'Engineering': detector.fit_model(engineering)}, {}, {1: 'Engineering'}, None
+    ))
+    return detector
+
+def test_batch_scoring_matches_per_record_scoring(detector):
+    day = date(2026, 3, 2)
+    rng = random.Random(11)
+    records = [
+        _normal_day(rng, 1, day, 'Engineering'),
+        _normal_day(rng, 2, day, 'Sales'),
+        _record(1, day, 600, 1020, [15]),                     # late
+        _record(2, day, 540, 900, [15, 60], 'Sales'),         # early and short
+        _record(1, day, 545, 1030, [15, 120]),                # long break
+        _record(2, day, 400, 1300, [], 'Sales'),              # unusual for the model and baseline
+        _record(3, day, 540, 1020, [15], 'Support'),          # no baseline, global model
+        _record(1, day, 560, None, [20]),                     # still checked in
+        _record(2, day, None, 1020, [], 'Sales'),             # missing check-in
+    ]
+
+    batch = detector.detect_anomalies_batch(records)
+    single = [detector.detect_anomalies(record) for record in records]
+
+    assert batch == single
+    # The mix exercises every source: rules, the model and the baselines
+    types = {anomaly['type'] for anomalies in batch for anomaly in anomalies}
+    assert Config.ALERT_TYPES['LATE_ARRIVAL'] in types
+    assert Config.ALERT_TYPES['MISSING_CHECK_IN'] in types
+    descriptions = [anomaly['description'] for anomalies in batch for anomaly in anomalies]
+    assert any('machine learning' in description for description in descriptions)
+    assert any(description.startswith('Unusual day for this employee') for description in descriptions)
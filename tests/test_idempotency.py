@@ -0,0 +1,11 @@
+from app.utils.idempotency import IdempotencyStore
+
+def test_store_never_holds_more_than_max_keys():
+    store = IdempotencyStore(ttl=600, max_keys=3)
+    # A burst of requests still in flight: none of them has completed
+    entries = [store.begin(f'key-{n}')[0] for n in range(10)]
+
+    assert store.stats()['keys'] == 3
+    # The newest keys are the ones kept
+    assert store.begin('key-9') == (entries[9], False)
+    assert store.begin('key-0')[1] is True
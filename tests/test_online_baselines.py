@@ -0,0 +1,40 @@
+from app.utils.online_baselines import OnlineBaselines
+
+def _baselines(app, monkeypatch, path):
+    monkeypatch.setitem(app.config, 'ANOMALY_DETECTOR_MODE', 'online')
+    monkeypatch.setitem(app.config, 'ONLINE_BASELINE_PERSIST', True)
+    monkeypatch.setitem(app.config, 'ONLINE_BASELINE_FLUSH_INTERVAL', 3600)
+    monkeypatch.setitem(app.config, 'ONLINE_BASELINE_PATH', str(path))
+    baselines = OnlineBaselines()
+    baselines.init_app(app)
+    return baselines
+
+def test_processes_sharing_the_file_merge_their_observations(app, monkeypatch, tmp_path):
+    path = tmp_path / 'baselines.json'
+    first = _baselines(app, monkeypatch, path)
+    second = _baselines(app, monkeypatch, path)
+
+    first.update(9001, [540, 1020, 30, 7.5])
+    first.flush()
+    second.update(9002, [480, 960, 15, 7.75])
+    second.update(9001, [560, 1020, 30, 7.2])
+    second.flush()
+    first.flush()
+
+    # Both copies hold every observation, employee 9001's from both processes
+    for baselines in (first, second):
+        assert baselines._stats[9001][0] == 2
+        assert baselines._stats[9002][0] == 1
+    assert first._stats == second._stats
+
+def test_model_mode_does_not_save_baselines(app, monkeypatch, tmp_path):
+    path = tmp_path / 'baselines.json'
+    monkeypatch.setitem(app.config, 'ANOMALY_DETECTOR_MODE', 'model')
+    monkeypatch.setitem(app.config, 'ONLINE_BASELINE_PERSIST', True)
+    monkeypatch.setitem(app.config, 'ONLINE_BASELINE_PATH', str(path))
+    baselines = OnlineBaselines()
+    baselines.init_app(app)
+
+    baselines.update(1, [540, 1020, 30, 7.5])
+    baselines.flush()
+    assert not path.exists()
@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, select
+
+from app.models.models import Alert, DailyDepartmentSummary, DailyEmployeeSummary, db
+from app.utils.anomaly_pipeline import anomaly_pipeline
+from app.utils.rollups import rebuild_rollups
+from config.config import Config
+
+def _swipe(client, employee, timestamp, action=None):
+    response = client.post('/api/attendance/swipe/batch', json={'events': [
+        {'rfid_tag': employee.rfid_tag, 'timestamp': timestamp.isoformat(), 'action': action}
+    ]})
+    assert response.status_code == 200
+    return response.get_json()['results'][0]
+
+def _rows(employee, date):
+    db.session.expire_all()
+    employee_row = db.session.execute(
+        select(DailyEmployeeSummary.__table__).where(
+            DailyEmployeeSummary.employee_id == employee.id, DailyEmployeeSummary.date == date
+        )
+    ).mappings().one()
+    department_row = db.session.execute(
+        select(DailyDepartmentSummary.__table__).where(
+            DailyDepartmentSummary.department == employee.department, DailyDepartmentSummary.date == date
+        )
+    ).mappings().one()
+    return dict(employee_row), dict(department_row)
+
+def _assert_matches_rebuild(employee, date):
+    incremental = _rows(employee, date)
+    rebuild_rollups()
+    db.session.commit()
+    for row, rebuilt in zip(incremental, _rows(employee, date)):
+        assert row == pytest.approx(rebuilt)
+    return incremental
+
+def test_summary_rows_follow_a_working_day(app, employee):
+    client = app.test_client()
+    day = datetime(2026, 4, 6)
+
+    _swipe(client, employee, day.replace(hour=9))
+    employee_row, department_row = _assert_matches_rebuild(employee, day.date())
+    assert employee_row['present'] == 1
+    assert employee_row['checked_out'] == 0
+    assert department_row['employees_present'] >= 1
+
+    _swipe(client, employee, day.replace(hour=12), 'break')
+    _swipe(client, employee, day.replace(hour=12, minute=30))
+    employee_row, _ = _assert_matches_rebuild(employee, day.date())
+    assert employee_row['break_count'] == 1
+    assert employee_row['break_minutes'] == pytest.approx(30)
+
+    _swipe(client, employee, day.replace(hour=17))
+    anomaly_pipeline.drain()
+    employee_row, _ = _assert_matches_rebuild(employee, day.date())
+    assert employee_row['checked_out'] == 1
+    assert employee_row['hours_worked'] == pytest.approx(7.5)
+
+def test_break_swipe_updates_summaries_in_place(app, employee):
+    client = app.test_client()
+    day = datetime(2026, 4, 7)
+    _swipe(client, employee, day.replace(hour=9))
+    _swipe(client, employee, day.replace(hour=12), 'break')
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'daily_' in statement:
+            statements.append(statement.split()[0])
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        _swipe(client, employee, day.replace(hour=12, minute=20))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    # One UPDATE of the employee-day and one of the department-day
+    assert statements == ['UPDATE', 'UPDATE']
+    _assert_matches_rebuild(employee, day.date())
+
+def test_late_flag_counts_once_per_day(app, employee):
+    client = app.test_client()
+    day = datetime(2026, 4, 8)
+    _swipe(client, employee, day.replace(hour=9))
+    anomaly_pipeline.drain()
+    employee_before, department_before = _rows(employee, day.date())
+
+    late = Config.ALERT_TYPES['LATE_ARRIVAL']
+    for minute in (5, 10):
+        db.session.add(Alert(
+            employee_id=employee.id, timestamp=day.replace(hour=9, minute=minute),
+            alert_type=late, severity='low', description='Late arrival'
+        ))
+        db.session.commit()
+
+    employee_row, department_row = _assert_matches_rebuild(employee, day.date())
+    assert employee_row['late'] == 1
+    # The department counts the employee once, however many alerts they have
+    assert department_row['late_count'] == department_before['late_count'] + 1 - employee_before['late']
+    assert employee_row['alerts_low'] == employee_before['alerts_low'] + 2
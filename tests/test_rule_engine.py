@@ -0,0 +1,20 @@
+import pytest
+
+from app.utils import rule_engine as rule_engine_module
+from app.utils.rule_engine import RuleEngine, RuleError
+
+def test_unreadable_default_rules_fail_loudly(monkeypatch, tmp_path):
+    monkeypatch.setattr(rule_engine_module, 'DEFAULT_RULES_PATH', str(tmp_path / 'missing.json'))
+    with pytest.raises(RuleError):
+        RuleEngine()
+
+def test_unreadable_rules_file_keeps_the_current_rules(tmp_path):
+    engine = RuleEngine(path=str(tmp_path / 'rules.json'))
+    rules = engine._rules
+    assert rules
+
+    # A directory where the file should be: open() raises IsADirectoryError
+    (tmp_path / 'rules.json').mkdir()
+    assert engine.reload() is False
+    assert engine._rules is rules
+    assert engine.reload_errors == 1
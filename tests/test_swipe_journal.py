@@ -0,0 +1,165 @@
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+
+from app.api.attendance import anomaly_detector, apply_swipe_event, swipe_window
+from app.models.models import Alert, AttendanceRecord, Break, JournalCheckpoint, db
+from config.config import Config
+
+def _swipe(employee, timestamp, action=None):
+    return {'rfid_tag': employee.rfid_tag, 'timestamp': timestamp.isoformat(), 'action': action}
+
+# Checkpoint rows are keyed by file name, so each test names its journal
+
+def _checkpoint(journal):
+    db.session.expire_all()
+    return db.session.get(JournalCheckpoint, journal.name).applied_seq
+
+def test_deferred_swipe_is_counted_once_when_replayed(employee, open_journal, tmp_path):
+    failures = []
+
+    def locked_twice(entry):
+        # Stages the swipe, then fails like a commit on a locked database
+        result = apply_swipe_event(entry)
+        if len(failures) < 2:
+            failures.append(entry['seq'])
+            raise OperationalError('COMMIT', {}, Exception('database is locked'))
+        return result
+
+    journal = open_journal(tmp_path / 'deferred.log', locked_twice)
+    swiped_at = datetime(2026, 3, 2, 9, 0)
+    seqs = journal.record([_swipe(employee, swiped_at)])
+
+    assert journal.apply(seqs) is None
+    assert journal.apply(seqs) is None
+    journal.apply_pending()
+
+    assert journal.stats()['pending'] == 0
+    assert _checkpoint(journal) == seqs[0]
+    assert AttendanceRecord.query.filter_by(employee_id=employee.id).count() == 1
+    assert swipe_window.count(employee.id, swiped_at) == 1
+    assert Alert.query.filter_by(
+        employee_id=employee.id, alert_type=Config.ALERT_TYPES['MULTIPLE_SWIPES']
+    ).count() == 0
+
+def test_entries_committed_before_a_deferral_keep_their_results(employee, open_journal, tmp_path):
+    failures = []
+
+    def second_entry_fails(entry):
+        result = apply_swipe_event(entry)
+        if entry['seq'] == 2:
+            # Fails the group, then the database is locked when it is retried alone
+            failures.append(entry['seq'])
+            if len(failures) == 1:
+                raise ValueError('bad group')
+            if len(failures) == 2:
+                raise OperationalError('COMMIT', {}, Exception('database is locked'))
+        return result
+
+    journal = open_journal(tmp_path / 'partial.log', second_entry_fails)
+    seqs = journal.record([
+        _swipe(employee, datetime(2026, 3, 6, 9, 0)),
+        _swipe(employee, datetime(2026, 3, 7, 9, 0))
+    ])
+
+    applied = journal.apply(seqs)
+    assert applied[seqs[0]][1] == 201
+    assert applied[seqs[1]] is None
+    assert _checkpoint(journal) == seqs[0]
+
+    journal.apply_pending()
+    assert journal.stats()['pending'] == 0
+    assert AttendanceRecord.query.filter_by(employee_id=employee.id).count() == 2
+
+def test_processes_sharing_a_journal_path_keep_their_own_checkpoints(employee, open_journal, tmp_path):
+    path = tmp_path / 'shared.log'
+    first = open_journal(path)
+    second = open_journal(path)
+
+    assert first.path == str(path)
+    assert second.path == str(tmp_path / 'shared.1.log')
+    assert first.name != second.name
+
+    first_seqs = first.record([_swipe(employee, datetime(2026, 3, 3, 9, 0))])
+    second_seqs = second.record([_swipe(employee, datetime(2026, 3, 3, 12, 0), 'break')])
+    assert first.apply(first_seqs)[first_seqs[0]][1] == 201
+    assert second.apply(second_seqs)[second_seqs[0]][1] == 200
+
+    # Both journals numbered their swipe 1; neither moved the other's checkpoint
+    assert first_seqs == second_seqs == [1]
+    assert _checkpoint(first) == 1
+    assert _checkpoint(second) == 1
+    record = AttendanceRecord.query.filter_by(employee_id=employee.id).one()
+    assert Break.query.filter_by(attendance_record_id=record.id).count() == 1
+
+def test_journal_of_a_process_that_died_is_replayed(employee, open_journal, tmp_path):
+    path = tmp_path / 'orphaned.log'
+    first = open_journal(path)
+    second = open_journal(path)
+    seqs = second.record([_swipe(employee, datetime(2026, 3, 8, 9, 0))])
+    # Both processes die; the second's swipe was journaled but not applied
+    first._close()
+    second._close()
+
+    restarted = open_journal(path)
+    assert restarted.path == str(path)
+    assert _checkpoint(second) == seqs[0]
+    assert AttendanceRecord.query.filter_by(employee_id=employee.id).count() == 1
+    assert restarted._orphans == []
+
+def test_swipe_is_applied_after_the_checkpoint_moved(employee, open_journal, tmp_path):
+    journal = open_journal(tmp_path / 'moved.log')
+    db.session.execute(
+        update(JournalCheckpoint).where(JournalCheckpoint.journal == journal.name).values(applied_seq=50)
+    )
+    db.session.commit()
+
+    seqs = journal.record([_swipe(employee, datetime(2026, 3, 4, 9, 0))])
+    assert journal.apply(seqs)[seqs[0]][1] == 201
+
+    assert journal.stats()['pending'] == 0
+    assert AttendanceRecord.query.filter_by(employee_id=employee.id).count() == 1
+
+def test_swipe_that_keeps_failing_is_rejected(employee, open_journal, tmp_path):
+    def broken(entry):
+        raise ValueError('bad entry')
+
+    journal = open_journal(tmp_path / 'rejected.log', broken)
+    seqs = journal.record([_swipe(employee, datetime(2026, 3, 5, 9, 0))])
+
+    assert journal.apply(seqs)[seqs[0]][1] == 500
+    assert journal.stats()['rejected'] == 1
+    assert journal.stats()['pending'] == 0
+    assert _checkpoint(journal) == seqs[0]
+    with open(journal.path + '.rejected') as rejected:
+        assert len(rejected.readlines()) == 1
+
+def test_check_outs_applied_together_share_one_scoring_pass(employee, open_journal, tmp_path, monkeypatch):
+    journal = open_journal(tmp_path / 'checkouts.log')
+    days = [datetime(2026, 3, day) for day in (9, 10, 11)]
+    for day in days:
+        seqs = journal.record([_swipe(employee, day.replace(hour=9))])
+        assert journal.apply(seqs)[seqs[0]][1] == 201
+
+    batches = []
+    score_batch = anomaly_detector.detect_anomalies_batch
+    def detect_anomalies_batch(records):
+        batches.append(len(records))
+        return score_batch(records)
+    def detect_anomalies(record):
+        raise AssertionError('check-out scored on its own')
+    monkeypatch.setattr(anomaly_detector, 'detect_anomalies_batch', detect_anomalies_batch)
+    monkeypatch.setattr(anomaly_detector, 'detect_anomalies', detect_anomalies)
+
+    # Concurrent requests each journal their check-out; whichever takes the
+    # apply lock first applies every entry written before its own
+    check_outs = [journal.record([_swipe(employee, day.replace(hour=17))])[0] for day in days]
+    applied = journal.apply([check_outs[-1]])
+    assert applied[check_outs[-1]][1] == 200
+    assert all(journal.apply([seq])[seq][1] == 200 for seq in check_outs[:-1])
+
+    assert batches == [3]
+    assert AttendanceRecord.query.filter(
+        AttendanceRecord.employee_id == employee.id, AttendanceRecord.time_out.isnot(None)
+    ).count() == 3